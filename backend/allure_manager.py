@@ -0,0 +1,190 @@
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import time
+import urllib.request
+
+try:
+    import psutil  # optional: orphan scan and memory figures on every OS
+except ImportError:
+    psutil = None
+
+# Config: "static" serves allure-report through the backend's /allure-report mount (no JVM at all),
+# "server" keeps ONE `allure open` process alive and reuses it for every report
+ALLURE_SERVE = os.getenv("ALLURE_SERVE", "static")
+PUBLIC_URL = os.getenv("PUBLIC_URL", "http://localhost:8000")
+STARTUP_TIMEOUT = 30
+
+PID_FILE = os.path.join(os.path.dirname(__file__), ".allure-server.pid")
+
+
+def allure_command() -> str:
+    """ALLURE_CMD, else allure on PATH (allure.cmd on Windows), else the scoop shim."""
+    return (
+        os.getenv("ALLURE_CMD")
+        or shutil.which("allure")
+        or r"C:\Users\Pramo\scoop\shims\allure.cmd"
+    )
+
+
+def _pick_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def _is_allure_server(cmdline: list[str], report_dir: str) -> bool:
+    # `allure open` / `allure serve` is a JVM running io.qameta.allure.CommandLine; only ours serve report_dir
+    text = " ".join(cmdline)
+    return "allure" in text.lower() and (" open" in text or " serve" in text) and report_dir in text
+
+
+def _cmdline(pid: int) -> list[str] | None:
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).cmdline()
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().decode(errors="replace").split("\0")
+    except OSError:
+        return None  # gone, or no way to check it on this OS
+
+
+def _rss_mb(pid: int) -> float | None:
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)  # the launcher script plus the JVM it started
+            return round(sum(p.memory_info().rss for p in [process, *process.children(recursive=True)]) / 2**20, 1)
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:  # Linux without psutil: the launcher process only
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _kill(pid: int):
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    try:
+        os.killpg(pid, signal.SIGTERM)  # started in its own session, see AllureManager.start
+    except OSError:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+class AllureManager:
+    """
+    The one place that serves Allure reports. In "static" mode the URL points at the
+    /allure-report StaticFiles mount and nothing is spawned; in "server" mode a single
+    `allure open` is started lazily, reused while alive, and its pid is remembered on disk
+    so a crashed backend's JVM is reaped at the next startup.
+    """
+
+    def __init__(self, report_dir: str, mode: str = ALLURE_SERVE, public_url: str = PUBLIC_URL, pid_file: str = PID_FILE):
+        self.report_dir = report_dir
+        self.mode = mode
+        self.public_url = public_url.rstrip("/")
+        self.pid_file = pid_file
+        self.proc: subprocess.Popen | None = None
+        self.port: int | None = None
+        self.reaped = 0
+
+    def reap_orphans(self) -> int:
+        """Kills `allure open/serve` processes of this report dir left behind by earlier backend runs. Returns how many."""
+        pids = set()
+        if os.path.exists(self.pid_file):
+            try:
+                with open(self.pid_file, "r") as f:
+                    pids.add(int(f.read().strip()))
+            except (OSError, ValueError):
+                pass
+            os.remove(self.pid_file)
+        if psutil is not None:
+            for process in psutil.process_iter(["pid", "cmdline"]):
+                try:
+                    if _is_allure_server(process.info["cmdline"] or [], self.report_dir):
+                        pids.add(process.info["pid"])
+                except psutil.Error:
+                    continue
+        if self.proc is not None:
+            pids.discard(self.proc.pid)
+
+        killed = 0
+        for pid in pids:
+            # A recorded pid may have been reused by an unrelated process since
+            if not _is_allure_server(_cmdline(pid) or [], self.report_dir):
+                continue
+            _kill(pid)
+            killed += 1
+        self.reaped += killed
+        return killed
+
+    def running(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self) -> str:
+        """Starts the shared `allure open` server unless it is already up. Returns its URL."""
+        if self.running():
+            return f"http://127.0.0.1:{self.port}"
+        self.port = _pick_free_port()
+        kwargs = {"start_new_session": True} if os.name != "nt" else {
+            "creationflags": getattr(subprocess, "CREATE_NO_WINDOW", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+        }
+        self.proc = subprocess.Popen(
+            [allure_command(), "open", "-h", "127.0.0.1", "-p", str(self.port), self.report_dir],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **kwargs,
+        )
+        with open(self.pid_file, "w") as f:
+            f.write(str(self.proc.pid))
+
+        url = f"http://127.0.0.1:{self.port}"
+        deadline = time.time() + STARTUP_TIMEOUT
+        while time.time() < deadline and self.running():
+            try:
+                urllib.request.urlopen(url, timeout=2).close()
+                break
+            except Exception:
+                time.sleep(0.5)
+        return url
+
+    def url(self) -> str:
+        """Where the frontend should open the latest report."""
+        if self.mode == "server":
+            return self.start()
+        return f"{self.public_url}/allure-report/index.html"
+
+    def stop(self):
+        if self.running():
+            _kill(self.proc.pid)
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+        if os.path.exists(self.pid_file):
+            os.remove(self.pid_file)
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "running": self.running(),
+            "pid": self.proc.pid if self.running() else None,
+            "port": self.port if self.running() else None,
+            "rss_mb": _rss_mb(self.proc.pid) if self.running() else 0.0,
+            "orphans_reaped": self.reaped,
+            "report_ready": os.path.exists(os.path.join(self.report_dir, "index.html")),
+        }
@@ -0,0 +1,320 @@
+import os
+import json
+import uuid
+import time
+import shutil
+import signal
+import socket
+import logging
+import threading
+import subprocess
+import urllib.request
+from logging.handlers import RotatingFileHandler
+
+# Config: one Appium server per device, ports handed out from these ranges
+APPIUM_BASE_PORT = int(os.getenv("APPIUM_BASE_PORT", "4723"))
+SYSTEM_PORT_RANGE = (8200, 8299)        # UiAutomator2 systemPort
+CHROMEDRIVER_PORT_RANGE = (9515, 9614)  # chromedriverPort for webviews
+STARTUP_TIMEOUT = 60
+HEALTH_INTERVAL = float(os.getenv("APPIUM_HEALTH_INTERVAL", "10"))
+HEALTH_TIMEOUT = 3
+# A server that fails this many /status probes in a row is considered hung and restarted
+MAX_FAILED_PROBES = 3
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+
+APPIUM_LOG_DIR = os.path.join(os.path.dirname(__file__), "appium_logs")
+
+
+class PoolError(Exception):
+    """Raised when no Appium server can be started or leased."""
+
+
+def connected_devices() -> list[str]:
+    """Serials of devices in the `device` state (empty when adb is missing)."""
+    try:
+        result = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=5)
+    except Exception:
+        return []
+    serials = []
+    for line in result.stdout.strip().splitlines()[1:]:  # skip header
+        parts = line.split("\t")
+        if len(parts) == 2 and parts[1].strip() == "device":
+            serials.append(parts[0].strip())
+    return serials
+
+
+def _port_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        return s.connect_ex(("127.0.0.1", port)) != 0
+
+
+def probe(port: int, timeout: float = HEALTH_TIMEOUT) -> bool:
+    """True when GET /status of the Appium server on `port` answers ready."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/status", timeout=timeout) as response:
+            value = json.loads(response.read() or b"{}").get("value") or {}
+            return response.status == 200 and value.get("ready", True) is not False
+    except Exception:
+        return False
+
+
+def kill_tree(proc: subprocess.Popen, timeout: float = 10):
+    """
+    Stops a server and everything it spawned. Appium runs node (and adb / chromedriver children),
+    so on Linux/macOS the whole process group goes, on Windows the taskkill tree.
+    """
+    if proc.poll() is not None:
+        return
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+class AppiumServer:
+    """One managed `appium` process bound to a device (udid None = no default device)."""
+
+    def __init__(self, udid: str | None, port: int, system_port: int, chromedriver_port: int, log_dir: str):
+        self.udid = udid
+        self.port = port
+        self.system_port = system_port
+        self.chromedriver_port = chromedriver_port
+        self.log_path = os.path.join(log_dir, f"appium-{(udid or 'default').replace(':', '_')}-{port}.log")
+        self.proc: subprocess.Popen | None = None
+        self.state = "stopped"  # starting | healthy | unhealthy | stopped
+        self.wanted = False  # False after stop(): the monitor leaves it alone
+        self.failed_probes = 0
+        self.restarts = 0
+        self.started_at = None
+        self.lease_id: str | None = None
+        self.leased_at = None
+        self.logger = logging.getLogger(f"appium.{self.udid or 'default'}.{port}")
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            os.makedirs(log_dir, exist_ok=True)
+            handler = RotatingFileHandler(self.log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def command(self) -> list[str]:
+        # No shell: on Windows `appium` is appium.cmd, which shutil.which resolves through PATHEXT
+        appium = shutil.which("appium") or "appium"
+        caps = {"appium:systemPort": self.system_port, "appium:chromedriverPort": self.chromedriver_port}
+        if self.udid:
+            caps["appium:udid"] = self.udid
+        return [appium, "-p", str(self.port), "--log-no-colors", "--default-capabilities", json.dumps(caps)]
+
+    def start(self, timeout: float = STARTUP_TIMEOUT):
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True  # own process group, see kill_tree
+        self.proc = subprocess.Popen(
+            self.command(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            **kwargs,
+        )
+        threading.Thread(target=self._pump_log, args=(self.proc,), daemon=True).start()
+        self.wanted = True
+        self.state = "starting"
+        self.started_at = time.time()
+        self.failed_probes = 0
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                self.state = "stopped"
+                raise PoolError(f"Appium on port {self.port} exited with {self.proc.returncode}, see {self.log_path}")
+            if probe(self.port):
+                self.state = "healthy"
+                return
+            time.sleep(0.5)
+        self.state = "unhealthy"
+        raise PoolError(f"Appium on port {self.port} did not answer /status within {timeout}s")
+
+    def _pump_log(self, proc):
+        for line in proc.stdout:
+            self.logger.info(line.rstrip("\n"))
+
+    def stop(self):
+        self.wanted = False
+        if self.proc is not None:
+            kill_tree(self.proc)
+        self.state = "stopped"
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.logger.info(f"--- restart #{self.restarts} ---")
+        self.start()
+
+    def check(self) -> bool:
+        """One health probe; returns True when the server needs a restart."""
+        if self.proc is None or not self.wanted or self.state == "starting":
+            return False
+        if self.proc.poll() is not None:
+            return True  # crashed (or a restart attempt failed): try again
+        if probe(self.port):
+            self.failed_probes = 0
+            self.state = "healthy"
+            return False
+        self.failed_probes += 1
+        self.state = "unhealthy"
+        return self.failed_probes >= MAX_FAILED_PROBES
+
+    def info(self) -> dict:
+        return {
+            "udid": self.udid,
+            "url": self.url,
+            "port": self.port,
+            "system_port": self.system_port,
+            "chromedriver_port": self.chromedriver_port,
+            "state": self.state,
+            "pid": self.proc.pid if self.proc is not None and self.proc.poll() is None else None,
+            "restarts": self.restarts,
+            "leased": self.lease_id is not None,
+            "lease_id": self.lease_id,
+            "log": self.log_path,
+        }
+
+
+class AppiumPool:
+    """
+    Appium servers keyed by device serial, with a background health monitor and a lease API:
+    lease() hands out a healthy, unleased server (starting one on demand), release() returns it.
+    """
+
+    def __init__(self, base_port: int = APPIUM_BASE_PORT, log_dir: str = APPIUM_LOG_DIR):
+        self.base_port = base_port
+        self.log_dir = log_dir
+        self.servers: dict[str | None, AppiumServer] = {}
+        self.lock = threading.RLock()
+        self.freed = threading.Condition(self.lock)
+        self._monitor: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def _allocate(self, used_attr: str, start: int, end: int | None = None) -> int:
+        used = {getattr(s, used_attr) for s in self.servers.values()}
+        port = start
+        while port in used or not _port_free(port):
+            port += 1
+            if end is not None and port > end:
+                raise PoolError(f"No free port left in {start}-{end}")
+        return port
+
+    def ensure(self, udids: list[str | None]) -> list[dict]:
+        """Starts a server for every device that has none (or a stopped one). Returns the pool."""
+        for udid in udids:
+            with self.lock:
+                server = self.servers.get(udid)
+                if server is None:
+                    server = AppiumServer(
+                        udid,
+                        self._allocate("port", self.base_port),
+                        self._allocate("system_port", *SYSTEM_PORT_RANGE),
+                        self._allocate("chromedriver_port", *CHROMEDRIVER_PORT_RANGE),
+                        self.log_dir,
+                    )
+                    self.servers[udid] = server
+                needs_start = server.state == "stopped"
+                if needs_start:
+                    server.state = "starting"  # claimed, so a concurrent ensure() does not start it twice
+            if needs_start:
+                try:
+                    server.start()
+                except Exception:  # PoolError, or appium not installed at all
+                    server.stop()
+                    raise
+        return self.status()
+
+    def lease(self, udid: str | None = None, timeout: float = 30) -> dict:
+        """
+        Leases a healthy server for `udid` (any device when None), starting it if the device has none.
+        Waits up to `timeout` seconds for a leased one to be released.
+        """
+        deadline = time.time() + timeout
+        with self.lock:
+            missing = not any(udid is None or s.udid == udid for s in self.servers.values())
+        if missing:
+            # Started outside the lock: status() and release() stay responsive meanwhile
+            self.ensure([udid if udid is not None else (connected_devices() or [None])[0]])
+        with self.lock:
+            while True:
+                for server in self.servers.values():
+                    if (udid is None or server.udid == udid) and server.state == "healthy" and server.lease_id is None:
+                        server.lease_id = uuid.uuid4().hex
+                        server.leased_at = time.time()
+                        return server.info()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolError(f"No free Appium server for {udid or 'any device'} within {timeout}s")
+                self.freed.wait(min(remaining, 1.0))
+
+    def release(self, lease_id: str) -> bool:
+        with self.lock:
+            for server in self.servers.values():
+                if server.lease_id == lease_id:
+                    server.lease_id = None
+                    server.leased_at = None
+                    self.freed.notify_all()
+                    return True
+        return False
+
+    def stop(self, udid: str | None):
+        with self.lock:
+            server = self.servers.pop(udid, None)
+            self.freed.notify_all()
+        if server is not None:
+            server.stop()
+
+    def stop_all(self):
+        for udid in list(self.servers):
+            self.stop(udid)
+
+    def status(self) -> list[dict]:
+        with self.lock:
+            return [server.info() for server in self.servers.values()]
+
+    def start_monitor(self, interval: float = HEALTH_INTERVAL):
+        if self._monitor is not None and self._monitor.is_alive():
+            return
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self._monitor.start()
+
+    def stop_monitor(self):
+        self._stop.set()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            for server in list(self.servers.values()):
+                try:
+                    if server.check():
+                        print(f"🔁 Appium on port {server.port} ({server.udid or 'default'}) is not responding, restarting...")
+                        server.restart()
+                        with self.lock:
+                            self.freed.notify_all()
+                except Exception as e:
+                    print(f"⚠️ Appium health check failed for port {server.port}: {e}")
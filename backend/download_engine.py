@@ -0,0 +1,393 @@
+import os
+import re
+import json
+import time
+import hashlib
+import zipfile
+import threading
+import http.client
+import urllib.request
+import urllib.error
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
+
+# Config: transfer tuning
+CHUNK_SIZE = 256 * 1024
+CONNECT_TIMEOUT = 30
+MAX_RETRIES = 5
+# Files bigger than this are split across several connections (if the server supports ranges)
+PARALLEL_THRESHOLD = 32 * 1024 * 1024
+DEFAULT_CONNECTIONS = 4
+
+# Every APK is a ZIP archive: local file header at the start, End Of Central Directory near the end
+ZIP_LOCAL_HEADER = b"PK\x03\x04"
+ZIP_EOCD = b"PK\x05\x06"
+
+USER_AGENT = "Mozilla/5.0 (test-automation-platform apk downloader)"
+
+
+class DownloadError(Exception):
+    """Raised when the remote file cannot be fetched."""
+
+
+class IntegrityError(DownloadError):
+    """Raised when the downloaded bytes are not a valid APK/ZIP archive."""
+
+
+class UnsupportedLinkError(DownloadError):
+    """Raised when the link serves a web page (confirmation page, link not shared) instead of the file."""
+
+
+class NetworkError(DownloadError):
+    """Raised when the server cannot be reached; retried by the download loops."""
+
+
+# Everything a flaky connection can raise mid-transfer (IncompleteRead is no OSError)
+RETRYABLE_ERRORS = (OSError, urllib.error.URLError, http.client.HTTPException, NetworkError)
+
+
+def _request(url: str, start: int | None = None, end: int | None = None, if_range: str | None = None):
+    headers = {"User-Agent": USER_AGENT}
+    if start is not None:
+        headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        if if_range:
+            headers["If-Range"] = if_range
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        return urllib.request.urlopen(req, timeout=CONNECT_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 416:
+            # Range not satisfiable: the part file is already complete (or bigger than remote)
+            return e
+        raise DownloadError(f"HTTP {e.code} while downloading: {e.reason}")
+    except urllib.error.URLError as e:
+        raise NetworkError(f"Network error: {e.reason}")
+
+
+def _filename_from_headers(headers) -> str | None:
+    disposition = headers.get("Content-Disposition") or ""
+    # RFC 5987 form first: filename*=UTF-8''My%20App.apk
+    match = re.search(r"filename\*\s*=\s*[^']*''([^;]+)", disposition, re.IGNORECASE)
+    if match:
+        return os.path.basename(unquote(match.group(1).strip().strip('"')))
+    match = re.search(r'filename\s*=\s*"?([^";]+)"?', disposition, re.IGNORECASE)
+    if match:
+        return os.path.basename(match.group(1).strip())
+    return None
+
+
+def _validator_of(headers) -> str | None:
+    """ETag (or Last-Modified) used with If-Range so a changed remote file restarts the download."""
+    return headers.get("ETag") or headers.get("Last-Modified")
+
+
+def probe(url: str) -> dict:
+    """
+    Asks the server for the first byte only, to learn the size, filename and range support.
+    Returns: { "total": int | None, "ranges": bool, "filename": str | None, "validator": str | None }
+    """
+    resp = _request(url, start=0, end=0)
+    try:
+        headers = resp.headers
+        content_type = (headers.get("Content-Type") or "").lower()
+        if "text/html" in content_type:
+            raise UnsupportedLinkError(
+                "Server returned an HTML page instead of a file "
+                "(link not shared publicly, quota exceeded or confirmation page)."
+            )
+
+        total = None
+        ranges = False
+        content_range = headers.get("Content-Range") or ""
+        match = re.match(r"bytes\s+\d+-\d+/(\d+)", content_range)
+        if getattr(resp, "status", None) == 206 and match:
+            total = int(match.group(1))
+            ranges = True
+        elif headers.get("Content-Length"):
+            total = int(headers["Content-Length"])
+
+        return {
+            "total": total,
+            "ranges": ranges,
+            "filename": _filename_from_headers(headers),
+            "validator": _validator_of(headers),
+        }
+    finally:
+        resp.close()
+
+
+class ZipSniffer:
+    """
+    Checks the stream on the fly: the very first bytes must be a ZIP local file header,
+    so an HTML error page is rejected after one chunk instead of after the full download.
+    """
+
+    def __init__(self):
+        self.head = b""
+        self.checked = False
+
+    def feed(self, data: bytes):
+        if self.checked:
+            return
+        self.head += data[: len(ZIP_LOCAL_HEADER) - len(self.head)]
+        if len(self.head) >= len(ZIP_LOCAL_HEADER):
+            self.checked = True
+            if self.head != ZIP_LOCAL_HEADER:
+                raise IntegrityError("Downloaded data is not an APK (missing ZIP signature).")
+
+
+def verify_apk(path: str, check_crc: bool = True) -> None:
+    """
+    Verifies that `path` is a complete APK:
+    ZIP signature at the start, End Of Central Directory at the end,
+    an AndroidManifest.xml entry and (optionally) CRCs of every entry.
+    Raises IntegrityError on failure.
+    """
+    size = os.path.getsize(path)
+    if size < 22:
+        raise IntegrityError("File is too small to be an APK.")
+
+    with open(path, "rb") as f:
+        if f.read(4) != ZIP_LOCAL_HEADER:
+            raise IntegrityError("Missing ZIP local header signature (likely an HTML error page).")
+        # EOCD is 22 bytes + optional comment (max 64KB)
+        tail_len = min(size, 22 + 65535)
+        f.seek(size - tail_len)
+        if ZIP_EOCD not in f.read(tail_len):
+            raise IntegrityError("Missing End Of Central Directory (file is truncated).")
+
+    try:
+        with zipfile.ZipFile(path) as zf:
+            if "AndroidManifest.xml" not in zf.namelist():
+                raise IntegrityError("Archive has no AndroidManifest.xml (not an APK).")
+            if check_crc:
+                bad = zf.testzip()
+                if bad:
+                    raise IntegrityError(f"CRC mismatch in entry: {bad}")
+    except zipfile.BadZipFile as e:
+        raise IntegrityError(f"Corrupt archive: {e}")
+
+
+class _State:
+    """Small JSON sidecar next to the .part file so an interrupted download can resume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+
+    def save(self):
+        with self.lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _Progress:
+    def __init__(self, total, done, callback):
+        self.total = total
+        self.done = done
+        self.callback = callback
+        self.lock = threading.Lock()
+
+    def add(self, n):
+        with self.lock:
+            self.done += n
+            done = self.done
+        if self.callback:
+            self.callback(done, self.total)
+
+
+def _check_stop(stop_event):
+    if stop_event is not None and stop_event.is_set():
+        raise DownloadError("Download cancelled.")
+
+
+def _download_single(url, part_path, info, progress, resumable, stop_event):
+    """One connection, resuming from the current size of the part file when the server allows it."""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if not info["ranges"] or not resumable:
+        offset = 0
+
+    for attempt in range(MAX_RETRIES):
+        _check_stop(stop_event)
+        sniffer = ZipSniffer()
+        resp = None
+        try:
+            if offset == 0:
+                resp = _request(url)
+            else:
+                resp = _request(url, start=offset, if_range=info["validator"])
+                if getattr(resp, "code", None) == 416:
+                    return
+                if getattr(resp, "status", None) != 206:
+                    # Server ignored the range (or the file changed): start over
+                    offset = 0
+                else:
+                    # Resuming: the header was already validated by the first attempt
+                    sniffer.checked = True
+            progress.done = offset
+            with open(part_path, "r+b" if offset else "wb") as f:
+                f.seek(offset)
+                while True:
+                    _check_stop(stop_event)
+                    data = resp.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    sniffer.feed(data)
+                    f.write(data)
+                    offset += len(data)
+                    progress.add(len(data))
+            if info["total"] is not None and offset < info["total"]:
+                raise ConnectionError(f"stream ended at byte {offset} of {info['total']}")
+            return
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES - 1:
+                raise DownloadError(f"Connection lost too many times: {e}")
+            time.sleep(min(2 ** attempt, 10))
+        finally:
+            if resp is not None:
+                resp.close()
+
+
+def _download_segment(url, part_path, seg, info, progress, state, stop_event):
+    """Downloads one byte range [start, end] into its slot of the preallocated part file."""
+    for attempt in range(MAX_RETRIES):
+        _check_stop(stop_event)
+        pos = seg["start"] + seg["done"]
+        if pos > seg["end"]:
+            return
+        resp = None
+        try:
+            resp = _request(url, start=pos, end=seg["end"], if_range=info["validator"])
+            if getattr(resp, "status", None) != 206:
+                raise DownloadError("Server stopped honouring range requests.")
+            sniffer = ZipSniffer()
+            if pos != 0:
+                sniffer.checked = True
+            with open(part_path, "r+b") as f:
+                f.seek(pos)
+                while True:
+                    _check_stop(stop_event)
+                    data = resp.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    sniffer.feed(data)
+                    f.write(data)
+                    seg["done"] += len(data)
+                    progress.add(len(data))
+            if seg["start"] + seg["done"] <= seg["end"]:
+                raise ConnectionError(f"segment ended at byte {seg['start'] + seg['done']}")
+            state.save()
+            return
+        except RETRYABLE_ERRORS as e:
+            state.save()
+            if attempt == MAX_RETRIES - 1:
+                raise DownloadError(f"Segment {seg['start']}-{seg['end']} failed: {e}")
+            time.sleep(min(2 ** attempt, 10))
+        finally:
+            if resp is not None:
+                resp.close()
+
+
+def _download_parallel(url, part_path, info, connections, progress, state, stop_event):
+    total = info["total"]
+    segments = state.data.get("segments")
+    if state.data.get("validator") != info["validator"] or not segments or not os.path.exists(part_path):
+        step = -(-total // connections)
+        segments = [
+            {"start": start, "end": min(start + step, total) - 1, "done": 0}
+            for start in range(0, total, step)
+        ]
+        with open(part_path, "wb") as f:
+            f.truncate(total)
+    state.data["segments"] = segments
+    state.data["validator"] = info["validator"]
+    state.save()
+
+    progress.done = sum(seg["done"] for seg in segments)
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        futures = [
+            pool.submit(_download_segment, url, part_path, seg, info, progress, state, stop_event)
+            for seg in segments
+        ]
+        for future in futures:
+            future.result()
+
+
+def download_file(
+    url: str,
+    dest_dir: str,
+    filename: str | None = None,
+    connections: int = DEFAULT_CONNECTIONS,
+    progress_callback=None,
+    stop_event: threading.Event | None = None,
+    verify: bool = True,
+) -> str:
+    """
+    Downloads `url` into `dest_dir` through a `.part` file and atomically renames it when complete.
+
+    - Resumes an interrupted download with HTTP range requests (state kept in `<part>.json`).
+    - Uses `connections` parallel range requests for files above PARALLEL_THRESHOLD.
+    - Rejects non-ZIP data on the first chunk and verifies the finished archive before renaming.
+
+    progress_callback(done_bytes, total_bytes_or_None) is called from the download threads.
+    Returns: The ABSOLUTE path of the finished file.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+
+    info = probe(url)
+    name = filename or info["filename"] or os.path.basename(url.split("?")[0]) or "download.apk"
+    if not filename and not name.lower().endswith(".apk"):
+        name += ".apk"  # Drive's /download URLs end in "download"; /api/apk-list only lists *.apk
+
+    # The part file is keyed by URL (not by name) so a restarted process finds its previous bytes
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    part_path = os.path.join(dest_dir, f".{key}.part")
+    state = _State(part_path + ".json")
+    final_path = os.path.join(dest_dir, name)
+
+    progress = _Progress(info["total"], 0, progress_callback)
+
+    parallel = (
+        info["ranges"]
+        and info["total"] is not None
+        and info["total"] >= PARALLEL_THRESHOLD
+        and connections > 1
+    )
+    if parallel:
+        _download_parallel(url, part_path, info, connections, progress, state, stop_event)
+    else:
+        # Bytes from an older version of the remote file must not be resumed
+        resumable = "segments" not in state.data and state.data.get("validator") == info["validator"]
+        state.data = {"validator": info["validator"]}
+        state.save()
+        _download_single(url, part_path, info, progress, resumable, stop_event)
+
+    size = os.path.getsize(part_path)
+    if info["total"] is not None and size != info["total"]:
+        raise DownloadError(f"Size mismatch: got {size} bytes, expected {info['total']}.")
+
+    if verify:
+        try:
+            verify_apk(part_path)
+        except IntegrityError:
+            # Corrupt bytes are useless for resuming: drop them
+            os.remove(part_path)
+            state.remove()
+            raise
+
+    os.replace(part_path, final_path)
+    state.remove()
+    return os.path.abspath(final_path)
@@ -0,0 +1,154 @@
+import os
+import json
+import uuid
+import time
+import bisect
+from collections import deque, OrderedDict
+
+# Config: events kept in memory per run, runs kept in memory, spill files kept on disk
+EVENT_LOG_SIZE = int(os.getenv("EVENT_LOG_SIZE", "5000"))
+EVENT_LOG_RUNS = int(os.getenv("EVENT_LOG_RUNS", "3"))
+EVENT_LOG_KEEP_FILES = int(os.getenv("EVENT_LOG_KEEP_FILES", "20"))
+# Upper bound of events in one CATCH_UP frame (the newest ones win)
+MAX_CATCH_UP = int(os.getenv("EVENT_LOG_MAX_CATCH_UP", "10000"))
+
+EVENT_LOG_DIR = os.path.join(os.path.dirname(__file__), "event_logs")
+
+
+class RunLog:
+    """
+    Events of one run, numbered 1, 2, 3... The newest EVENT_LOG_SIZE stay in a ring buffer;
+    older ones are appended to <EVENT_LOG_DIR>/<run_id>.jsonl as they fall out of it
+    (in chunks of a tenth of the ring, so the file is not touched on every event). The byte offset
+    of every chunk is kept, so since() reads the file from the chunk it needs, not from the start.
+    """
+
+    def __init__(self, run_id: str, size: int = EVENT_LOG_SIZE, log_dir: str = EVENT_LOG_DIR):
+        self.run_id = run_id
+        self.ring: deque[dict] = deque()
+        self.size = size
+        self.chunk = max(1, size // 10)
+        self.last_seq = 0
+        self.spilled = 0
+        self.spill_path = os.path.join(log_dir, f"{run_id}.jsonl")
+        self._spill_file = None
+        self._chunks: list[tuple[int, int]] = []  # (first seq, byte offset) of every spilled chunk
+
+    def append(self, message: dict) -> dict:
+        self.last_seq += 1
+        event = {**message, "run_id": self.run_id, "seq": self.last_seq}
+        self.ring.append(event)
+        if len(self.ring) >= self.size + self.chunk:
+            self._spill([self.ring.popleft() for _ in range(self.chunk)])
+        return event
+
+    def _spill(self, events):
+        if self._spill_file is None:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            self._spill_file = open(self.spill_path, "ab")
+        events = list(events)
+        self._chunks.append((events[0]["seq"], self._spill_file.tell()))
+        self._spill_file.write(b"".join(json.dumps(e, separators=(",", ":")).encode("utf-8") + b"\n" for e in events))
+        self._spill_file.flush()
+        self.spilled += len(events)
+
+    def evict(self):
+        """Moves the whole ring to disk (the run leaves memory); since() keeps working from the file."""
+        if self.ring:
+            self._spill(self.ring)
+            self.ring.clear()
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def since(self, last_seq: int, limit: int = MAX_CATCH_UP) -> tuple[list[dict], bool]:
+        """Events with seq > last_seq (oldest first) and whether older ones were cut off by `limit`."""
+        first_in_ring = self.ring[0]["seq"] if self.ring else self.last_seq + 1
+        events = []
+        if last_seq + 1 < first_in_ring and self.spilled:
+            # Only the tail that fits in `limit` is parsed: reading starts at the chunk holding wanted_from
+            wanted_from = max(last_seq + 1, self.last_seq - limit + 1)
+            index = bisect.bisect_right(self._chunks, (wanted_from, float("inf"))) - 1
+            with open(self.spill_path, "rb") as f:
+                f.seek(self._chunks[max(index, 0)][1])
+                for line in f:
+                    event = json.loads(line)
+                    if event["seq"] >= wanted_from:
+                        events.append(event)
+        events += [event for event in self.ring if event["seq"] > last_seq]
+        truncated = len(events) > limit or (events and events[0]["seq"] > last_seq + 1)
+        return events[-limit:], bool(truncated)
+
+
+class EventLog:
+    """
+    Per-run event history for late-joining WebSocket clients: every broadcast gets a run_id and seq,
+    and a client that resumes with its last seq receives the gap in one CATCH_UP frame.
+    """
+
+    def __init__(self, log_dir: str = EVENT_LOG_DIR, size: int = EVENT_LOG_SIZE, runs: int = EVENT_LOG_RUNS):
+        self.log_dir = log_dir
+        self.size = size
+        self.max_runs = runs
+        self.runs: OrderedDict[str, RunLog] = OrderedDict()
+        self.current: RunLog | None = None
+
+    def start_run(self, run_id: str | None = None) -> str:
+        run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.current = RunLog(run_id, self.size, self.log_dir)
+        self.runs[run_id] = self.current
+        while len(self.runs) > self.max_runs:
+            _, oldest = self.runs.popitem(last=False)
+            oldest.evict()
+        self._prune_files()
+        return run_id
+
+    def append(self, message: dict) -> dict:
+        """Numbers a broadcast message. Messages before the first run start an implicit one."""
+        payload = message.get("payload")
+        run_id = message.get("run_id") or (payload.get("run_id") if isinstance(payload, dict) else None)
+        run = self.runs.get(run_id) or self.current
+        if run is None:
+            self.start_run()
+            run = self.current
+        return run.append(message)
+
+    def catch_up(self, run_id: str | None, last_seq: int = 0) -> dict:
+        """
+        CATCH_UP frame for a client resuming `run_id` after `last_seq`. A client that asks for an
+        unknown or older run (or none) gets the current run from the start.
+        """
+        run = self.runs.get(run_id) if run_id else None
+        if run is None or (run is not self.current and self.current is not None):
+            run, last_seq = self.current, 0
+        if run is None:
+            return {"type": "CATCH_UP", "payload": {"run_id": None, "events": [], "last_seq": 0, "truncated": False}}
+        events, truncated = run.since(max(0, int(last_seq or 0)))
+        return {
+            "type": "CATCH_UP",
+            "payload": {"run_id": run.run_id, "events": events, "last_seq": run.last_seq, "truncated": truncated},
+        }
+
+    def _prune_files(self):
+        if not os.path.isdir(self.log_dir):
+            return
+        files = sorted(
+            (os.path.join(self.log_dir, name) for name in os.listdir(self.log_dir) if name.endswith(".jsonl")),
+            key=os.path.getmtime,
+        )
+        in_use = {run.spill_path for run in self.runs.values()}
+        for path in files[:-EVENT_LOG_KEEP_FILES] if EVENT_LOG_KEEP_FILES else []:
+            if path not in in_use:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            "current_run": self.current.run_id if self.current else None,
+            "runs": {
+                run_id: {"last_seq": run.last_seq, "in_memory": len(run.ring), "spilled": run.spilled}
+                for run_id, run in self.runs.items()
+            },
+        }
@@ -1,9 +1,16 @@
 import os
+import re
 import gdown
 import uuid
-import shutil
 import sys
+import json
+import time
+import threading
+import zipfile
+import hashlib
+import xml.etree.ElementTree as ET
 from androguard.core.apk import APK
+from download_engine import download_file, verify_apk, IntegrityError, UnsupportedLinkError
 
 # Base directory of the backend package (this file)
 BASE_DIR = os.path.dirname(__file__)
@@ -12,19 +19,80 @@ BASE_DIR = os.path.dirname(__file__)
 DOWNLOAD_DIR = os.path.join(BASE_DIR, "temp_apks")
 # Config for where to save extracted icons
 ICON_DIR = os.path.join(BASE_DIR, "static", "icons")
+# Config: Build history used by the test runner's impact analysis (one list of builds per package)
+APK_INDEX_PATH = os.path.join(DOWNLOAD_DIR, "apk_index.json")
+# Keep the last N builds per package in the index
+APK_INDEX_KEEP = 10
 
-# --- Helper Class to Capture STDERR (for tqdm progress) ---
-class ProgressCapture:
-    def __init__(self, callback):
+# Config: Max progress events per second sent to the callback (override with APK_PROGRESS_HZ)
+PROGRESS_HZ = float(os.getenv("APK_PROGRESS_HZ", "4"))
+
+# --- Helper Class to turn raw byte counts into throttled, structured progress events ---
+class ProgressReporter:
+    """
+    Receives (done, total) byte counts from the download threads and calls
+    callback(event) at most `hz` times per second with:
+    { "bytes": int, "total": int | None, "percent": float | None, "rate": bytes/s, "eta": seconds | None }
+    The final 100% event is always delivered.
+    """
+    def __init__(self, callback, hz: float = PROGRESS_HZ):
         self.callback = callback
+        self.interval = 1.0 / hz if hz > 0 else 0.0
+        self.started = time.monotonic()
+        self.last_emit = 0.0
+        self.first_bytes = 0
+        self.last_bytes = None
+        self.last_time = None
+        self.rate = 0.0
+        # Parallel downloads report from several threads
+        self.lock = threading.Lock()
+
+    def _update_rate(self, done, now):
+        if self.last_bytes is None:
+            # First report: a resumed download starts from its existing bytes
+            self.first_bytes = done
+            self.last_bytes, self.last_time = done, now
+            return
+        elapsed = now - self.last_time
+        if elapsed >= 0.5:
+            sample = (done - self.last_bytes) / elapsed
+            # Exponential moving average keeps the ETA from jumping around
+            self.rate = sample if self.rate == 0 else 0.3 * sample + 0.7 * self.rate
+            self.last_bytes, self.last_time = done, now
+
+    def __call__(self, done: int, total: int | None):
+        with self.lock:
+            now = time.monotonic()
+            self._update_rate(done, now)
+            finished = total is not None and done >= total
+            if not finished and now - self.last_emit < self.interval:
+                return
+            self.last_emit = now
 
-    def write(self, message):
-        # Only send non-empty messages
-        if message and message.strip():
-            self.callback(message)
+            if self.rate == 0 and now > self.started:
+                self.rate = (done - self.first_bytes) / (now - self.started)
+            eta = None
+            if total and self.rate > 0:
+                eta = round(max(total - done, 0) / self.rate, 1)
+            event = {
+                "bytes": done,
+                "total": total,
+                "percent": round(done * 100 / total, 1) if total else None,
+                "rate": round(self.rate),
+                "eta": eta,
+            }
+        self.callback(event)
 
-    def flush(self):
-        pass
+def format_progress(event: dict) -> str:
+    """Human readable one-liner for a progress event (used by the UI log console)."""
+    done_mb = event["bytes"] / (1024 * 1024)
+    rate_mb = (event.get("rate") or 0) / (1024 * 1024)
+    if not event.get("total"):
+        return f"{done_mb:.1f}MB downloaded ({rate_mb:.1f}MB/s)"
+    text = f"{event['percent']:.0f}% {done_mb:.1f}MB/{event['total'] / (1024 * 1024):.1f}MB ({rate_mb:.1f}MB/s)"
+    if event.get("eta") is not None:
+        text += f" ETA {event['eta']:.0f}s"
+    return text
 
 def extract_app_icon(apk_path: str) -> str:
     """
@@ -71,22 +139,149 @@ def extract_app_icon(apk_path: str) -> str:
 def get_apk_info(apk_path: str) -> dict | None:
     """
     Returns basic metadata from the APK:
-    { "app_name": str, "package_name": str }
+    { "app_name": str, "package_name": str, "permissions": [str] }
     """
     try:
         app = APK(apk_path)
         return {
             "app_name": app.get_app_name(),
             "package_name": app.get_package(),
+            "permissions": sorted(app.get_permissions()),
         }
     except Exception as e:
         print(f"❌ Failed to read APK info: {e}")
         return None
     
-def download_apk(gdrive_url: str, progress_callback=None) -> str:
+def _direct_download_url(gdrive_url: str) -> str:
+    """
+    Turns any Google Drive share link (/file/d/<id>/view, open?id=<id>, uc?id=<id>)
+    into a direct download URL that skips the "can't scan for viruses" confirmation page.
+    Non-Drive URLs are returned unchanged.
+    """
+    match = re.search(r"/d/([a-zA-Z0-9_-]{10,})", gdrive_url) or re.search(r"[?&]id=([a-zA-Z0-9_-]{10,})", gdrive_url)
+    if "google.com" not in gdrive_url or not match:
+        return gdrive_url
+    return f"https://drive.usercontent.google.com/download?id={match.group(1)}&export=download&confirm=t"
+
+def _download_with_gdown(gdrive_url: str) -> str:
+    """
+    Fallback for links the direct engine cannot handle: gdown writes straight into DOWNLOAD_DIR.
+    gdown only reports progress through tqdm on stderr, so no progress events are emitted here.
+    """
+    tmp_path = gdown.download(
+        gdrive_url,
+        output=DOWNLOAD_DIR + os.sep,
+        quiet=True,
+        fuzzy=True,
+        resume=True,
+    )
+
+    if not tmp_path or not os.path.exists(tmp_path):
+        raise Exception("Download failed - gdown returned no path.")
+    return tmp_path
+
+def _bundle_strings(data: bytes) -> set[str]:
+    """
+    UI strings of a React Native bundle: quoted literals of a plain JS bundle,
+    or printable runs for a Hermes bytecode bundle.
+    """
+    try:
+        text = data.decode("utf-8")
+        return {m.group(2) for m in re.finditer(r"([\"'])([^\"'\\\n]{1,80})\1", text)}
+    except UnicodeDecodeError:
+        return {m.group(0).decode("ascii") for m in re.finditer(rb"[\x20-\x7e]{3,80}", data)}
+
+def build_apk_fingerprint(apk_path: str) -> dict:
+    """
+    Collects what UI locators depend on, so two builds can be diffed cheaply:
+    activities, layout file CRCs, resource id names and UI strings (resources + JS bundle).
+    """
+    app = APK(apk_path)
+    fingerprint = {
+        "package": app.get_package(),
+        "version_code": str(app.get_androidversion_code()),
+        "version_name": app.get_androidversion_name(),
+        "activities": sorted(app.get_activities()),
+        "layouts": {},
+        "resource_ids": [],
+        "strings": [],
+    }
+
+    strings = set()
+    with zipfile.ZipFile(apk_path) as zf:
+        for entry in zf.infolist():
+            if entry.filename.startswith("res/layout"):
+                fingerprint["layouts"][entry.filename] = entry.CRC
+            elif entry.filename.startswith("assets/") and entry.filename.endswith(".bundle"):
+                strings |= _bundle_strings(zf.read(entry.filename))
+
+    try:
+        arsc = app.get_android_resources()
+        package = fingerprint["package"]
+        for node in ET.fromstring(arsc.get_strings_resources()).iter("string"):
+            if node.text:
+                strings.add(node.text)
+        for node in ET.fromstring(arsc.get_id_resources(package)).iter("item"):
+            if node.get("name"):
+                fingerprint["resource_ids"].append(f"{package}:id/{node.get('name')}")
+    except Exception as e:
+        print(f"⚠️ Could not read resources table: {e}")
+
+    fingerprint["resource_ids"].sort()
+    fingerprint["strings"] = sorted(strings)
+    return fingerprint
+
+def record_apk_build(apk_path: str, index_path: str = APK_INDEX_PATH) -> dict | None:
+    """
+    Adds the APK to the build index (newest last), so the next run can diff against it.
+    Re-recording an APK that is already indexed (same sha256) just moves it to the end.
+    Returns: The index entry, or None if the APK could not be parsed.
+    """
+    try:
+        digest = hashlib.sha256()
+        with open(apk_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+
+        try:
+            with open(index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+
+        builds = [b for entries in index.values() for b in entries if b["sha256"] == sha256]
+        if builds:
+            entry = builds[0]
+        else:
+            entry = {
+                "apk": os.path.basename(apk_path),
+                "sha256": sha256,
+                "fingerprint": build_apk_fingerprint(apk_path),
+            }
+        entry["recorded_at"] = time.time()
+
+        package = entry["fingerprint"]["package"]
+        history = [b for b in index.get(package, []) if b["sha256"] != sha256]
+        index[package] = (history + [entry])[-APK_INDEX_KEEP:]
+
+        tmp = index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, index_path)
+        return entry
+    except Exception as e:
+        print(f"❌ Failed to index APK build: {e}")
+        return None
+
+def download_apk(gdrive_url: str, progress_callback=None, progress_hz: float = PROGRESS_HZ) -> str:
     """
     Downloads APK from Google Drive into DOWNLOAD_DIR,
     keeping the original APK filename.
+    The file is written to a resumable `.part` file inside DOWNLOAD_DIR and only renamed
+    once it passed the APK integrity check, so a stopped download continues where it left off.
+    progress_callback(event) receives structured progress events (see ProgressReporter),
+    at most `progress_hz` per second.
     Returns: The ABSOLUTE path to the downloaded file (Required for Appium).
     """
     # 1. Ensure the download directory exists
@@ -96,51 +291,35 @@ def download_apk(gdrive_url: str, progress_callback=None) -> str:
     print(f"⬇️ Starting download from GDrive: {gdrive_url}")
     print(f"📂 Target Directory: {DOWNLOAD_DIR}")
 
-    # Capture original stderr
-    original_stderr = sys.stderr
+    on_progress = ProgressReporter(progress_callback, progress_hz) if progress_callback else None
 
     try:
-        # Redirect stderr if callback provided
-        if progress_callback:
-            sys.stderr = ProgressCapture(progress_callback)
-
-        # 2. Let gdown decide the filename (original name), download to current dir
-        tmp_path = gdown.download(
-            gdrive_url,
-            quiet=False,
-            fuzzy=True
-        )
+        # 2. Range-resumable (and, for big files, multi-connection) download with on-the-fly ZIP check
+        try:
+            abs_path = download_file(
+                _direct_download_url(gdrive_url),
+                DOWNLOAD_DIR,
+                progress_callback=on_progress,
+            )
+        except UnsupportedLinkError as e:
+            # Only links the engine cannot handle go to gdown: cancellation, HTTP errors and
+            # size mismatches are real failures and must not restart the download
+            print(f"⚠️ Direct download failed ({e}), falling back to gdown...")
+            abs_path = os.path.abspath(_download_with_gdown(gdrive_url))
+            # 3. gdown gives no guarantees: verify the result before handing it to Appium
+            try:
+                verify_apk(abs_path)
+            except IntegrityError:
+                os.remove(abs_path)
+                raise
 
-        # 3. Verify the file actually exists and isn't empty
-        if not tmp_path or not os.path.exists(tmp_path):
-            raise Exception("Download failed - gdown returned no path.")
-
-        if os.path.getsize(tmp_path) < 1000:
-            raise Exception("Download failed - File is too small (likely an HTML error page).")
-
-        # 4. Move the file into DOWNLOAD_DIR, keeping original filename
-        filename = os.path.basename(tmp_path)
-        final_path = os.path.join(DOWNLOAD_DIR, filename)
-
-        # If it's not already there, move it
-        if os.path.abspath(tmp_path) != os.path.abspath(final_path):
-            shutil.move(tmp_path, final_path)
-
-        abs_path = os.path.abspath(final_path)
         print(f"✅ APK Ready at: {abs_path}")
         return abs_path
 
     except Exception as e:
         print(f"❌ Error downloading APK: {str(e)}")
-        # Cleanup: Remove partial file if it exists
-        if 'tmp_path' in locals() and os.path.exists(tmp_path):
-            os.remove(tmp_path)
         raise e
     
-    finally:
-        # Restore stderr
-        sys.stderr = original_stderr
-    
 def cleanup_apk(file_path: str):
     """
     Optional: Call this after test finishes to free up space
@@ -151,22 +330,22 @@ def cleanup_apk(file_path: str):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python gdrive_loader.py <url>")
+        print("Usage: python gdrive_loader.py <url> [--progress-hz N]")
         sys.exit(1)
     
     url = sys.argv[1]
+    hz = PROGRESS_HZ
+    if "--progress-hz" in sys.argv:
+        hz = float(sys.argv[sys.argv.index("--progress-hz") + 1])
 
-    # Callback to print normalized progress to STDOUT for server.py to read
-    def cli_progress_callback(msg):
-        # Remove Carriage Returns
-        clean = msg.replace('\r', '').strip()
-        if clean:
-            # Prefix with 'PROGRESS:' so server knows it's a status update
-            print(f"PROGRESS:{clean}")
-            sys.stdout.flush()
+    # Callback to print one JSON progress event per line to STDOUT for server.py to read
+    def cli_progress_callback(event):
+        # Prefix with 'EVENT:' so server knows it's a machine-readable status update
+        print("EVENT:" + json.dumps({"event": "progress", **event}))
+        sys.stdout.flush()
 
     try:
-        path = download_apk(url, cli_progress_callback)
+        path = download_apk(url, cli_progress_callback, progress_hz=hz)
         # Output the final result with a specific prefix
         print(f"RESULT:{path}")
     except Exception as e:
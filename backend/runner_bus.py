@@ -0,0 +1,144 @@
+import os
+import json
+import socket
+import asyncio
+import tempfile
+import threading
+from collections import deque
+
+# Config: Unix domain socket for runners started as a separate process ("" disables it).
+# tests/event_transport.py uses the same default, so both sides meet without configuration.
+RUNNER_SOCKET = os.getenv("RUNNER_SOCKET", os.path.join(tempfile.gettempdir(), "test-platform-runner.sock"))
+# Longest event line accepted on the socket
+MAX_LINE = 1024 * 1024
+
+# Runner endpoint -> broadcast type of its fire-and-forget events; the JSON body is the payload as-is
+EVENT_TYPES = {
+    "/api/log-step": "LOG",
+    "/api/module-status": "MODULE",
+}
+
+
+class RunnerBus:
+    """
+    Where runner events enter the backend without HTTP:
+      - in-process (the runner imported by server.py): push() from any thread appends to a deque,
+        and one loop wakeup drains whatever piled up meanwhile, dicts untouched (no JSON, no pydantic)
+      - separate process: newline-delimited JSON {"path": ..., "body": ...} on RUNNER_SOCKET
+    Events keep their order per producer. Calls that need an answer (Appium leases) go through call().
+    """
+
+    def __init__(self, broadcast, routes: dict):
+        self.broadcast = broadcast  # async (message) -> None
+        self.routes = routes  # path -> async (body) -> response, for everything not in EVENT_TYPES
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._pending: deque = deque()
+        self._lock = threading.Lock()
+        self._woken = False
+        self._ready: asyncio.Event | None = None
+        self._drainer: asyncio.Task | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._clients: set[asyncio.StreamWriter] = set()
+        self.socket_path: str | None = None
+        self.received = {"local": 0, "uds": 0}
+        self.errors = 0
+
+    async def start(self, socket_path: str = RUNNER_SOCKET):
+        self.loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._drainer = asyncio.create_task(self._drain())
+        if socket_path and hasattr(socket, "AF_UNIX") and os.name != "nt":
+            if os.path.exists(socket_path):
+                os.remove(socket_path)  # left behind by a backend that did not shut down cleanly
+            self._server = await asyncio.start_unix_server(self._serve_client, path=socket_path, limit=MAX_LINE)
+            self.socket_path = socket_path
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # An external runner keeps its connection for its whole life, and wait_closed()
+            # waits for connected clients (Python 3.12+)
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self._server = None
+        if self._drainer is not None:
+            self._drainer.cancel()
+            try:
+                await self._drainer
+            except asyncio.CancelledError:
+                pass
+        self.loop = None
+
+    def push(self, path: str, body: dict, source: str = "local"):
+        """Queues one event. Safe from any thread; never blocks the caller."""
+        with self._lock:
+            self._pending.append((path, body))
+            self.received[source] += 1
+            wake = not self._woken
+            self._woken = True
+        if wake:
+            self.loop.call_soon_threadsafe(self._ready.set)
+
+    def serves(self, path: str) -> bool:
+        return self.loop is not None and (path in EVENT_TYPES or path in self.routes)
+
+    def call(self, path: str, body: dict):
+        """
+        In-process entry for tests/event_transport.py: events are pushed (returns None), anything else
+        runs its route on the server loop and returns the concurrent.futures.Future.
+        """
+        if path in EVENT_TYPES:
+            self.push(path, body)
+            return None
+        return asyncio.run_coroutine_threadsafe(self.routes[path](body), self.loop)
+
+    async def _drain(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            with self._lock:
+                batch, self._pending = self._pending, deque()
+                self._woken = False
+            for path, body in batch:
+                try:
+                    kind = EVENT_TYPES.get(path)
+                    if kind is not None:
+                        await self.broadcast({"type": kind, "payload": body})
+                    elif path in self.routes:
+                        await self.routes[path](body)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"⚠️ Runner event {path} failed: {e}")
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # longer than MAX_LINE: dropped by asyncio
+                    self.errors += 1
+                    continue
+                if not line:
+                    break
+                try:
+                    event = json.loads(line)
+                    self.push(event["path"], event["body"], source="uds")
+                except (ValueError, KeyError, TypeError):
+                    self.errors += 1
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def stats(self) -> dict:
+        return {
+            "socket": self.socket_path,
+            "received": dict(self.received),
+            "queued": len(self._pending),
+            "errors": self.errors,
+        }
@@ -9,9 +9,15 @@ from fastapi.responses import JSONResponse
 import uvicorn
 from pydantic import BaseModel
 import subprocess
-import socket
 import asyncio
-from gdrive_loader import download_apk, extract_app_icon, get_apk_info
+import json
+import uuid
+from gdrive_loader import download_apk, extract_app_icon, get_apk_info, format_progress, record_apk_build
+from ws_channels import ClientConnection, channel_of
+from event_log import EventLog
+from appium_pool import AppiumPool, PoolError, connected_devices
+from allure_manager import AllureManager
+from runner_bus import RunnerBus
 from typing import List, Optional, Dict
 
 # Add project root to sys.path so we can import tests.*
@@ -19,41 +25,39 @@ BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # root: f:\projects\test-
 if BASE_DIR not in sys.path:
     sys.path.append(BASE_DIR)
 
-from tests.test_runner import run_tests_and_get_suggestions, stop_current_tests, generate_report
+from tests.test_runner import run_tests_and_get_suggestions, stop_current_tests, generate_report_async, set_local_backend
 # from gdrive_loader import download_apk, 
 
 # --- NEW: Cleanup Handler (Lifespan) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Run on startup
+    reaped = await asyncio.to_thread(allure_manager.reap_orphans)
+    if reaped:
+        print(f"Killed {reaped} leftover Allure server(s) from a previous run")
+    appium_pool.start_monitor()
+    # The runner lives in this process: its log lines go straight into manager.broadcast
+    await runner_bus.start()
+    set_local_backend(runner_bus)
     yield
+    set_local_backend(None)
+    await runner_bus.stop()
     # Run on shutdown (Ctrl+C)
     print("Shutting down: Cleaning up child processes...")
-    global _appium_proc, _allure_proc
     
     # Kill Appium
-    if _appium_proc is not None:
-        try:
-            print("Killing Appium...")
-            if os.name == 'nt':
-                 subprocess.run(["taskkill", "/F", "/T", "/PID", str(_appium_proc.pid)], 
-                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            else:
-                 _appium_proc.kill()
-        except Exception as e:
-            print(f"Error killing Appium: {e}")
+    appium_pool.stop_monitor()
+    try:
+        print("Killing Appium...")
+        await asyncio.to_thread(appium_pool.stop_all)
+    except Exception as e:
+        print(f"Error killing Appium: {e}")
 
     # Kill Allure
-    if _allure_proc is not None:
-        try:
-            print("Killing Allure...")
-            if os.name == 'nt':
-                 subprocess.run(["taskkill", "/F", "/T", "/PID", str(_allure_proc.pid)],
-                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            else:
-                 _allure_proc.kill()
-        except Exception:
-            pass
+    try:
+        allure_manager.stop()
+    except Exception:
+        pass
 
 app = FastAPI(lifespan=lifespan)
 
@@ -84,47 +88,11 @@ ALLURE_REPORT_DIR = os.path.join(BASE_DIR, "allure-report")
 os.makedirs(ALLURE_REPORT_DIR, exist_ok=True)
 app.mount("/allure-report", StaticFiles(directory=ALLURE_REPORT_DIR, html=True), name="allure-report")
 
-_allure_proc: subprocess.Popen | None = None
-_allure_port: int | None = None
-
-# --- NEW: Appium Globals ---
-_appium_proc: subprocess.Popen | None = None
-APPIUM_PORT = 4723
-
-ALLURE_CMD = r"C:\Users\Pramo\scoop\shims\allure"
-
-def _start_allure_server() -> str:
-    """
-    Starts (or restarts) `allure open` server for the generated allure-report folder.
-    Returns the URL the frontend should open.
-    Requires: Allure CLI installed and in PATH.
-    """
-    global _allure_proc, _allure_port
-
-    if not os.path.isdir(ALLURE_REPORT_DIR):
-        raise HTTPException(status_code=404, detail=f"Allure report dir not found: {ALLURE_REPORT_DIR}")
-
-    # Kill previous server if running
-    if _allure_proc is not None and _allure_proc.poll() is None:
-        try:
-            _allure_proc.terminate()
-        except Exception:
-            pass
-        _allure_proc = None
-
-    _allure_port = _pick_free_port()
+# --- Appium: one managed server per device (see appium_pool.py) ---
+appium_pool = AppiumPool()
 
-    # Start Allure server
-    # (Allure CLI: `allure open -h <host> -p <port> <report_dir>`)
-    _allure_proc = subprocess.Popen(
-        ["allure", "open", "-h", "127.0.0.1", "-p", str(_allure_port), ALLURE_REPORT_DIR],
-        cwd=BASE_DIR,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        creationflags=subprocess.CREATE_NO_WINDOW if hasattr(subprocess, "CREATE_NO_WINDOW") else 0,
-    )
-
-    return f"http://127.0.0.1:{_allure_port}"
+# Reports are served from the /allure-report mount (or one shared `allure open`, see allure_manager.py)
+allure_manager = AllureManager(ALLURE_REPORT_DIR)
 
 
 class RunCompleteEvent(BaseModel):
@@ -133,32 +101,97 @@ class RunCompleteEvent(BaseModel):
 class ExistingTestRequest(BaseModel):
     apk_name: str
     tests_to_run: Optional[List[Dict[str, str]]] = None  # Added field
+    selection: str = "all"  # "all" | "impacted" | "impacted-only"
 
 class LogMessage(BaseModel):
     message: str
     status: str = "INFO"
+    run_id: Optional[str] = None  # lets clients subscribe to "logs:<run_id>"
 
 # --- Globals to manage child processes ---
 DOWNLOAD_PROCESS_OBJ = None  # Holds the asyncio Process object
 
+# Config: negotiate permessage-deflate with clients that offer it (browsers do)
+WS_DEFLATE = os.getenv("WS_DEFLATE", "1") != "0"
+
 # 1. Connection Manager for WebSockets
 class ConnectionManager:
+    """
+    Fans broadcasts out to per-client queues (see ws_channels.py): each client only gets the
+    channels it subscribed to, and a slow client drops its own oldest frames instead of
+    holding up the endpoint that broadcast.
+    """
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.active_connections: list[ClientConnection] = []
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, on_close=self._forget)
+        client.start()
+        self.active_connections.append(client)
+        return client
+
+    def _forget(self, client: ClientConnection):
+        """Called by a client whose sender failed: no more frames are queued for it."""
+        if client in self.active_connections:
+            self.active_connections.remove(client)
+
+    async def disconnect(self, client: ClientConnection):
+        self._forget(client)
+        await client.close()
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            await connection.send_json(message)
+        message = event_log.append(message)  # adds run_id + seq, kept for clients that resume later
+        channel = channel_of(message)
+        for client in self.active_connections:
+            client.offer(message, channel)
 
 class TestRequest(BaseModel):
     url: str
     tests_to_run: Optional[List[Dict[str, str]]] = None # Added field
+    selection: str = "all"  # "all" | "impacted" | "impacted-only"
 
 manager = ConnectionManager()
+# Recent events per run for reconnecting clients ({"action": "resume", ...})
+event_log = EventLog()
+
+# Config: How often (per second) download progress is pushed to WebSocket clients
+PROGRESS_UPDATE_HZ = float(os.getenv("PROGRESS_UPDATE_HZ", "4"))
+
+class ProgressCoalescer:
+    """
+    Keeps only the latest progress event per download and broadcasts pending ones
+    at most PROGRESS_UPDATE_HZ times per second, instead of one frame per event.
+    """
+    def __init__(self, hz: float = PROGRESS_UPDATE_HZ):
+        self.interval = 1.0 / hz if hz > 0 else 0.0
+        self.pending: dict[str, dict] = {}
+        self._task: asyncio.Task | None = None
+
+    def update(self, download_id: str, event: dict):
+        self.pending[download_id] = event
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # Leading edge: the first event goes out immediately, later ones at the configured rate
+        while self.pending:
+            await self.flush()
+            await asyncio.sleep(self.interval)
+
+    async def flush(self):
+        batch, self.pending = self.pending, {}
+        for download_id, event in batch.items():
+            await manager.broadcast({
+                "type": "LOG",
+                "payload": {
+                    "message": format_progress(event),
+                    "status": "PROGRESS",
+                    "progress": {"download_id": download_id, **event},
+                }
+            })
+
+progress_coalescer = ProgressCoalescer()
 
 @app.post("/api/run-complete")
 async def run_complete(event: RunCompleteEvent):
@@ -169,27 +202,21 @@ async def run_complete(event: RunCompleteEvent):
     })
     return {"ok": True}
 
-def _pick_free_port() -> int:
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(("127.0.0.1", 0))
-        return int(s.getsockname()[1])
-
 @app.post("/api/allure/start")
 async def allure_start():
     """
-    Start Allure server (allure open) and return the URL.
+    URL of the latest Allure report, broadcast to the UI as RUN_COMPLETE.
+    Reuses the one managed report server instead of spawning a new `allure open` per call.
     """
-    port = _pick_free_port()
-    subprocess.Popen(
-        [ALLURE_CMD, "open", "-h", "127.0.0.1", "-p", str(port), ALLURE_REPORT_DIR],
-        cwd=BASE_DIR,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        shell=True
-    )
-    url = f"http://127.0.0.1:{port}"
+    url = await asyncio.to_thread(allure_manager.url)
+    await manager.broadcast({"type": "RUN_COMPLETE", "payload": {"report_url": url}})
     return JSONResponse({"url": url})
 
+@app.get("/api/allure/status")
+async def allure_status():
+    """Serving mode, managed process and its memory footprint (rss_mb)."""
+    return await asyncio.to_thread(allure_manager.status)
+
 @app.get("/device-status")
 async def device_status():
     """
@@ -212,24 +239,38 @@ async def device_status():
 # 2. WebSocket Endpoint (Frontend connects here)
 @app.websocket("/ws/test-status")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    client = await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text() # Keep connection open
+            # Clients may send subscribe / unsubscribe / resume requests; anything else just keeps the connection open
+            text = await websocket.receive_text()
+            try:
+                request = json.loads(text)
+            except ValueError:
+                continue
+            if not isinstance(request, dict) or "action" not in request:
+                continue
+            if request["action"] == "resume":
+                # {"action": "resume", "run_id": "...", "last_seq": 42} -> one CATCH_UP frame with what was missed
+                client.resume(event_log.catch_up(request.get("run_id"), request.get("last_seq", 0)))
+            else:
+                await client.send_control(client.configure(request))
     except:
-        manager.active_connections.remove(websocket)
+        await manager.disconnect(client)
+
+@app.get("/api/ws/clients")
+async def ws_clients():
+    """Subscriptions, encoding and queue/drop counters of every connected WebSocket client."""
+    return {"clients": [client.stats() for client in manager.active_connections], "event_log": event_log.stats()}
 
 # 3. The "Loopback" Endpoint (Pytest calls this)
 @app.post("/api/log-step")
 async def log_step(msg: LogMessage):
     # Broadcast log to UI immediately
-    await manager.broadcast({
-        "type": "LOG",
-        "payload": {
-            "message": msg.message,
-            "status": msg.status,
-        }
-    })
+    payload = {"message": msg.message, "status": msg.status}
+    if msg.run_id:
+        payload["run_id"] = msg.run_id
+    await manager.broadcast({"type": "LOG", "payload": payload})
     return {"status": "ok"}
 
 # 4. The "Profiler" Endpoint (Sidecar calls this)
@@ -242,27 +283,24 @@ async def log_metric(data: dict):
 @app.post("/api/module-status")
 async def module_status(data: dict):
     """
-    Accepts { "module": "Login", "status": "running/completed/failed", "message": "optional" }
-    and broadcasts it to all WebSocket clients.
+    Accepts { "module": "Login", "status": "running/completed/failed", "message": "optional", "run_id": "optional" }
+    and broadcasts it to the WebSocket clients subscribed to "modules".
     """
     module = data.get("module")
     status = data.get("status")
     message = data.get("message", "")
 
-    await manager.broadcast({
-        "type": "MODULE",
-        "payload": {
-            "module": module,
-            "status": status,
-            "message": message,
-        }
-    })
+    payload = {"module": module, "status": status, "message": message}
+    if data.get("run_id"):
+        payload["run_id"] = data["run_id"]
+    await manager.broadcast({"type": "MODULE", "payload": payload})
     return {"status": "ok"}
 
 @app.post("/start-test")
 async def start_test(request: TestRequest, background_tasks: BackgroundTasks):
     global DOWNLOAD_PROCESS_OBJ
     
+    run_id = event_log.start_run()
     try:
         # Tell frontend: starting download
         await manager.broadcast({
@@ -272,6 +310,7 @@ async def start_test(request: TestRequest, background_tasks: BackgroundTasks):
 
         script_path = os.path.join(os.path.dirname(__file__), "gdrive_loader.py")
         apk_path = None
+        download_id = uuid.uuid4().hex[:8]
 
         # --- FIX: Force UTF-8 encoding for the subprocess ---
         # This prevents 'charmap' codec errors when printing emojis on Windows
@@ -282,6 +321,7 @@ async def start_test(request: TestRequest, background_tasks: BackgroundTasks):
         # Using -u for unbuffered output to get real-time progress
         DOWNLOAD_PROCESS_OBJ = await asyncio.create_subprocess_exec(
             sys.executable, "-u", script_path, request.url,
+            "--progress-hz", str(PROGRESS_UPDATE_HZ),
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
             env=env, 
@@ -291,13 +331,14 @@ async def start_test(request: TestRequest, background_tasks: BackgroundTasks):
         async for line in DOWNLOAD_PROCESS_OBJ.stdout:
             decoded_line = line.decode('utf-8').strip()
             
-            if decoded_line.startswith("PROGRESS:"):
-                # Broadcast progress to UI
-                raw_msg = decoded_line.replace("PROGRESS:", "")
-                await manager.broadcast({
-                    "type": "LOG",
-                    "payload": {"message": raw_msg, "status": "PROGRESS"}
-                })
+            if decoded_line.startswith("EVENT:"):
+                # Structured progress: only the latest one per download reaches the UI
+                try:
+                    event = json.loads(decoded_line[len("EVENT:"):])
+                except ValueError:
+                    continue
+                if event.pop("event", None) == "progress":
+                    progress_coalescer.update(download_id, event)
             elif decoded_line.startswith("RESULT:"):
                 # Capture the final file path
                 apk_path = decoded_line.replace("RESULT:", "").strip()
@@ -311,6 +352,8 @@ async def start_test(request: TestRequest, background_tasks: BackgroundTasks):
 
         # Wait for finish
         await DOWNLOAD_PROCESS_OBJ.wait()
+        # Deliver the last (100%) progress frame before anything else
+        await progress_coalescer.flush()
         
          # 3. Check for failures
         if DOWNLOAD_PROCESS_OBJ.returncode != 0:
@@ -335,17 +378,22 @@ async def start_test(request: TestRequest, background_tasks: BackgroundTasks):
         info = get_apk_info(apk_path) or {}
         app_name = info.get("app_name")
         package_name = info.get("package_name")
+
+        # Index the build so the runner can diff it against the previous one
+        await asyncio.to_thread(record_apk_build, apk_path)
         
         # 4. Trigger the actual Automation Test
         background_tasks.add_task(
                    run_tests_and_get_suggestions, 
                    apk_path, 
-                   tests_to_run=request.tests_to_run
+                   tests_to_run=request.tests_to_run,
+                   selection=request.selection,
                )
         
         return {
             "status": "success", 
             "message": "APK Downloaded. Test Starting...",
+            "run_id": run_id,
             "app_icon": full_icon_url,
             "app_name": app_name,
             "package_name": package_name,
@@ -365,6 +413,7 @@ async def start_test_existing(request: ExistingTestRequest, background_tasks: Ba
     """
     Start tests using an already-downloaded APK in backend/temp_apks.
     """
+    run_id = event_log.start_run()
     try:
         apk_path = os.path.join(APKS_DIR, request.apk_name)
 
@@ -387,15 +436,19 @@ async def start_test_existing(request: ExistingTestRequest, background_tasks: Ba
         app_name = info.get("app_name")
         package_name = info.get("package_name")
 
+        await asyncio.to_thread(record_apk_build, apk_path)
+
         # Run tests in background
         background_tasks.add_task(
             run_tests_and_get_suggestions, 
             apk_path, 
-            tests_to_run=request.tests_to_run
+            tests_to_run=request.tests_to_run,
+            selection=request.selection,
         )
         return {
             "status": "success",
             "message": "Using existing APK. Test Starting...",
+            "run_id": run_id,
             "app_icon": full_icon_url,
             "app_name": app_name,
             "package_name": package_name,
@@ -465,76 +518,88 @@ async def stop_test():
     
 # --- NEW: Appium Endpoints ---
 
+class LeaseRequest(BaseModel):
+    udid: Optional[str] = None  # None = any device
+    timeout: float = 30
+
+class ReleaseRequest(BaseModel):
+    lease_id: str
+
 @app.get("/api/appium/status")
 async def appium_status():
-    """Check if Appium process is running."""
-    global _appium_proc
-    if _appium_proc is not None and _appium_proc.poll() is None:
-        return {"status": "running", "port": APPIUM_PORT}
-    return {"status": "stopped"}
+    """Running when at least one pooled Appium server answers /status."""
+    servers = appium_pool.status()
+    healthy = [s for s in servers if s["state"] == "healthy"]
+    if healthy:
+        return {"status": "running", "port": healthy[0]["port"], "servers": servers}
+    return {"status": "stopped", "servers": servers}
 
 @app.post("/api/appium/start")
 async def appium_start():
-    """Start the Appium Server."""
-    global _appium_proc
-    
-    # 1. Check if already running via Python
-    if _appium_proc is not None and _appium_proc.poll() is None:
-        return {"status": "running", "message": "Appium is already running via backend."}
-
-    # 2. Check if port is locked (e.g. running from external terminal)
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        if s.connect_ex(('127.0.0.1', APPIUM_PORT)) == 0:
-             return {"status": "running", "message": f"Appium (or something) already active on port {APPIUM_PORT}"}
-
+    """Start one Appium server per connected device (one default server when no device is attached)."""
     try:
-        # Start Appium. Assumes 'appium' is in your System PATH.
-        # On Windows, shell=True is often needed for npm binaries.
-        _appium_proc = subprocess.Popen(
-            ["appium", "-p", str(APPIUM_PORT)],
-            shell=True,
-            stdout=subprocess.DEVNULL, # Or redirect to a log file
-            stderr=subprocess.DEVNULL
-        )
-        return {"status": "started", "message": f"Appium started on port {APPIUM_PORT}"}
+        servers = await asyncio.to_thread(appium_pool.ensure, connected_devices() or [None])
+        ports = ", ".join(str(s["port"]) for s in servers)
+        return {"status": "started", "message": f"Appium running on port(s) {ports}", "servers": servers}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/appium/stop")
 async def appium_stop():
-    """Stop the Appium Server."""
-    global _appium_proc
-    if _appium_proc is not None:
-        # On Windows with shell=True, terminate/kill only kills the shell (cmd.exe), not Appium (node.exe).
-        # We need to strictly kill the process tree.
-        if os.name == 'nt':
-            try:
-                subprocess.run(
-                    ["taskkill", "/F", "/T", "/PID", str(_appium_proc.pid)],
-                    stdout=subprocess.DEVNULL, 
-                    stderr=subprocess.DEVNULL
-                )
-            except Exception as e:
-                print(f"Error executing taskkill: {e}")
-                # Fallback if taskkill fails for some reason
-                _appium_proc.kill()
-        
-        _appium_proc = None
-        return {"status": "stopped"}
-    
-    return {"status": "not_running"}
+    """Stop every pooled Appium server (whole process tree, on every OS)."""
+    if not appium_pool.servers:
+        return {"status": "not_running"}
+    await asyncio.to_thread(appium_pool.stop_all)
+    return {"status": "stopped"}
+
+@app.get("/api/appium/pool")
+async def appium_pool_status():
+    return {"servers": appium_pool.status()}
+
+@app.post("/api/appium/lease")
+async def appium_lease(request: LeaseRequest):
+    """
+    Lease a healthy server for a device: { url, port, system_port, chromedriver_port, lease_id, ... }.
+    Starts the device's server on demand; 409 when none frees up within `timeout`.
+    """
+    try:
+        return await asyncio.to_thread(appium_pool.lease, request.udid, request.timeout)
+    except PoolError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/appium/release")
+async def appium_release(request: ReleaseRequest):
+    return {"released": appium_pool.release(request.lease_id)}
+
+_background_tasks = set()  # strong references, asyncio only keeps weak ones
 
 @app.post("/api/generate-report")
 async def api_generate_report():
     """Manually trigger report generation."""
     try:
-        # Run in thread pool to avoid blocking
-        import threading
-        t = threading.Thread(target=generate_report)
-        t.start()
+        # `allure generate` runs as an async subprocess on this loop, no extra thread
+        task = asyncio.create_task(generate_report_async())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
         return {"status": "ok", "message": "Report generation started"}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+# Runner calls served without HTTP (log lines and module statuses are broadcast by the bus itself)
+LOCAL_ROUTES = {
+    "/api/appium/lease": lambda body: appium_lease(LeaseRequest(**body)),
+    "/api/appium/release": lambda body: appium_release(ReleaseRequest(**body)),
+    "/api/allure/start": lambda body: allure_start(),
+}
+# In-process queue for the runner inside this backend, Unix socket for runners outside it
+runner_bus = RunnerBus(manager.broadcast, LOCAL_ROUTES)
+
+@app.get("/api/runner/bus")
+async def runner_bus_status():
+    """Events received per transport (local / uds) and the socket path."""
+    return runner_bus.stats()
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=WS_DEFLATE)
\ No newline at end of file
@@ -0,0 +1,200 @@
+import os
+import json
+import asyncio
+from fastapi import WebSocket
+
+try:
+    import msgpack  # optional: compact binary frames for clients that ask for them
+except ImportError:
+    msgpack = None
+
+# Config: frames buffered per client before the oldest ones are dropped (a slow tab never stalls the others)
+CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE", "1000"))
+
+# Message type -> channel, and the payload field that narrows a channel ("logs:<run_id>", "metrics:<device>")
+CHANNELS = {
+    "LOG": ("logs", "run_id"),
+    "MODULE": ("modules", "run_id"),
+    "METRIC": ("metrics", "device"),
+    "RUN_COMPLETE": ("run", "run_id"),
+}
+ALL_CHANNELS = ["*"]
+ENCODINGS = ("json", "msgpack")
+
+
+def channel_of(message: dict) -> tuple[str, str | None]:
+    """
+    ("logs", "<run_id>") style channel of a broadcast message; unknown types go to their lower-cased name.
+    The key comes from the payload, else from the message itself (event_log.append stamps run_id there).
+    """
+    kind = message.get("type", "")
+    name, key_field = CHANNELS.get(kind, (kind.lower(), None))
+    payload = message.get("payload")
+    key = payload.get(key_field) if key_field and isinstance(payload, dict) else None
+    if key is None and key_field:
+        key = message.get(key_field)
+    return name, (str(key) if key is not None else None)
+
+
+def matches(subscriptions: set[str], channel: tuple[str, str | None]) -> bool:
+    """
+    "*" matches everything, "logs" every logs message, "logs:abc" only logs of run abc.
+    Messages without a key only match the plain channel name.
+    """
+    name, key = channel
+    return "*" in subscriptions or name in subscriptions or (key is not None and f"{name}:{key}" in subscriptions)
+
+
+def metric_delta(previous: dict | None, payload: dict) -> dict:
+    """Fields of a METRIC payload that changed since the last one sent to the same client and device."""
+    if previous is None:
+        return payload
+    delta = {k: v for k, v in payload.items() if previous.get(k) != v}
+    removed = [k for k in previous if k not in payload]
+    if removed:
+        delta["_removed"] = removed
+    return delta
+
+
+class ClientConnection:
+    """
+    One WebSocket client: its subscriptions, encoding, and a bounded queue drained by its own sender task.
+    Clients that never subscribe get every channel as JSON (what the dashboard always received).
+    A frame that cannot be encoded is skipped; a failed send ends the sender, closes the socket and
+    calls on_close(client) so the owner stops queueing frames for it.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int = CLIENT_QUEUE_SIZE, on_close=None):
+        self.websocket = websocket
+        self.on_close = on_close
+        self.subscriptions: set[str] = set(ALL_CHANNELS)
+        self.encoding = "json"
+        self.delta = False
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.sent = 0
+        self.errors = 0
+        self._last_metric: dict[str | None, dict] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._sender())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def offer(self, message: dict, channel: tuple[str, str | None]):
+        """Queues the message if the client subscribed to its channel. Never blocks the broadcaster."""
+        if not matches(self.subscriptions, channel):
+            return
+        if self.queue.full():
+            self.queue.get_nowait()  # oldest frame goes, live state matters more than history
+            self.dropped += 1
+        self.queue.put_nowait((message, channel))
+
+    def resume(self, catch_up: dict):
+        """
+        Replaces whatever is still queued with one CATCH_UP frame (see event_log.py), filtered to the
+        subscribed channels. Nothing is broadcast in between, so live frames continue right after it.
+        """
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        payload = catch_up["payload"]
+        events = [e for e in payload["events"] if matches(self.subscriptions, channel_of(e))]
+        self._last_metric.clear()  # the next METRIC goes out in full
+        self.queue.put_nowait(({**catch_up, "payload": {**payload, "events": events}}, ("catch_up", None)))
+
+    def configure(self, request: dict) -> dict:
+        """
+        Applies one control message from the client and returns the SUBSCRIBED acknowledgement:
+          {"action": "subscribe", "channels": ["logs", "metrics:emulator-5554"], "encoding": "msgpack", "delta": true}
+          {"action": "unsubscribe", "channels": ["metrics"]}
+        The first subscribe replaces the implicit "*"; later ones add to it.
+        """
+        action = request.get("action")
+        channels = {str(c) for c in request.get("channels") or []}
+        error = None
+        if action == "subscribe":
+            if self.subscriptions == set(ALL_CHANNELS):
+                self.subscriptions = set()
+            self.subscriptions |= channels or set(ALL_CHANNELS)
+        elif action == "unsubscribe":
+            self.subscriptions -= channels
+        else:
+            error = f"Unknown action: {action}"
+
+        encoding = request.get("encoding")
+        if encoding is not None:
+            if encoding not in ENCODINGS:
+                error = f"Unknown encoding: {encoding}"
+            elif encoding == "msgpack" and msgpack is None:
+                error = "msgpack is not installed on the server, staying on json"
+            else:
+                self.encoding = encoding
+        if "delta" in request:
+            self.delta = bool(request["delta"])
+            self._last_metric.clear()
+
+        ack = {"channels": sorted(self.subscriptions), "encoding": self.encoding, "delta": self.delta}
+        if error:
+            ack["error"] = error
+        return {"type": "SUBSCRIBED", "payload": ack}
+
+    def _frame(self, message: dict, channel: tuple[str, str | None]) -> dict:
+        if not (self.delta and message.get("type") == "METRIC" and isinstance(message.get("payload"), dict)):
+            return message
+        # Deltas are computed at send time, against what this client really received
+        payload = message["payload"]
+        delta = metric_delta(self._last_metric.get(channel[1]), payload)
+        self._last_metric[channel[1]] = payload
+        key_field = CHANNELS["METRIC"][1]
+        if key_field in payload:
+            delta[key_field] = payload[key_field]  # deltas of different devices must stay apart
+        return {**message, "payload": delta, "delta": delta is not payload}
+
+    async def send_control(self, message: dict):
+        # Control frames are always JSON text, data frames follow the negotiated encoding
+        await self.websocket.send_text(json.dumps(message))
+
+    async def _sender(self):
+        while True:
+            message, channel = await self.queue.get()
+            try:
+                frame = self._frame(message, channel)
+                data = msgpack.packb(frame, use_bin_type=True) if self.encoding == "msgpack" else json.dumps(frame)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Skipping a {message.get('type')} frame that cannot be encoded: {e}")
+                continue
+            try:
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ WebSocket send failed, dropping the client: {e}")
+                if self.on_close is not None:
+                    self.on_close(self)
+                try:
+                    await self.websocket.close()
+                except Exception:
+                    pass  # already closed by the other side
+                return
+            self.sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "channels": sorted(self.subscriptions),
+            "encoding": self.encoding,
+            "delta": self.delta,
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
@@ -0,0 +1,300 @@
+# bench_backend.py
+# Ingest / fan-out benchmark for backend/server.py.
+# Starts the FastAPI app in-process with uvicorn, drives /api/log-step, /api/metric and
+# /api/module-status from synthetic producers at fixed rates and attaches WebSocket consumers
+# to /ws/test-status (some of them deliberately slow). Per rate level it reports accepted
+# events/s, delivered frames/s, producer request latency, end-to-end latency (POST sent ->
+# frame received) for fast and slow consumers, and memory growth (tracemalloc + peak RSS).
+#
+#   python benchmarks/bench_backend.py --rates 100,500,1000 --consumers 4 --slow 1
+#   python benchmarks/bench_backend.py --rates 1000 --channels logs,modules --encoding msgpack --delta
+#   python benchmarks/bench_backend.py --rates 500 --baseline benchmarks/results/backend-20260101-120000.json
+#
+# Everything shares one process and one event loop, so absolute numbers are a lower bound of
+# what the server does alone; they are meant to be compared run against run (see --baseline).
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tracemalloc
+
+try:
+    import resource  # peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "backend"))
+
+import httpx
+import uvicorn
+import websockets
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Relative change that counts as a regression when comparing against a baseline
+REGRESSION_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.10"))
+# Key metrics compared against the baseline: name -> True when higher is better
+COMPARED = {
+    "accepted_per_s": True,
+    "delivered_per_s": True,
+    "post_p95_ms": False,
+    "e2e_fast_p50_ms": False,
+    "e2e_fast_p95_ms": False,
+    "e2e_slow_p95_ms": False,
+    "memory_growth_kb": False,
+}
+
+
+def _pick_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+
+
+def _event(kind, seq, sent):
+    """(path, body) of one synthetic event; `sent` travels inside it so consumers can time it."""
+    stamp = f"bench {seq} {sent:.6f}"
+    if kind == "log":
+        return "/api/log-step", {"message": stamp, "status": "INFO"}
+    if kind == "metric":
+        return "/api/metric", {"bench": stamp, "cpu": 12.5, "memory": 187.0, "device": "bench"}
+    return "/api/module-status", {"module": "Bench", "status": "running", "message": stamp}
+
+
+def _stamp(frame):
+    """(seq, sent) from a frame produced by _event, or None for other broadcasts."""
+    payload = frame.get("payload") or {}
+    text = payload.get("bench") or payload.get("message") or ""
+    if not text.startswith("bench "):
+        return None
+    _, seq, sent = text.split(" ")
+    return int(seq), float(sent)
+
+
+async def _producer(client, url, kinds, rate, deadline, seq_start, step, post_latencies):
+    """Closed loop paced to `rate`: sends on schedule, or back-to-back once the server falls behind."""
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    seq = seq_start
+    sent = 0
+    while time.perf_counter() < deadline:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        next_at += interval
+        start = time.perf_counter()
+        path, body = _event(kinds[seq % len(kinds)], seq, start)
+        response = await client.post(url + path, json=body)
+        post_latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code == 200:
+            sent += 1
+        seq += step
+    return sent
+
+
+async def _consumer(ws_url, slow_ms, latencies, received, ready, subscribe=None):
+    async with websockets.connect(ws_url, max_queue=None) as ws:
+        if subscribe:
+            await ws.send(json.dumps({"action": "subscribe", **subscribe}))
+            ack = json.loads(await ws.recv())
+            if ack["payload"].get("error"):
+                print(f"⚠️ Subscription: {ack['payload']['error']}")
+        ready.set()
+        try:
+            async for raw in ws:
+                frame = msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+                stamp = _stamp(frame)
+                if stamp is None:
+                    continue
+                latencies.append((time.perf_counter() - stamp[1]) * 1000)
+                received.add(stamp[0])
+                if slow_ms:
+                    await asyncio.sleep(slow_ms / 1000)  # a browser tab that renders every frame slowly
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def run_level(base_url, rate, duration, producers, consumers, slow, slow_ms, kinds, drain, subscribe=None):
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/test-status"
+    fast_latencies, slow_latencies, post_latencies = [], [], []
+    received = [set() for _ in range(consumers)]
+    tasks = []
+    for i in range(consumers):
+        ready = asyncio.Event()
+        is_slow = i < slow
+        tasks.append(asyncio.create_task(_consumer(
+            ws_url, slow_ms if is_slow else 0, slow_latencies if is_slow else fast_latencies, received[i], ready,
+            subscribe,
+        )))
+        await ready.wait()
+
+    tracemalloc_start = tracemalloc.get_traced_memory()[0]
+    limits = httpx.Limits(max_connections=producers, max_keepalive_connections=producers)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        sent = await asyncio.gather(*[
+            _producer(client, base_url, kinds, rate / producers, deadline, i, producers, post_latencies)
+            for i in range(producers)
+        ])
+        elapsed = time.perf_counter() - start
+
+    total_sent = sum(sent)
+    expected = total_sent
+    # Events a consumer did not subscribe to are not expected to arrive
+    if subscribe and "*" not in subscribe["channels"]:
+        channels = {c.split(":")[0] for c in subscribe["channels"]}
+        wanted = {"log": "logs", "metric": "metrics", "module": "modules"}
+        expected = round(total_sent * sum(wanted[k] in channels for k in kinds) / len(kinds))
+
+    # Give consumers (slow ones especially) a bounded time to receive what is still in flight
+    drain_deadline = time.perf_counter() + drain
+    while time.perf_counter() < drain_deadline and any(len(r) < expected for r in received):
+        await asyncio.sleep(0.05)
+    memory_growth = tracemalloc.get_traced_memory()[0] - tracemalloc_start
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.sleep(0.5)  # let the server notice the disconnects before the next level broadcasts
+
+    delivered = sum(len(r) for r in received)
+    return {
+        "target_per_s": rate,
+        "accepted_per_s": round(total_sent / elapsed, 1),
+        "delivered_per_s": round(delivered / elapsed, 1),
+        "events": total_sent,
+        "undelivered": expected * consumers - delivered,
+        "post_p50_ms": _percentile(post_latencies, 0.5),
+        "post_p95_ms": _percentile(post_latencies, 0.95),
+        "e2e_fast_p50_ms": _percentile(fast_latencies, 0.5),
+        "e2e_fast_p95_ms": _percentile(fast_latencies, 0.95),
+        "e2e_fast_p99_ms": _percentile(fast_latencies, 0.99),
+        "e2e_slow_p50_ms": _percentile(slow_latencies, 0.5),
+        "e2e_slow_p95_ms": _percentile(slow_latencies, 0.95),
+        "memory_growth_kb": round(memory_growth / 1024, 1),
+    }
+
+
+async def _start_app(port):
+    from server import app  # backend/server.py
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()  # surfaces bind / import errors
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+def _subscription(args):
+    if not (args.channels or args.encoding or args.delta):
+        return None  # never subscribing = every channel as JSON, the legacy behaviour
+    request = {"channels": args.channels.split(",") if args.channels else ["*"], "delta": args.delta}
+    if args.encoding:
+        request["encoding"] = args.encoding
+    return request
+
+
+async def main(args):
+    tracemalloc.start()
+    server = task = None
+    base_url = args.server_url
+    if not base_url:
+        port = _pick_free_port()
+        server, task = await _start_app(port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    levels = []
+    try:
+        for rate in args.rates:
+            print(f"⏱️ {rate} events/s for {args.duration}s, {args.consumers} consumers ({args.slow} slow)...")
+            level = await run_level(
+                base_url, rate, args.duration, args.producers, args.consumers, args.slow, args.slow_ms,
+                args.kinds, args.drain, _subscription(args),
+            )
+            levels.append(level)
+            print(f"   accepted {level['accepted_per_s']}/s, delivered {level['delivered_per_s']}/s, "
+                  f"e2e p95 {level['e2e_fast_p95_ms']} ms (slow {level['e2e_slow_p95_ms']} ms), "
+                  f"+{level['memory_growth_kb']} KB")
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await task
+
+    return {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "server_url")},
+        "levels": levels,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+
+
+def compare(result, baseline):
+    """Per rate level present in both runs: relative change of the COMPARED metrics, regressions flagged."""
+    previous = {level["target_per_s"]: level for level in baseline.get("levels", [])}
+    lines, regressions = [], 0
+    for level in result["levels"]:
+        old = previous.get(level["target_per_s"])
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            before, after = old.get(metric), level.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = change < -REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+            regressions += worse
+            mark = "❌" if worse else "✅"
+            lines.append(f"{mark} {level['target_per_s']}/s {metric}: {before} -> {after} ({change:+.0%})")
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend ingest / WebSocket fan-out benchmark")
+    parser.add_argument("--rates", default="100,500,1000", help="Comma separated events/s levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--consumers", type=int, default=4)
+    parser.add_argument("--slow", type=int, default=1, help="How many of the consumers are slow")
+    parser.add_argument("--slow-ms", type=float, default=20.0, help="Processing time per frame of a slow consumer")
+    parser.add_argument("--kinds", default="log,metric,module", help="Event mix, cycled per producer")
+    parser.add_argument("--drain", type=float, default=5.0, help="Seconds to wait for in-flight frames after a level")
+    parser.add_argument("--channels", default=None, help="Consumers subscribe to these channels, e.g. logs,modules")
+    parser.add_argument("--encoding", default=None, choices=["json", "msgpack"])
+    parser.add_argument("--delta", action="store_true", help="Ask for delta-encoded METRIC frames")
+    parser.add_argument("--server-url", default=None, help="Benchmark a running server instead of an in-process one")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+    args.rates = [float(r) for r in args.rates.split(",") if r.strip()]
+    args.kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+
+    result = asyncio.run(main(args))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"backend-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"📄 Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            lines, regressions = compare(result, json.load(f))
+        print("\n".join(lines) or "No common rate levels with the baseline.")
+        sys.exit(1 if regressions else 0)
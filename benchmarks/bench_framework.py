@@ -0,0 +1,268 @@
+# bench_framework.py
+# Framework benchmarks against the mock WebDriver server (no phone needed):
+#   locators  - cost of one find per locator strategy for the same element (latency switched off,
+#               so what is left is client + XPath/UiSelector evaluation)
+#   waits     - how late WebDriverWait notices a screen change, per poll frequency
+#   flow      - the 8-screen farmer login via wait_utils.find_and_click with recorded latencies;
+#               wall time minus the simulated server time is the framework's own overhead
+#   screens   - "which screen is this": one page source + utils.screen_index vs probing every
+#               known screen's anchor with findElements, with recorded latencies
+#
+#   python benchmarks/bench_framework.py [--runs 30] [--only locators,waits,flow,screens]
+# Results go to benchmarks/results/framework-<timestamp>.json.
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import xml.etree.ElementTree as ET
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "tests"))
+
+from appium import webdriver
+from appium.options.android import UiAutomator2Options
+from appium.webdriver.common.appiumby import AppiumBy
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from mock_webdriver import start_server, xpath_select
+
+SCENARIO = os.path.join(BENCH_DIR, "scenarios", "farmer_login.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def _driver(url):
+    options = UiAutomator2Options()
+    options.platform_name = "Android"
+    options.device_name = "mock"
+    return webdriver.Remote(url, options=options)
+
+
+def _stats(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {
+        "runs": len(samples_ms),
+        "p50_ms": round(statistics.median(samples_ms), 2),
+        "p95_ms": round(samples_ms[min(len(samples_ms) - 1, int(0.95 * len(samples_ms)))], 2),
+        "mean_ms": round(statistics.fmean(samples_ms), 2),
+    }
+
+
+def _target(root):
+    """First clickable node of a screen: the element the tests tap to move on."""
+    parents = {child: parent for parent in root.iter() for child in parent}
+    for node in root.iter():
+        if node.get("clickable") == "true":
+            return node, parents
+    raise RuntimeError("Scenario screen has no clickable element")
+
+
+def _absolute_xpath(node, parents):
+    """Index path like the ones recorded by Appium Inspector (/hierarchy/.../android.view.ViewGroup[2])."""
+    steps = []
+    while node in parents:
+        parent = parents[node]
+        same = [c for c in parent if c.tag == node.tag]
+        steps.append(node.tag + (f"[{same.index(node) + 1}]" if len(same) > 1 else ""))
+        node = parent
+    return "/hierarchy/" + "/".join(reversed(steps))
+
+
+def _locator(root):
+    """The locator a test would write for the screen's target: accessibility id > id > text > index path."""
+    node, parents = _target(root)
+    if node.get("content-desc"):
+        return AppiumBy.ACCESSIBILITY_ID, node.get("content-desc")
+    if node.get("resource-id"):
+        return AppiumBy.ID, node.get("resource-id")
+    if node.get("text"):
+        return AppiumBy.XPATH, f"//*[@text='{node.get('text')}']"
+    return AppiumBy.XPATH, _absolute_xpath(node, parents)
+
+
+def _resolves(root, locator):
+    by, value = locator
+    if by == AppiumBy.ACCESSIBILITY_ID:
+        return any(n.get("content-desc") == value for n in root.iter())
+    if by == AppiumBy.ID:
+        return any(n.get("resource-id") == value for n in root.iter())
+    return bool(xpath_select(root, value))
+
+
+def bench_locators(runs):
+    server, url = start_server(SCENARIO, overrides={"latency_ms": {}, "jitter_ms": 0})
+    scenario = server.scenario
+    # Compare strategies on the first screen whose target has a content-desc
+    scenario_index = next(
+        i for i, screen in enumerate(scenario.screens) if _target(ET.fromstring(screen["source"]))[0].get("content-desc")
+    )
+    driver = _driver(url)
+    try:
+        scenario.index = scenario_index
+        node, parents = _target(scenario.root())
+        desc = node.get("content-desc")
+        strategies = {
+            "xpath_absolute": (AppiumBy.XPATH, _absolute_xpath(node, parents)),
+            "xpath_attribute": (AppiumBy.XPATH, f"//*[@content-desc='{desc}']"),
+            "xpath_contains": (AppiumBy.XPATH, f"//*[contains(@content-desc, '{desc}')]"),
+            "accessibility_id": (AppiumBy.ACCESSIBILITY_ID, desc),
+            "uiautomator": (AppiumBy.ANDROID_UIAUTOMATOR, f'new UiSelector().description("{desc}")'),
+        }
+        results = {}
+        for name, (by, value) in strategies.items():
+            driver.find_element(by, value)  # warm-up, also proves the locator resolves
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                driver.find_element(by, value)
+                samples.append((time.perf_counter() - start) * 1000)
+            results[name] = {"locator": value, **_stats(samples)}
+        return results
+    finally:
+        driver.quit()
+        server.shutdown()
+
+
+def bench_waits(runs, transition_ms=800, poll_frequencies=(0.5, 0.25, 0.1)):
+    results = {}
+    for poll in poll_frequencies:
+        server, url = start_server(SCENARIO, overrides={"transition_ms": transition_ms})
+        driver = _driver(url)
+        try:
+            scenario = server.scenario
+            late, finds = [], []
+            while len(late) < runs:
+                index = scenario.visible_index()
+                if index == len(scenario.screens) - 1:
+                    driver.quit()
+                    driver = _driver(url)  # back to the first screen
+                    index = 0
+                current = scenario.root()
+                next_locator = _locator(ET.fromstring(scenario.screens[index + 1]["source"]))
+                driver.find_element(*_locator(current)).click()
+                if _resolves(current, next_locator):
+                    time.sleep(transition_ms / 1000)
+                    continue  # the next screen's target is already on this one, nothing to wait for
+                clicked = time.perf_counter()
+                before = scenario.counts.get("findElement", 0)
+                WebDriverWait(driver, 10, poll_frequency=poll).until(EC.presence_of_element_located(next_locator))
+                late.append((time.perf_counter() - clicked) * 1000 - transition_ms)
+                finds.append(scenario.counts.get("findElement", 0) - before)
+            results[f"poll_{poll}s"] = {
+                "transition_ms": transition_ms,
+                "finds_per_wait": round(statistics.fmean(finds), 1),
+                **{k.replace("_ms", "_late_ms"): v for k, v in _stats(late).items() if k != "runs"},
+                "runs": len(late),
+            }
+        finally:
+            driver.quit()
+            server.shutdown()
+    return results
+
+
+def bench_flow(runs):
+    from utils.wait_utils import find_and_click
+
+    server, url = start_server(SCENARIO)
+    scenario = server.scenario
+    walls, overheads, commands = [], [], []
+    try:
+        for _ in range(runs):
+            driver = _driver(url)  # newSession resets the scenario to the first screen
+            try:
+                scenario.counts.clear()
+                start = time.perf_counter()
+                for _ in range(len(scenario.screens) - 1):
+                    find_and_click(driver, *_locator(scenario.root()), timeout=5)
+                wall = (time.perf_counter() - start) * 1000
+                counts = dict(scenario.counts)
+            finally:
+                driver.quit()
+            counts.pop("newSession", None)
+            simulated = sum(scenario.latency_ms.get(cmd, scenario.latency_ms["default"]) * n for cmd, n in counts.items())
+            walls.append(wall)
+            overheads.append(wall - simulated)
+            commands.append(sum(counts.values()))
+    finally:
+        server.shutdown()
+    return {
+        "screens": len(scenario.screens),
+        "commands_per_flow": round(statistics.fmean(commands), 1),
+        "wall": _stats(walls),
+        "framework_overhead": _stats(overheads),
+    }
+
+
+def bench_screens(runs):
+    from utils.screen_index import ScreenIndex
+
+    server, url = start_server(SCENARIO)
+    scenario = server.scenario
+    index = ScreenIndex.for_app("regular_farmer")
+    # The serial way: one findElements per known screen until one of its anchors is there
+    probes = []
+    for name in index.screens:
+        for mode, attribute, value in index.anchors[name]:
+            probes.append((name, f"//*[@{attribute}='{value}']" if mode == "exact" else f"//*[contains(@{attribute}, '{value}')]"))
+            break
+    driver = _driver(url)
+    try:
+        results = {}
+        for position, screen in enumerate(scenario.screens):
+            scenario.index = position
+            indexed, classify, serial, round_trips = [], [], [], []
+            found = None
+            for _ in range(runs):
+                index.learned.clear()  # measure the scoring path, not the structure-hash shortcut
+                start = time.perf_counter()
+                result = index.current(driver)
+                indexed.append((time.perf_counter() - start) * 1000)
+                classify.append(result["ms"])
+                found = result["screen"]
+
+                start = time.perf_counter()
+                trips = 0
+                for name, xpath in probes:
+                    trips += 1
+                    if driver.find_elements(AppiumBy.XPATH, xpath):
+                        break
+                serial.append((time.perf_counter() - start) * 1000)
+                round_trips.append(trips)
+            results[screen["name"]] = {
+                "identified_as": found,
+                "page_source_and_classify": _stats(indexed),
+                "classify_p50_ms": round(statistics.median(classify), 3),
+                "serial_probe": _stats(serial),
+                "serial_round_trips": round(statistics.fmean(round_trips), 1),
+            }
+        return results
+    finally:
+        driver.quit()
+        server.shutdown()
+
+
+BENCHMARKS = {"locators": bench_locators, "waits": bench_waits, "flow": bench_flow, "screens": bench_screens}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline framework benchmarks against the mock WebDriver server")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="Comma separated: " + ", ".join(BENCHMARKS))
+    args = parser.parse_args()
+
+    results = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": args.runs}
+    for name in [n.strip() for n in args.only.split(",") if n.strip()]:
+        print(f"⏱️ Running '{name}' benchmark...")
+        # The flow replays recorded latencies, a handful of runs is enough
+        results[name] = BENCHMARKS[name](args.runs if name != "flow" else max(1, args.runs // 10))
+        print(json.dumps(results[name], indent=2))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"framework-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"📄 Results written to {path}")
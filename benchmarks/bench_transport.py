@@ -0,0 +1,159 @@
+# bench_transport.py
+# Runner -> backend transports (tests/event_transport.py) against an in-process backend/server.py:
+#   local  the runner inside the backend, events pushed into its RunnerBus
+#   uds    a separate runner process writing JSON lines to the backend's Unix socket
+#   http   POST /api/log-step, the remote fallback
+# For each transport a producer thread sends --events log lines (optionally paced to --rate) and one
+# WebSocket consumer waits for all of them. Reports the producer-side cost per event, events/s until
+# the last one was delivered, and end-to-end latency (send -> frame received).
+#
+#   python benchmarks/bench_transport.py --events 20000
+#   python benchmarks/bench_transport.py --transports local,uds --events 100000 --rate 5000
+#
+# The producer shares the process with the server (the GIL included), so "uds" and "http" pay for
+# both sides here; compare transports within one run, not with bench_backend.py.
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "tests"))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "backend"))
+
+# The backend listens on a private socket, not on the one a real backend may be using
+os.environ["RUNNER_SOCKET"] = os.path.join(tempfile.mkdtemp(prefix="bench-transport-"), "runner.sock")
+# Measure the transport, not the slow-client drop policy of ws_channels.py
+os.environ.setdefault("WS_CLIENT_QUEUE", "1000000")
+
+import websockets
+
+from bench_backend import _pick_free_port, _percentile, _start_app, _stamp
+from event_transport import HttpTransport, LocalTransport, SocketTransport
+
+TRANSPORTS = ("local", "uds", "http")
+
+
+def _transport(name, base_url):
+    import server  # backend/server.py, already running
+
+    http = HttpTransport(base_url)
+    if name == "local":
+        return LocalTransport(server.runner_bus, http)
+    if name == "uds":
+        return SocketTransport(os.environ["RUNNER_SOCKET"], http)
+    return http
+
+
+def _produce(transport, events, rate, send_latencies):
+    interval = 1.0 / rate if rate else 0.0
+    next_at = time.perf_counter()
+    for seq in range(events):
+        if interval:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_at += interval
+        start = time.perf_counter()
+        transport.send("/api/log-step", {"message": f"bench {seq} {start:.6f}", "status": "INFO"})
+        send_latencies.append((time.perf_counter() - start) * 1e6)
+
+
+async def run_transport(name, base_url, events, rate, timeout):
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/test-status"
+    received, latencies, send_latencies = set(), [], []
+    done = asyncio.Event()
+
+    async with websockets.connect(ws_url, max_queue=None) as ws:
+        await ws.send(json.dumps({"action": "subscribe", "channels": ["logs"]}))
+        await ws.recv()  # SUBSCRIBED
+
+        async def consume():
+            async for raw in ws:
+                stamp = _stamp(json.loads(raw))
+                if stamp is None:
+                    continue
+                latencies.append((time.perf_counter() - stamp[1]) * 1000)
+                received.add(stamp[0])
+                if len(received) >= events:
+                    done.set()
+                    return
+
+        consumer = asyncio.create_task(consume())
+        transport = _transport(name, base_url)
+        started = time.perf_counter()
+        await asyncio.to_thread(_produce, transport, events, rate, send_latencies)
+        produced = time.perf_counter() - started
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        delivered = time.perf_counter() - started
+        consumer.cancel()
+        if hasattr(transport, "close"):
+            transport.close()
+
+    return {
+        "transport": name,
+        "events": events,
+        "delivered": len(received),
+        "send_per_s": round(events / produced, 1),
+        "delivered_per_s": round(len(received) / delivered, 1),
+        "send_p50_us": _percentile(send_latencies, 0.50),
+        "send_p95_us": _percentile(send_latencies, 0.95),
+        "e2e_p50_ms": _percentile(latencies, 0.50),
+        "e2e_p95_ms": _percentile(latencies, 0.95),
+        "e2e_p99_ms": _percentile(latencies, 0.99),
+    }
+
+
+async def main(args):
+    port = _pick_free_port()
+    server, task = await _start_app(port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    results = []
+    try:
+        for name in args.transports:
+            if name == "uds" and not hasattr(socket, "AF_UNIX"):
+                print("⚠️ No Unix domain sockets on this platform, skipping uds")
+                continue
+            print(f"⏱️ {name}: {args.events} events{f' at {args.rate}/s' if args.rate else ''}...")
+            result = await run_transport(name, base_url, args.events, args.rate, args.timeout)
+            results.append(result)
+            print(f"   send {result['send_per_s']}/s (p95 {result['send_p95_us']} µs), "
+                  f"delivered {result['delivered']}/{args.events} at {result['delivered_per_s']}/s, "
+                  f"e2e p50 {result['e2e_p50_ms']} ms, p95 {result['e2e_p95_ms']} ms")
+    finally:
+        server.should_exit = True
+        await task
+
+    return {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "transports": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runner -> backend transport benchmark")
+    parser.add_argument("--transports", default=",".join(TRANSPORTS), help="Comma separated: local,uds,http")
+    parser.add_argument("--events", type=int, default=20000, help="Log lines per transport")
+    parser.add_argument("--rate", type=float, default=0.0, help="Events/s per producer (0 = as fast as possible)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for delivery after sending")
+    args = parser.parse_args()
+    args.transports = [t.strip() for t in args.transports.split(",") if t.strip() in TRANSPORTS]
+
+    result = asyncio.run(main(args))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"transport-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"📄 Results written to {path}")
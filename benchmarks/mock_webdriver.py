@@ -0,0 +1,594 @@
+# mock_webdriver.py
+# A stand-in Appium (W3C WebDriver) server for benchmarking the framework without a phone.
+# It serves recorded page sources / screenshots from a scenario file and sleeps a configurable
+# latency per command, so locator strategies and wait policies can be measured deterministically.
+#
+#   python benchmarks/mock_webdriver.py --scenario benchmarks/scenarios/farmer_login.json --port 4799
+#   pytest tests/... --apk=any.apk --appium-url=http://127.0.0.1:4799
+#
+# Scenario file:
+#   {
+#     "screens": [{"name": "language", "source": "language.xml", "screenshot": "language.png"}, ...],
+#     "advance_on": "click",               # a click / tap / key event moves to the next screen
+#     "latency_ms": {"default": 40, "findElement": 80, "getPageSource": 250, "getScreenshot": 300},
+#     "jitter_ms": 5,
+#     "transition_ms": 0,                  # the next screen only shows up this long after the trigger
+#     "seed": 1
+#   }
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import zlib
+import base64
+import random
+import struct
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+# --- XPath subset (what Appium locators in this repo use) -------------------------------------
+# Steps with / and //, ancestor:: and parent (..), "*" or tag names, predicates with [n],
+# @attr='v', contains(@attr,'v'), starts-with(...), text(), combined with and / or,
+# and a parenthesised path followed by [n] or further steps. lxml is used instead when installed.
+
+_TOKEN_RE = re.compile(r"""\s*(//|/|\(|\)|\[|\]|::|,|=|!=|"[^"]*"|'[^']*'|\d+|@?[\w.:-]+(?:\(\))?|\*|\.\.|\.)""")
+
+
+def _tokenize(expr):
+    tokens, pos = [], 0
+    while pos < len(expr):
+        match = _TOKEN_RE.match(expr, pos)
+        if not match:
+            raise ValueError(f"Unsupported XPath near: {expr[pos:]}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+class _XPath:
+    def __init__(self, root):
+        self.root = root
+        self.parents = {child: parent for parent in root.iter() for child in parent}
+        self.order = {node: i for i, node in enumerate(root.iter())}
+
+    def select(self, expr):
+        self.tokens, self.pos = _tokenize(expr), 0
+        nodes = self._path([self.root], absolute_root=True)
+        return sorted(set(nodes), key=self.order.get)
+
+    # tokens
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    # paths
+    def _path(self, context, absolute_root=False):
+        if self._peek() == "(":
+            self._next()
+            nodes = self._path(context, absolute_root)
+            assert self._next() == ")"
+            nodes = sorted(set(nodes), key=self.order.get)
+            for body in self._predicates():
+                nodes = self._filter(body, nodes)
+        else:
+            nodes = context
+            if absolute_root and self._peek() in ("/", "//"):
+                # The document node: its only child is the root element
+                nodes = [None]
+        while self._peek() in ("/", "//"):
+            descendant = self._next() == "//"
+            nodes = self._step(nodes, descendant)
+        return nodes
+
+    def _children(self, node):
+        return [self.root] if node is None else list(node)
+
+    def _predicates(self):
+        """Reads the [..] groups that follow a step; returns their token lists."""
+        bodies = []
+        while self._peek() == "[":
+            self._next()
+            depth, end = 1, self.pos
+            while depth:
+                depth += self.tokens[end] == "["
+                depth -= self.tokens[end] == "]"
+                end += 1
+            bodies.append(self.tokens[self.pos:end - 1])
+            self.pos = end
+        return bodies
+
+    def _filter(self, body, nodes):
+        if len(body) == 1 and body[0].isdigit():
+            index = int(body[0]) - 1
+            return [nodes[index]] if 0 <= index < len(nodes) else []
+        return [n for n in nodes if self._evaluate(body, n)]
+
+    def _step(self, nodes, descendant):
+        token = self._next()
+        axis = "child"
+        if token.endswith("::"):  # "ancestor::" is lexed as one name token
+            axis, token = token[:-2], self._next()
+        elif self._peek() == "::":
+            axis = token
+            self._next()
+            token = self._next()
+        predicates = self._predicates()
+
+        # Positions ([n]) count per context node, as in XPath
+        groups = []
+        for node in nodes:
+            if token == "..":
+                parent = self.parents.get(node)
+                groups.append([parent] if parent is not None else [])
+                continue
+            if axis == "ancestor":
+                candidates, current = [], self.parents.get(node)
+                while current is not None:
+                    candidates.append(current)  # nearest first
+                    current = self.parents.get(current)
+                groups.append(candidates)
+            elif descendant:
+                scope = list(self.root.iter()) if node is None else list(node.iter())
+                groups.extend(self._children(d) for d in ([None] if node is None else []) + scope)
+            else:
+                groups.append(self._children(node))
+
+        result = []
+        for candidates in groups:
+            matched = [c for c in candidates if token in ("*", "..") or c.tag == token]
+            for body in predicates:
+                matched = self._filter(body, matched)
+            result.extend(matched)
+        return result
+
+    def _evaluate(self, body, node):
+        # or-of-ands over simple conditions
+        for alternative in self._split(body, "or"):
+            if all(self._condition(part, node) for part in self._split(alternative, "and")):
+                return True
+        return False
+
+    @staticmethod
+    def _split(tokens, word):
+        parts, current, depth = [], [], 0
+        for token in tokens:
+            depth += token == "("
+            depth -= token == ")"
+            if token == word and depth == 0:
+                parts.append(current)
+                current = []
+            else:
+                current.append(token)
+        parts.append(current)
+        return parts
+
+    @staticmethod
+    def _value(node, token):
+        if token in ("text()", "@text"):
+            return node.get("text", "")
+        if token.startswith("@"):
+            return node.get(token[1:])
+        return token[1:-1] if token[:1] in ("'", '"') else token
+
+    def _condition(self, tokens, node):
+        if tokens and tokens[0] == "(" and tokens[-1] == ")":
+            return self._evaluate(tokens[1:-1], node)
+        if len(tokens) >= 6 and tokens[0] in ("contains", "starts-with") and tokens[1] == "(":
+            haystack = self._value(node, tokens[2]) or ""
+            needle = self._value(node, tokens[4])
+            return needle in haystack if tokens[0] == "contains" else haystack.startswith(needle)
+        if len(tokens) == 3 and tokens[1] in ("=", "!="):
+            left, right = self._value(node, tokens[0]), self._value(node, tokens[2])
+            return (left == right) if tokens[1] == "=" else (left is not None and left != right)
+        if len(tokens) == 1 and tokens[0].startswith("@"):
+            return node.get(tokens[0][1:]) is not None
+        raise ValueError(f"Unsupported XPath predicate: {' '.join(tokens)}")
+
+
+def xpath_select(root, expr):
+    try:
+        from lxml import etree  # optional: full XPath 1.0
+        tree = etree.fromstring(ET.tostring(root))
+        found = tree.xpath(expr)
+        order = list(tree.iter())
+        plain = list(root.iter())
+        return [plain[order.index(n)] for n in found if hasattr(n, "tag")]
+    except ImportError:
+        return _XPath(root).select(expr)
+
+
+_UISELECTOR_RE = re.compile(r'(text|textContains|description|descriptionContains|resourceId|className)\("((?:[^"\\]|\\.)*)"\)')
+
+
+def uiautomator_select(root, expr):
+    """new UiSelector().textContains("x") / UiScrollable(...).scrollIntoView(new UiSelector()...)"""
+    target = expr.rsplit("scrollIntoView(", 1)[-1]
+    conditions = _UISELECTOR_RE.findall(target)
+    if not conditions:
+        return []
+
+    def matches(node):
+        for method, value in conditions:
+            value = value.replace('\\"', '"')
+            attr = {"text": "text", "textContains": "text", "description": "content-desc",
+                    "descriptionContains": "content-desc", "resourceId": "resource-id", "className": "class"}[method]
+            actual = node.get(attr) or ""
+            if (value not in actual) if method.endswith("Contains") else (actual != value):
+                return False
+        return True
+    return [n for n in root.iter() if matches(n)]
+
+
+def _tiny_png(width=8, height=8, color=(255, 255, 255)):
+    row = b"\x00" + bytes(color) * width
+    raw = zlib.compress(row * height)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) + \
+        chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+# --- Server state -----------------------------------------------------------------------------
+
+class Scenario:
+    def __init__(self, path=None, overrides=None):
+        config = {}
+        base = os.getcwd()
+        if path:
+            with open(path, "r") as f:
+                config = json.load(f)
+            base = os.path.dirname(os.path.abspath(path))
+        config.update(overrides or {})
+
+        self.screens = []
+        for screen in config.get("screens", []):
+            with open(os.path.join(base, screen["source"]), "r", encoding="utf-8") as f:
+                source = f.read()
+            screenshot = None
+            if screen.get("screenshot") and os.path.exists(os.path.join(base, screen["screenshot"])):
+                with open(os.path.join(base, screen["screenshot"]), "rb") as f:
+                    screenshot = f.read()
+            self.screens.append({"name": screen.get("name", screen["source"]), "source": source, "screenshot": screenshot})
+        if not self.screens:
+            self.screens.append({"name": "empty", "source": '<hierarchy rotation="0"/>', "screenshot": None})
+
+        self.advance_on = config.get("advance_on", "click")
+        self.latency_ms = {"default": 0, **config.get("latency_ms", {})}
+        self.jitter_ms = config.get("jitter_ms", 0)
+        self.random = random.Random(config.get("seed", 1))
+        self.window = config.get("window", {"width": 1080, "height": 2400})
+        self.transition_ms = config.get("transition_ms", 0)
+        self.changed_at = 0.0
+
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.index = 0
+        self.counts = {}
+        self._parsed = {}
+
+    def reset(self):
+        with self.lock:
+            self.index = 0
+            self.counts = {}
+            self.changed_at = 0.0
+
+    def visible_index(self):
+        # During a transition the previous screen is still what UiAutomator sees
+        if self.index and time.monotonic() < self.changed_at + self.transition_ms / 1000:
+            return self.index - 1
+        return self.index
+
+    def screen(self):
+        return self.screens[min(self.visible_index(), len(self.screens) - 1)]
+
+    def root(self):
+        screen = self.screen()
+        if screen["name"] not in self._parsed:
+            # Parsed once per screen; sendKeys writes into this tree
+            self._parsed[screen["name"]] = ET.fromstring(screen["source"])
+        return self._parsed[screen["name"]]
+
+    def advance(self, trigger):
+        if trigger == self.advance_on or self.advance_on == "any":
+            with self.lock:
+                if self.visible_index() != self.index:
+                    return  # taps during a transition hit nothing new
+                self.index = min(self.index + 1, len(self.screens) - 1)
+                self.changed_at = time.monotonic()
+
+    def delay(self, command):
+        with self.lock:
+            self.counts[command] = self.counts.get(command, 0) + 1
+            ms = self.latency_ms.get(command, self.latency_ms["default"])
+            if self.jitter_ms:
+                ms = max(0.0, ms + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+        if ms:
+            time.sleep(ms / 1000)
+
+
+# --- HTTP -------------------------------------------------------------------------------------
+
+# (method, path regex) -> command name (the same names selenium uses, so latencies can be keyed on them)
+ROUTES = [
+    ("GET", r"/status", "status"),
+    ("POST", r"/session", "newSession"),
+    ("DELETE", r"/session/[^/]+", "quit"),
+    ("POST", r"/session/[^/]+/timeouts", "setTimeouts"),
+    ("POST", r"/session/[^/]+/element", "findElement"),
+    ("POST", r"/session/[^/]+/elements", "findElements"),
+    ("POST", r"/session/[^/]+/element/[^/]+/element", "findChildElement"),
+    ("POST", r"/session/[^/]+/element/[^/]+/elements", "findChildElements"),
+    ("POST", r"/session/[^/]+/element/[^/]+/click", "clickElement"),
+    ("POST", r"/session/[^/]+/element/[^/]+/clear", "clearElement"),
+    ("POST", r"/session/[^/]+/element/[^/]+/value", "sendKeysToElement"),
+    ("GET", r"/session/[^/]+/element/[^/]+/attribute/[^/]+", "getElementAttribute"),
+    ("GET", r"/session/[^/]+/element/[^/]+/text", "getElementText"),
+    ("GET", r"/session/[^/]+/element/[^/]+/rect", "getElementRect"),
+    ("GET", r"/session/[^/]+/element/[^/]+/displayed", "isElementDisplayed"),
+    ("GET", r"/session/[^/]+/element/[^/]+/enabled", "isElementEnabled"),
+    ("GET", r"/session/[^/]+/element/[^/]+/selected", "isElementSelected"),
+    ("GET", r"/session/[^/]+/element/[^/]+/name", "getElementTagName"),
+    ("GET", r"/session/[^/]+/source", "getPageSource"),
+    ("GET", r"/session/[^/]+/screenshot", "screenshot"),
+    ("GET", r"/session/[^/]+/window/rect", "getWindowRect"),
+    ("GET", r"/session/[^/]+/window/size", "getWindowSize"),
+    ("POST", r"/session/[^/]+/actions", "w3cActions"),
+    ("POST", r"/session/[^/]+/execute/sync", "executeScript"),
+    ("POST", r"/session/[^/]+/appium/device/press_keycode", "pressKeyCode"),
+    ("POST", r"/session/[^/]+/appium/device/hide_keyboard", "hideKeyboard"),
+    ("POST", r"/session/[^/]+/appium/device/(?:activate|terminate)_app", "appLifecycle"),
+    ("GET", r"/session/[^/]+/appium/device/current_package", "getCurrentPackage"),
+    ("POST", r"/session/[^/]+/back", "back"),
+]
+_COMPILED = [(method, re.compile("^" + pattern + "$"), name) for method, pattern, name in ROUTES]
+
+
+def make_handler(scenario: Scenario):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, value):
+            body = json.dumps({"value": value}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, error, message):
+            self._send(status, {"error": error, "message": message, "stacktrace": ""})
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        def _route(self, method):
+            path = self.path.split("?", 1)[0]
+            for prefix in ("/wd/hub",):
+                if path.startswith(prefix):
+                    path = path[len(prefix):]
+            path = path.rstrip("/") or "/"
+            for route_method, pattern, name in _COMPILED:
+                if route_method == method and pattern.match(path):
+                    return name, path.split("/")
+            return None, path.split("/")
+
+        def _handle(self, method):
+            command, parts = self._route(method)
+            body = self._body() if method == "POST" else {}
+            scenario.delay(command or "unknown")
+            if command is None:
+                return self._send(200, None)  # accept anything else (settings, logs, ...)
+            try:
+                return getattr(self, "do_" + command, self._noop)(parts, body)
+            except Exception as e:
+                return self._error(500, "unknown error", str(e))
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        # commands
+        def _noop(self, parts, body):
+            self._send(200, None)
+
+        def do_status(self, parts, body):
+            self._send(200, {"ready": True, "message": "mock WebDriver"})
+
+        def do_newSession(self, parts, body):
+            session_id = uuid.uuid4().hex
+            scenario.reset()
+            caps = body.get("capabilities", {}).get("alwaysMatch", {})
+            scenario.sessions[session_id] = caps
+            self._send(200, {"sessionId": session_id, "capabilities": {**caps, "deviceName": "mock", "udid": "mock"}})
+
+        def do_quit(self, parts, body):
+            scenario.sessions.pop(parts[2], None)
+            self._send(200, None)
+
+        def _find(self, body):
+            strategy, value = body.get("using"), body.get("value", "")
+            root = scenario.root()
+            if strategy == "xpath":
+                nodes = xpath_select(root, value)
+            elif strategy == "-android uiautomator":
+                nodes = uiautomator_select(root, value)
+            elif strategy == "accessibility id":
+                nodes = [n for n in root.iter() if n.get("content-desc") == value]
+            elif strategy == "id":
+                nodes = [n for n in root.iter() if n.get("resource-id") in (value, value.split("/")[-1]) or
+                         (n.get("resource-id") or "").endswith(":id/" + value)]
+            elif strategy == "class name":
+                nodes = [n for n in root.iter() if n.tag == value or n.get("class") == value]
+            else:
+                raise ValueError(f"Unsupported locator strategy: {strategy}")
+            order = list(root.iter())
+            return [f"{scenario.visible_index()}-{order.index(n)}" for n in nodes]
+
+        def _node(self, element_id):
+            screen_index, node_index = (int(x) for x in element_id.split("-"))
+            if screen_index != scenario.visible_index():
+                return None  # the screen changed: stale element
+            return list(scenario.root().iter())[node_index]
+
+        def do_findElement(self, parts, body):
+            ids = self._find(body)
+            if not ids:
+                return self._error(404, "no such element", f"{body.get('using')}={body.get('value')}")
+            self._send(200, {ELEMENT_KEY: ids[0]})
+
+        def do_findElements(self, parts, body):
+            self._send(200, [{ELEMENT_KEY: i} for i in self._find(body)])
+
+        do_findChildElement = do_findElement
+        do_findChildElements = do_findElements
+
+        def _element(self, parts):
+            node = self._node(parts[4])
+            if node is None:
+                self._error(404, "stale element reference", parts[4])
+            return node
+
+        def do_clickElement(self, parts, body):
+            if self._element(parts) is not None:
+                scenario.advance("click")
+                self._send(200, None)
+
+        def do_clearElement(self, parts, body):
+            if self._element(parts) is not None:
+                self._send(200, None)
+
+        def do_sendKeysToElement(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                node.set("text", body.get("text", "".join(body.get("value", []))))
+                self._send(200, None)
+
+        def do_getElementAttribute(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                self._send(200, node.get(parts[6]))
+
+        def do_getElementText(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                self._send(200, node.get("text", ""))
+
+        def do_getElementRect(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                match = _BOUNDS_RE.match(node.get("bounds", "[0,0][0,0]"))
+                x1, y1, x2, y2 = (int(v) for v in match.groups()) if match else (0, 0, 0, 0)
+                self._send(200, {"x": x1, "y": y1, "width": x2 - x1, "height": y2 - y1})
+
+        def do_isElementDisplayed(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                self._send(200, node.get("displayed", "true") == "true")
+
+        def do_isElementEnabled(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                self._send(200, node.get("enabled", "true") == "true")
+
+        def do_isElementSelected(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                self._send(200, node.get("selected", "false") == "true")
+
+        def do_getElementTagName(self, parts, body):
+            node = self._element(parts)
+            if node is not None:
+                self._send(200, node.tag)
+
+        def do_getPageSource(self, parts, body):
+            self._send(200, scenario.screen()["source"])
+
+        def do_screenshot(self, parts, body):
+            png = scenario.screen()["screenshot"] or _tiny_png()
+            self._send(200, base64.b64encode(png).decode())
+
+        def do_getWindowRect(self, parts, body):
+            self._send(200, {"x": 0, "y": 0, **scenario.window})
+
+        def do_getWindowSize(self, parts, body):
+            self._send(200, dict(scenario.window))
+
+        def do_w3cActions(self, parts, body):
+            taps = sum(
+                1 for source in body.get("actions", []) for action in source.get("actions", [])
+                if action.get("type") == "pointerUp"
+            )
+            for _ in range(taps):
+                scenario.advance("click")
+            self._send(200, None)
+
+        def do_executeScript(self, parts, body):
+            script = body.get("script", "")
+            if script == "mobile: clickGesture":
+                scenario.advance("click")
+                return self._send(200, None)
+            if script == "mobile: scrollGesture":
+                return self._send(200, False)  # recorded screens do not scroll
+            self._send(200, None)
+
+        def do_pressKeyCode(self, parts, body):
+            scenario.advance("key")
+            self._send(200, None)
+
+        def do_getCurrentPackage(self, parts, body):
+            self._send(200, "mock.package")
+
+    return Handler
+
+
+def start_server(scenario_path=None, host="127.0.0.1", port=0, overrides=None):
+    """
+    Starts the mock server in a daemon thread. Returns (server, url); stop with server.shutdown().
+    `overrides` replaces top-level scenario keys, e.g. {"latency_ms": {}, "transition_ms": 800}.
+    """
+    scenario = Scenario(scenario_path, overrides)
+    server = ThreadingHTTPServer((host, port), make_handler(scenario))
+    server.daemon_threads = True
+    server.scenario = scenario
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Appium server serving recorded screens")
+    parser.add_argument("--scenario", default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4799)
+    args = parser.parse_args()
+
+    server, url = start_server(args.scenario, args.host, args.port)
+    print(f"🧪 Mock WebDriver listening on {url} ({len(server.scenario.screens)} screen(s))")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
@@ -15,6 +15,7 @@ const APP_VARIANTS = {
     label: "Krishivaas Farmer (Regular)",
     modules: [
       { name: 'Login', path: 'tests/test_cases/regular_farmer_test_cases/test_login_pytest.py' },
+      { name: 'Permissions', path: 'tests/test_cases/regular_farmer_test_cases/test_permissions_pytest.py' },
       { name: 'Dashboard', path: 'tests/farmer/test_dashboard.py' },
       { name: 'Add Updates', path: 'tests/farmer/test_updates.py' },
     ]
@@ -354,10 +355,35 @@ function App() {
     );
   };
 
+  // Run id + sequence number of the last event handled, so a reconnect only replays the gap
+  const eventCursorRef = useRef(loadState('eventCursor', { runId: null, lastSeq: 0 }));
+  const advanceEventCursor = (runId, lastSeq) => {
+    eventCursorRef.current = { runId, lastSeq };
+    sessionStorage.setItem('eventCursor', JSON.stringify(eventCursorRef.current));
+  };
+
   const { lastJsonMessage, sendMessage, readyState } = useWebSocket(WS_URL, {
     shouldReconnect: () => true,
+    // Only the channels this page renders; METRIC frames are not streamed to the dashboard.
+    // Then ask for everything missed since the last event we saw (page refresh, reconnect).
+    onOpen: (event) => {
+      const { runId, lastSeq } = eventCursorRef.current;
+      event.target.send(JSON.stringify({ action: 'subscribe', channels: ['logs', 'modules', 'run'] }));
+      event.target.send(JSON.stringify({ action: 'resume', run_id: runId, last_seq: lastSeq }));
+    },
     onMessage: (event) => {
       const data = JSON.parse(event.data);
+      if (data.type === 'CATCH_UP') {
+        const { run_id, events, last_seq } = data.payload || {};
+        (events || []).forEach(handleIncomingData);
+        advanceEventCursor(run_id, last_seq);
+        return;
+      }
+      if (data.seq !== undefined) {
+        const { runId, lastSeq } = eventCursorRef.current;
+        if (data.run_id === runId && data.seq <= lastSeq) return; // already replayed
+        advanceEventCursor(data.run_id, data.seq);
+      }
       handleIncomingData(data);
     }
   });
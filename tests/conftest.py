@@ -1,8 +1,15 @@
 import os
+import json
 import pytest
 import allure
 from appium import webdriver
 from appium.options.android import UiAutomator2Options
+from utils.state_snapshot import restore_driver_state
+from utils.wait_utils import scroll_stats
+from utils import instrumentation
+from utils.command_trace import TracingConnection
+from utils import healing
+from utils import flow_recorder
 
 # 1. Register the custom command-line option
 def pytest_addoption(parser):
@@ -15,6 +22,81 @@ def pytest_addoption(parser):
         default=None,
         help="Path to the APK file under test",
     )
+    parser.addoption(
+        "--udid",
+        action="store",
+        default=None,
+        help="Serial of the device to run on (needed when several devices are connected)",
+    )
+    parser.addoption(
+        "--system-port",
+        action="store",
+        default=None,
+        help="UiAutomator2 systemPort, unique per device when sessions run in parallel",
+    )
+    parser.addoption(
+        "--durations-file",
+        action="store",
+        default=None,
+        help="Write per-test durations (seconds, by node id) to this JSON file",
+    )
+    parser.addoption(
+        "--grant-permissions",
+        action="store_true",
+        default=False,
+        help="Grant all runtime permissions at install (autoGrantPermissions); tests skip the permission dialogs",
+    )
+    parser.addoption(
+        "--profile-dir",
+        action="store",
+        default=None,
+        help="Time steps, waits, sleeps, OCR and Appium commands; write profile-<pid>.json here",
+    )
+    parser.addoption(
+        "--trace-dir",
+        action="store",
+        default=None,
+        help="Record every WebDriver command (latency, sizes, result) to trace-<pid>.jsonl here",
+    )
+    parser.addoption(
+        "--chromedriver-port",
+        action="store",
+        default=None,
+        help="chromedriverPort for webview contexts (distinct per parallel session)",
+    )
+    parser.addoption(
+        "--appium-url",
+        action="store",
+        default=os.getenv("APPIUM_URL", "http://127.0.0.1:4723"),
+        help="Appium server to run against, e.g. the mock server in benchmarks/ (python benchmarks/mock_webdriver.py)",
+    )
+    parser.addoption(
+        "--no-state-restore",
+        action="store_true",
+        default=False,
+        help="Always run the full login flow instead of restoring the saved logged-in state",
+    )
+    parser.addoption(
+        "--update-visual-baselines",
+        action="store_true",
+        default=os.getenv("VISUAL_UPDATE", "0") == "1",
+        help="Record the current screens as the new baselines of visual checkpoints instead of comparing",
+    )
+
+    parser.addoption(
+        "--record-flows",
+        action="store_true",
+        default=os.getenv("RECORD_FLOWS", "0") == "1",
+        help="Record each passing test as a replayable trace, test-flows/<test>_replay.json (see utils/flow_recorder.py)",
+    )
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "smoke: fast check run for modules that an APK change did not touch (see impact_analysis.py)",
+    )
+    if config.getoption("--profile-dir"):
+        instrumentation.install()
 
 @pytest.fixture(scope="session")
 def driver(request):
@@ -33,25 +115,101 @@ def driver(request):
     options = UiAutomator2Options()
     options.platform_name = "Android"
     options.device_name = "AndroidDevice"
+    udid = request.config.getoption("--udid")
+    if udid:
+        options.udid = udid
+    system_port = request.config.getoption("--system-port")
+    if system_port:
+        options.system_port = int(system_port)
+    chromedriver_port = request.config.getoption("--chromedriver-port")
+    if chromedriver_port:
+        options.chromedriver_port = int(chromedriver_port)
     # options.no_reset = False
     # options.full_reset = True
-    # options.auto_grant_permissions = False
+    if request.config.getoption("--grant-permissions"):
+        options.auto_grant_permissions = True
     # options.dont_stop_app_on_reset = True
     options.app = apk_path   # ✅ use the same --apk value
 
     # TODO: adjust URL / capabilities to your setup
-    driver = webdriver.Remote("http://127.0.0.1:4723", options=options)
+    appium_url = request.config.getoption("--appium-url")
+    trace_dir = request.config.getoption("--trace-dir")
+    if trace_dir:
+        executor = TracingConnection(appium_url, trace_path=os.path.join(trace_dir, f"trace-{os.getpid()}.jsonl"))
+        driver = webdriver.Remote(command_executor=executor, options=options)
+    else:
+        driver = webdriver.Remote(appium_url, options=options)
+    if request.config.getoption("--profile-dir"):
+        instrumentation.instrument_driver(driver)
 
     yield driver
 
     driver.quit()
 
+@pytest.fixture
+def permissions_granted(request):
+    """True when runtime permissions were granted up-front, i.e. no permission dialog will appear."""
+    return request.config.getoption("--grant-permissions")
+
+@pytest.fixture
+def visual(driver, request):
+    """
+    visual("login_screen", masks=[otp_timer]) compares the screen with its baseline for this
+    resolution and fails the test on a mismatch (see utils/visual.py).
+    """
+    from utils.visual import checkpoint  # OpenCV only loads for tests that use it
+
+    update = request.config.getoption("--update-visual-baselines")
+    return lambda name, **kwargs: checkpoint(driver, name, update=update, **kwargs)
+
+@pytest.fixture
+def logged_in(driver, request):
+    """
+    Restores the logged-in app state captured by the login test (see utils/state_snapshot.py).
+    Yields True when the app was restored, False when the test has to log in itself.
+    """
+    if request.config.getoption("--no-state-restore"):
+        yield False
+        return
+    with allure.step("Restore logged-in state"):
+        restored = restore_driver_state(driver)
+    yield restored
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    """Root span of the profile: everything a test does is nested under its node id."""
+    with instrumentation.span("test", item.nodeid):
+        yield
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    """Recording starts once fixtures are set up, so a trace times the flow, not the session start."""
+    if item.config.getoption("--record-flows"):
+        app = item.path.parent.name.removesuffix("_test_cases")
+        fixtures = {name: item.funcargs[name] for name in flow_recorder.STATE_FIXTURES if name in item.funcargs}
+        flow_recorder.start(item.name, app, driver=item.funcargs.get("driver"), fixtures=fixtures)
+    yield
+
 @pytest.hookimpl(hookwrapper=True)
 def pytest_runtest_makereport(item, call):
     """Add Allure attachments on test failure"""
     outcome = yield
     report = outcome.get_result()
 
+    if report.when == "call" and item.config.getoption("--profile-dir"):
+        breakdown = instrumentation.breakdown_for(item.nodeid)
+        if breakdown:
+            allure.attach(
+                "\n".join(f"{c}: {s:.2f}s" for c, s in sorted(breakdown.items(), key=lambda kv: -kv[1])),
+                name="Time Breakdown",
+                attachment_type=allure.attachment_type.TEXT,
+            )
+
+    if report.when == "call" and item.config.getoption("--record-flows"):
+        trace = flow_recorder.stop(save=report.passed)
+        if trace:
+            print(f"🎬 Flow recorded: {trace}")
+
     if report.when == "call" and report.failed:
         driver = item.funcargs.get('driver')
         if driver:
@@ -64,4 +222,30 @@ def pytest_runtest_makereport(item, call):
                 )
             except Exception as e:
                 print(f"Failed to capture screenshot: {str(e)}")
- 
\ No newline at end of file
+ 
+_test_durations: dict[str, float] = {}
+
+def pytest_runtest_logreport(report):
+    """Sum setup + call + teardown time per test node (used by the runner to balance shards)."""
+    _test_durations[report.nodeid] = _test_durations.get(report.nodeid, 0.0) + report.duration
+
+def pytest_sessionfinish(session, exitstatus):
+    stats = scroll_stats()
+    if stats["native_round_trips"] or stats["fallbacks"]:
+        print(
+            f"\n🔎 Scroll searches: {stats['native_found']} on-device, {stats['fallbacks']} via swipe loop, "
+            f"~{stats['round_trips_saved']} round trips saved"
+        )
+
+    patch = healing.write_suggestions()
+    if patch:
+        print(f"\n🩹 Locators healed in this run, suggested locator patch: {patch}")
+
+    profile_dir = session.config.getoption("--profile-dir")
+    if profile_dir:
+        instrumentation.dump(profile_dir)
+
+    path = session.config.getoption("--durations-file")
+    if path and _test_durations:
+        with open(path, "w") as f:
+            json.dump(_test_durations, f, indent=2)
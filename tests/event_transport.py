@@ -0,0 +1,110 @@
+# event_transport.py
+# How the runner reaches the backend. Picked per run (and when the backend registers itself), cheapest first:
+# 1. local: the runner runs inside the backend (server.py registers its RunnerBus) -> plain function calls
+# 2. uds:   separate process on the same machine -> newline-delimited JSON on the backend's Unix socket
+# 3. http:  anything else (remote backend, Windows) -> POST to BACKEND_URL
+# Only fire-and-forget events (log lines, module statuses) use the socket; calls that need an
+# answer (Appium leases) go local or over HTTP.
+import os
+import json
+import socket
+import tempfile
+import threading
+from typing import Optional
+
+import requests
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+# Same default as backend/runner_bus.py
+RUNNER_SOCKET = os.getenv("RUNNER_SOCKET", os.path.join(tempfile.gettempdir(), "test-platform-runner.sock"))
+# "auto" picks as above; "local", "uds" or "http" force one (falling back to http when unavailable)
+RUNNER_TRANSPORT = os.getenv("RUNNER_TRANSPORT", "auto")
+
+
+class HttpTransport:
+    name = "http"
+
+    def __init__(self, base_url: str = BACKEND_URL):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()  # keep-alive instead of a new connection per log line
+
+    def send(self, path: str, body: dict, timeout: float = 3) -> None:
+        self.call(path, body, timeout)
+
+    def call(self, path: str, body: dict, timeout: float = 10) -> dict:
+        response = self.session.post(f"{self.base_url}{path}", json=body, timeout=timeout)
+        if response.status_code >= 400:
+            raise RuntimeError(response.text)
+        return response.json()
+
+
+class LocalTransport:
+    """Direct calls into the backend's RunnerBus (see backend/runner_bus.py)."""
+
+    name = "local"
+
+    def __init__(self, bus, fallback: HttpTransport):
+        self.bus = bus
+        self.fallback = fallback
+
+    def send(self, path: str, body: dict, timeout: float = 3) -> None:
+        if not self.bus.serves(path):
+            self.fallback.send(path, body, timeout)
+            return
+        self.bus.call(path, body)  # events are queued, other routes scheduled without waiting
+
+    def call(self, path: str, body: dict, timeout: float = 10) -> dict:
+        if not self.bus.serves(path):
+            return self.fallback.call(path, body, timeout)
+        return self.bus.call(path, body).result(timeout)
+
+
+class SocketTransport:
+    """Events as JSON lines on the backend's Unix domain socket; reconnects once per failure, then HTTP."""
+
+    name = "uds"
+
+    def __init__(self, path: str, fallback: HttpTransport):
+        self.path = path
+        self.fallback = fallback
+        self.sock: Optional[socket.socket] = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self.sock = sock
+
+    def send(self, path: str, body: dict, timeout: float = 3) -> None:
+        line = (json.dumps({"path": path, "body": body}, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            for _ in range(2):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    self.sock.sendall(line)
+                    return
+                except OSError:
+                    self.close()
+        self.fallback.send(path, body, timeout)  # backend restarted without its socket, or gone
+
+    def call(self, path: str, body: dict, timeout: float = 10) -> dict:
+        return self.fallback.call(path, body, timeout)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+def select_transport(local_bus=None, mode: str = RUNNER_TRANSPORT, socket_path: str = RUNNER_SOCKET, base_url: str = BACKEND_URL):
+    """The transport for `mode`, given the backend's RunnerBus when the runner lives inside it."""
+    http = HttpTransport(base_url)
+    if mode in ("auto", "local") and local_bus is not None:
+        return LocalTransport(local_bus, http)
+    if mode in ("auto", "uds") and hasattr(socket, "AF_UNIX") and socket_path and os.path.exists(socket_path):
+        return SocketTransport(socket_path, http)
+    return http
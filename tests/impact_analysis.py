@@ -0,0 +1,194 @@
+# impact_analysis.py
+# Decides which test modules a new APK build can affect.
+# 1. Diff the new build's fingerprint against the previous build in backend/temp_apks/apk_index.json
+#    (written by gdrive_loader.record_apk_build).
+# 2. Map every test file to the locator keys it reads from tests/locators/*.json.
+# 3. A test is impacted when a literal of one of its locators (content-desc, text, resource-id)
+#    appeared or disappeared between the two builds, or when a changed layout / new activity is
+#    named like one of its screens (activity_login.xml, LoginActivity -> login_screen, test_login).
+#    A changed layout or activity no module is named after impacts every module.
+import os
+import re
+import ast
+import json
+import glob
+import hashlib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOCATORS_DIR = os.path.join(PROJECT_ROOT, "tests", "locators")
+
+# Values inside @content-desc="...", @text='...', contains(@resource-id, "...") etc.
+_LITERAL_RE = re.compile(
+    r"""@(?:content-desc|text|resource-id)\s*(?:=|,)\s*(["'])(.*?)\1""",
+)
+
+# Words in layout, activity and screen names that do not tell screens apart
+_GENERIC_WORDS = {
+    "activity", "fragment", "layout", "screen", "dialog", "modal", "view", "item", "res", "xml",
+    "test", "pytest", "cases", "main", "base", "content", "button", "add", "new", "edit",
+}
+
+
+def load_locator_file(path: str) -> dict:
+    """Reads a locator JSON file, tolerating trailing garbage after the first object."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    data, _ = json.JSONDecoder().raw_decode(text.lstrip())
+    return data
+
+
+def flatten_locators(data: dict, prefix: str = "") -> dict[str, str]:
+    """{"login_screen": {"email_input": "//..."}} -> {"login_screen.email_input": "//..."} (coordinates skipped)."""
+    flat = {}
+    for key, value in data.items():
+        if key == "coordinates":
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten_locators(value, f"{prefix}{key}."))
+        elif isinstance(value, str):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def locator_literals(xpath: str) -> set[str]:
+    return {m.group(2) for m in _LITERAL_RE.finditer(xpath or "") if m.group(2)}
+
+
+def locator_keys_for_test(test_path: str) -> dict[str, str]:
+    """
+    Statically finds the locator keys a test file uses: every string constant in the file
+    that is a key in the locator file(s) it opens (all files if it names none that exist).
+    Returns: {"<screen>.<key>": xpath}
+    """
+    with open(test_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    constants = {n.value for n in ast.walk(tree) if isinstance(n, ast.Constant) and isinstance(n.value, str)}
+
+    files = sorted(glob.glob(os.path.join(LOCATORS_DIR, "*.json")))
+    named = [p for p in files if os.path.basename(p) in constants]
+    used = {}
+    for path in named or files:
+        try:
+            locators = flatten_locators(load_locator_file(path))
+        except (OSError, ValueError):
+            continue
+        for full_key, xpath in locators.items():
+            if full_key.split(".")[-1] in constants:
+                used[full_key] = xpath
+    return used
+
+
+def name_words(name: str) -> set[str]:
+    """Distinctive words of a layout path, activity class or screen name: "LoginActivity" -> {"login"}."""
+    base = re.split(r"[/\\]", name)[-1]
+    base = base.rsplit(".", 2)[-2] if base.endswith(".xml") else base.split(".")[-1]
+    words = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", base).lower().split("_")
+    return {w for w in words if len(w) > 2 and w not in _GENERIC_WORDS and not w.isdigit()}
+
+
+def _screen_words(test_config: dict, keys: dict[str, str]) -> set[str]:
+    """What a module's screens are called: its locator screens, its file name and its module name."""
+    words = name_words(os.path.basename(test_config["path"]).removesuffix(".py"))
+    words |= name_words(str(test_config.get("name", "")).replace(" ", "_"))
+    for key in keys:
+        for part in key.split(".")[:-1]:
+            words |= name_words(part)
+    return words
+
+
+def previous_build(index_path: str, apk_path: str) -> tuple[dict | None, dict | None]:
+    """
+    Returns (previous_entry, current_entry) for the APK from the build index.
+    Either may be None (APK not indexed yet / first build of the package).
+    """
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+
+    digest = hashlib.sha256()
+    with open(apk_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+
+    for builds in index.values():
+        for position, entry in enumerate(builds):
+            if entry["sha256"] == sha256:
+                return (builds[position - 1] if position > 0 else None), entry
+    return None, None
+
+
+def diff_builds(old: dict, new: dict) -> dict:
+    old_strings = set(old.get("strings", [])) | set(old.get("resource_ids", []))
+    new_strings = set(new.get("strings", [])) | set(new.get("resource_ids", []))
+    old_layouts, new_layouts = old.get("layouts", {}), new.get("layouts", {})
+    return {
+        "activities_added": sorted(set(new["activities"]) - set(old["activities"])),
+        "activities_removed": sorted(set(old["activities"]) - set(new["activities"])),
+        "layouts_changed": sorted(
+            name for name in set(old_layouts) | set(new_layouts) if old_layouts.get(name) != new_layouts.get(name)
+        ),
+        "strings_added": sorted(new_strings - old_strings),
+        "strings_removed": sorted(old_strings - new_strings),
+    }
+
+
+def analyze_impact(apk_path: str, test_list: list[dict], index_path: str | None = None) -> dict:
+    """
+    Splits `test_list` (the runner's [{"name", "path"}] list) into impacted and unchanged modules.
+
+    Returns:
+        {
+          "impacted": [test_config, ...],   # run in full, first
+          "unchanged": [test_config, ...],  # smoke-only pass
+          "reasons": {module_name: [str, ...]},
+          "diff": dict | None,               # None when there is no previous build to compare with
+        }
+    """
+    index_path = index_path or os.path.join(os.path.dirname(os.path.abspath(apk_path)), "apk_index.json")
+    old, new = previous_build(index_path, apk_path)
+    if not old or not new:
+        return {"impacted": list(test_list), "unchanged": [], "reasons": {}, "diff": None}
+
+    diff = diff_builds(old["fingerprint"], new["fingerprint"])
+    changed = set(diff["strings_added"]) | set(diff["strings_removed"])
+    screens_changed = diff["layouts_changed"] + diff["activities_added"]
+
+    modules = []
+    for test_config in test_list:
+        try:
+            keys, error = locator_keys_for_test(os.path.join(PROJECT_ROOT, test_config["path"])), None
+        except (OSError, SyntaxError):
+            keys, error = {}, "test file could not be analysed"
+        modules.append((test_config, keys, error, _screen_words(test_config, keys)))
+    # Layouts / activities no module is named after: cannot tell which flows reach them
+    unmapped = [c for c in screens_changed if not any(name_words(c) & words for *_, words in modules)]
+
+    impacted, unchanged, reasons = [], [], {}
+    for test_config, keys, error, words in modules:
+        name = test_config.get("name", test_config.get("path"))
+        why = [error] if error else []
+        if diff["activities_removed"]:
+            # Navigation changed: every flow may be affected
+            why.append(f"activities removed: {', '.join(diff['activities_removed'])}")
+        if unmapped:
+            why.append(f"changed layouts/activities not mapped to a module: {', '.join(unmapped[:5])}"
+                       + (f" (+{len(unmapped) - 5} more)" if len(unmapped) > 5 else ""))
+        for change in screens_changed:
+            hit = name_words(change) & words
+            if hit:
+                why.append(f"{change} changed ({', '.join(sorted(hit))} screen)")
+        for key, xpath in keys.items():
+            hit = locator_literals(xpath) & changed
+            if hit:
+                why.append(f"{key}: {', '.join(sorted(hit))}")
+
+        if why:
+            impacted.append(test_config)
+            reasons[name] = why
+        else:
+            unchanged.append(test_config)
+
+    return {"impacted": impacted, "unchanged": unchanged, "reasons": reasons, "diff": diff}
@@ -1,19 +1,21 @@
 # profiler.py
+import re
 import time
-import subprocess
 import requests
+from utils.adb_session import get_session
 
-def get_cpu(package_name):
-    # Run ADB command to get CPU usage
-    cmd = f"adb shell dumpsys cpuinfo | grep {package_name}"
-    # ... processing logic to get number ...
-    return 12.5 # Example value
+def get_cpu(package_name, serial=None):
+    # One persistent adb shell per device instead of forking `adb shell` every second
+    result = get_session(serial).run(f"dumpsys cpuinfo | grep {package_name}")
+    match = re.search(r"([\d.]+)%", result.output)
+    return float(match.group(1)) if result.ok and match else 0.0
 
-def start_profiling(package_name):
+def start_profiling(package_name, serial=None):
     while True:
-        cpu = get_cpu(package_name)
+        cpu = get_cpu(package_name, serial)
         requests.post("http://localhost:8000/api/metric", json={
             "cpu": cpu,
-            "time": time.time()
+            "time": time.time(),
+            "device": serial,  # clients can subscribe to "metrics:<serial>"
         })
-        time.sleep(1) # Poll every second
\ No newline at end of file
+        time.sleep(1) # Poll every second
@@ -0,0 +1,246 @@
+# scheduler.py
+# Splits test nodes across devices using their recorded durations:
+# 1. plan_shards builds balanced shards up-front with LPT (longest test first, onto the least loaded device).
+# 2. ShardQueue hands each device its next batch; a device that runs out of work steals
+#    the shortest pending test from whichever device has the most estimated time left.
+# Module ordering (order_modules / dependency_waves) respects declared prerequisites
+# and runs what failed last time first.
+import os
+import sys
+import json
+import heapq
+import asyncio
+import threading
+import subprocess
+from collections import deque
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DURATIONS_FILE = os.path.join(PROJECT_ROOT, "test-durations.json")
+LASTFAILED_FILE = os.path.join(PROJECT_ROOT, ".pytest_cache", "v", "cache", "lastfailed")
+
+# Prerequisites by test file: a module is skipped when one of these failed (or was skipped) in the same run.
+# Callers can also declare them per run with "depends_on": "Login, Other Module" in tests_to_run.
+MODULE_DEPENDENCIES = {
+    "tests/test_cases/regular_farmer_test_cases/test_onboarding_pytest.py": [
+        "tests/test_cases/regular_farmer_test_cases/test_login_pytest.py",
+    ],
+}
+
+# Used when a test has never run before (pessimistic: Appium flows are slow)
+DEFAULT_DURATION = 120.0
+# Weight of the newest measurement when updating the history (exponential moving average)
+DURATION_SMOOTHING = 0.5
+# A device takes several tests per pytest process to amortise the Appium session start
+BATCH_SECONDS = 300.0
+
+_durations_lock = threading.Lock()
+
+
+def load_durations(path: str = DURATIONS_FILE) -> dict[str, float]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_durations(measured: dict[str, float], path: str = DURATIONS_FILE) -> None:
+    """Merges fresh measurements into the history file (thread-safe)."""
+    with _durations_lock:
+        history = load_durations(path)
+        for nodeid, seconds in measured.items():
+            old = history.get(nodeid)
+            history[nodeid] = seconds if old is None else round(
+                DURATION_SMOOTHING * seconds + (1 - DURATION_SMOOTHING) * old, 3
+            )
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(history, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+
+def collect_nodes(paths: list[str]) -> list[str]:
+    """Returns the pytest node ids (relative to the project root) found in `paths`."""
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "--collect-only", "-q", f"--rootdir={PROJECT_ROOT}", *paths],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return [line.strip() for line in result.stdout.splitlines() if "::" in line and not line.startswith(" ")]
+
+
+def estimate(nodeid: str, durations: dict[str, float]) -> float:
+    """Known duration, else the average of known tests in the same file, else DEFAULT_DURATION."""
+    if nodeid in durations:
+        return durations[nodeid]
+    file_part = nodeid.split("::")[0]
+    siblings = [d for n, d in durations.items() if n.split("::")[0] == file_part]
+    if siblings:
+        return sum(siblings) / len(siblings)
+    return DEFAULT_DURATION
+
+
+def _normpath(path: str) -> str:
+    return os.path.normpath(path).replace(os.sep, "/")
+
+
+def load_lastfailed(path: str = LASTFAILED_FILE) -> set[str]:
+    """Node ids that failed in the previous pytest run (pytest's own cache)."""
+    try:
+        with open(path, "r") as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+
+def prerequisites(test_config: dict, test_list: list[dict]) -> list[str]:
+    """Names of the modules in `test_list` that `test_config` depends on."""
+    explicit = {n.strip().lower() for n in (test_config.get("depends_on") or "").split(",") if n.strip()}
+    by_path = set(MODULE_DEPENDENCIES.get(_normpath(test_config.get("path", "")), []))
+    return [
+        t["name"] for t in test_list
+        if t is not test_config and (t.get("name", "").lower() in explicit or _normpath(t.get("path", "")) in by_path)
+    ]
+
+
+def order_modules(test_list: list[dict], lastfailed: set[str] | None = None) -> list[dict]:
+    """
+    Topological order over prerequisites; among modules that are ready to run,
+    the ones with a test in `lastfailed` go first, otherwise the caller's order is kept.
+    Modules caught in a dependency cycle are appended in the caller's order.
+    """
+    lastfailed = load_lastfailed() if lastfailed is None else lastfailed
+    failed_files = {_normpath(nodeid.split("::")[0]) for nodeid in lastfailed}
+
+    def failed_before(t):
+        return _normpath(t.get("path", "")) in failed_files
+
+    remaining = list(test_list)
+    done, ordered = set(), []
+    while remaining:
+        ready = [t for t in remaining if all(p in done for p in prerequisites(t, test_list))]
+        if not ready:
+            ordered += remaining
+            break
+        chosen = next((t for t in ready if failed_before(t)), ready[0])
+        ordered.append(chosen)
+        done.add(chosen.get("name"))
+        remaining.remove(chosen)
+    return ordered
+
+
+def dependency_waves(test_list: list[dict]) -> list[list[dict]]:
+    """Groups modules so that every module only depends on modules of earlier waves."""
+    waves, done, remaining = [], set(), list(test_list)
+    while remaining:
+        wave = [t for t in remaining if all(p in done for p in prerequisites(t, test_list))]
+        if not wave:
+            wave = remaining
+        waves.append(wave)
+        done |= {t.get("name") for t in wave}
+        remaining = [t for t in remaining if t not in wave]
+    return waves
+
+
+def plan_shards(
+    nodes: list[str],
+    devices: list[str],
+    durations: dict[str, float],
+    first: set[str] | None = None,
+) -> dict[str, list[str]]:
+    """
+    LPT bin-packing: longest tests first, each onto the device with the smallest total so far.
+    Node ids in `first` (e.g. last run's failures) are moved to the front of their device's shard.
+    Returns device -> ordered list of node ids.
+    """
+    shards = {device: [] for device in devices}
+    heap = [(0.0, index, device) for index, device in enumerate(devices)]
+    heapq.heapify(heap)
+    for nodeid in sorted(nodes, key=lambda n: estimate(n, durations), reverse=True):
+        load, index, device = heapq.heappop(heap)
+        shards[device].append(nodeid)
+        heapq.heappush(heap, (load + estimate(nodeid, durations), index, device))
+    if first:
+        for device in shards:
+            shards[device].sort(key=lambda n: n not in first)
+    return shards
+
+
+class ShardQueue:
+    """Per-device work queues with work-stealing once a device runs dry."""
+
+    def __init__(self, shards: dict[str, list[str]], durations: dict[str, float], batch_seconds: float = BATCH_SECONDS):
+        self.durations = durations
+        self.batch_seconds = batch_seconds
+        self.queues = {device: deque(nodes) for device, nodes in shards.items()}
+        self.lock = threading.Lock()
+
+    def remaining(self, device: str) -> float:
+        return sum(estimate(n, self.durations) for n in self.queues[device])
+
+    def next_batch(self, device: str) -> list[str]:
+        """
+        Pops up to `batch_seconds` of work from the device's own queue.
+        With an empty queue, steals one test from the tail (shortest) of the busiest device.
+        Returns [] when there is nothing left anywhere.
+        """
+        with self.lock:
+            own = self.queues[device]
+            batch, budget = [], 0.0
+            while own and (not batch or budget + estimate(own[0], self.durations) <= self.batch_seconds):
+                nodeid = own.popleft()
+                batch.append(nodeid)
+                budget += estimate(nodeid, self.durations)
+            if batch:
+                return batch
+
+            victims = [d for d in self.queues if d != device and self.queues[d]]
+            if not victims:
+                return []
+            victim = max(victims, key=self.remaining)
+            return [self.queues[victim].pop()]
+
+    def drain(self) -> None:
+        """Drops all pending work (used on stop / abort)."""
+        with self.lock:
+            for q in self.queues.values():
+                q.clear()
+
+
+async def run_sharded_async(
+    nodes: list[str],
+    devices: list[str],
+    run_batch,
+    durations: dict[str, float] | None = None,
+    should_stop=None,
+    first: set[str] | None = None,
+) -> bool:
+    """
+    Runs `nodes` on `devices` in parallel, every device a task on the caller's event loop.
+
+    Args:
+        run_batch: Coroutine function (device, device_index, nodeids) -> bool, runs one pytest process.
+        durations: Duration history (defaults to the contents of DURATIONS_FILE).
+        should_stop: Optional callable; when it returns True no further batches are started.
+        first: Node ids to run before the others on their device (fail-first).
+
+    Returns:
+        True if every batch passed.
+    """
+    durations = load_durations() if durations is None else durations
+    queue = ShardQueue(plan_shards(nodes, devices, durations, first), durations)
+    results = []
+
+    async def worker(device, index):
+        while True:
+            if should_stop and should_stop():
+                queue.drain()
+                return
+            batch = queue.next_batch(device)
+            if not batch:
+                return
+            results.append(await run_batch(device, index, batch))
+
+    await asyncio.gather(*(worker(device, i) for i, device in enumerate(devices)))
+    return all(results)
@@ -0,0 +1,153 @@
+import io
+import os
+import sys
+import types
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "backend"))
+
+import download_engine
+from download_engine import IntegrityError, UnsupportedLinkError, download_file
+
+
+def make_apk(payload_size: int = 600 * 1024) -> bytes:
+    """A minimal APK: AndroidManifest.xml plus an incompressible blob, so transfers span several chunks."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("AndroidManifest.xml", b"<manifest/>")
+        zf.writestr("classes.dex", os.urandom(payload_size))
+    return buffer.getvalue()
+
+
+class StandInServer:
+    """
+    Local stand-in for the file host. Knobs:
+      ranges        honour Range headers (206) or always send the whole file (200)
+      drop_after    bytes of body sent before the connection is cut, for the first `drops` responses
+      refuse        requests answered by closing the socket without a response (a failed reconnect)
+      content_type  "text/html" to play a Drive confirmation page
+    """
+
+    def __init__(self, body: bytes, ranges=True, drop_after=None, drops=0, refuse=(), content_type="application/octet-stream"):
+        self.body, self.ranges, self.content_type = body, ranges, content_type
+        self.drop_after, self.drops, self.refuse = drop_after, drops, set(refuse)
+        self.requests: list[str | None] = []  # Range header of every request
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                number = len(server.requests)
+                server.requests.append(self.headers.get("Range"))
+                if number in server.refuse:
+                    self.close_connection = True
+                    return
+                start, end = 0, len(server.body) - 1
+                status = 200
+                if server.ranges and self.headers.get("Range"):
+                    first, _, last = self.headers["Range"].removeprefix("bytes=").partition("-")
+                    start, end = int(first), min(int(last) if last else end, end)
+                    status = 206
+                chunk = server.body[start:end + 1]
+                self.send_response(status)
+                self.send_header("Content-Type", server.content_type)
+                self.send_header("Content-Length", str(len(chunk)))
+                self.send_header("ETag", '"v1"')
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.body)}")
+                self.end_headers()
+                # The probe (bytes=0-0) is never cut
+                if server.drops and server.drop_after is not None and len(chunk) > 1:
+                    server.drops -= 1
+                    self.wfile.write(chunk[:server.drop_after])
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/app.apk"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(body, **kwargs):
+        servers.append(StandInServer(body, **kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(download_engine, "time", types.SimpleNamespace(sleep=lambda seconds: None))
+
+
+def test_resumes_after_dropped_connections(serve, tmp_path):
+    apk = make_apk()
+    server = serve(apk, drop_after=100 * 1024, drops=2)
+    path = download_file(server.url, str(tmp_path))
+    assert open(path, "rb").read() == apk
+    # probe, full request cut at 100 KB, resume cut again, resume to the end
+    assert server.requests[-2:] == [f"bytes={100 * 1024}-", f"bytes={200 * 1024}-"]
+
+
+def test_failed_reconnect_is_retried(serve, tmp_path):
+    apk = make_apk()
+    server = serve(apk, drop_after=100 * 1024, drops=1, refuse={2})
+    path = download_file(server.url, str(tmp_path))
+    assert open(path, "rb").read() == apk
+    assert len(server.requests) == 4
+
+
+def test_restarts_when_ranges_are_not_supported(serve, tmp_path):
+    apk = make_apk()
+    server = serve(apk, ranges=False, drop_after=100 * 1024, drops=1)
+    path = download_file(server.url, str(tmp_path))
+    assert open(path, "rb").read() == apk
+
+
+def test_parallel_segments_resume(serve, tmp_path, monkeypatch):
+    monkeypatch.setattr(download_engine, "PARALLEL_THRESHOLD", 1024)
+    apk = make_apk()
+    server = serve(apk, drop_after=10 * 1024, drops=2)
+    path = download_file(server.url, str(tmp_path), connections=3)
+    assert open(path, "rb").read() == apk
+
+
+def test_rejects_html_page(serve, tmp_path):
+    server = serve(b"<html>Quota exceeded</html>", content_type="text/html")
+    # The only failure gdrive_loader hands to gdown
+    with pytest.raises(UnsupportedLinkError):
+        download_file(server.url, str(tmp_path))
+
+
+def test_names_without_extension_get_apk(serve, tmp_path):
+    apk = make_apk()
+    server = serve(apk)
+    # Drive's direct links end in /download and send no Content-Disposition here
+    path = download_file(server.url.replace("/app.apk", "/download?id=abc"), str(tmp_path))
+    assert os.path.basename(path) == "download.apk"
+    assert open(path, "rb").read() == apk
+
+
+def test_rejects_truncated_archive(serve, tmp_path):
+    server = serve(make_apk()[:-200])
+    with pytest.raises(IntegrityError):
+        download_file(server.url, str(tmp_path))
+    # Corrupt bytes are neither renamed into place nor kept for resuming
+    assert not [name for name in os.listdir(tmp_path) if name.endswith((".apk", ".part"))]
@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "backend"))
+
+pytest.importorskip("fastapi")  # ws_channels types its sockets with fastapi.WebSocket
+
+from event_log import EventLog
+from runner_bus import RunnerBus
+from ws_channels import ClientConnection, channel_of
+
+
+class RecordingSocket:
+    """What a dashboard tab receives."""
+
+    def __init__(self):
+        self.frames: list[dict] = []
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        raise AssertionError("json client got a binary frame")
+
+    async def close(self):
+        pass
+
+
+def test_run_scoped_subscription_receives_runner_logs(tmp_path):
+    async def scenario():
+        event_log = EventLog(log_dir=str(tmp_path))
+        socket = RecordingSocket()
+        client = ClientConnection(socket)
+        client.start()
+
+        # What ConnectionManager.broadcast does in server.py
+        async def broadcast(message):
+            message = event_log.append(message)
+            client.offer(message, channel_of(message))
+
+        bus = RunnerBus(broadcast, {})
+        await bus.start(socket_path="")
+        run_id = event_log.start_run()
+        client.configure({"action": "subscribe", "channels": [f"logs:{run_id}"]})
+
+        # Exactly what tests/test_runner.send_log publishes: no run_id in the payload
+        bus.push("/api/log-step", {"message": "Running Login", "status": "INFO"})
+        for _ in range(50):
+            if socket.frames:
+                break
+            await asyncio.sleep(0.01)
+        await bus.stop()
+        await client.close()
+        return run_id, socket.frames
+
+    run_id, frames = asyncio.run(scenario())
+    assert [(f["type"], f["run_id"], f["payload"]["message"]) for f in frames] == [("LOG", run_id, "Running Login")]
+
+
+def test_channel_key_falls_back_to_the_stamped_run_id():
+    message = {"type": "LOG", "payload": {"message": "x"}, "run_id": "a", "seq": 1}
+    assert channel_of(message) == ("logs", "a")
+    # A key in the payload wins over the one event_log stamped
+    assert channel_of({**message, "payload": {"run_id": "b"}}) == ("logs", "b")
@@ -3,13 +3,13 @@ import allure
 import pytest
 import json
 import os
-import subprocess  # Required for ADB commands
 from appium.webdriver.common.appiumby import AppiumBy
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.actions.action_builder import ActionBuilder
-from selenium.webdriver.common.actions.pointer_input import PointerInput
-from selenium.webdriver.common.actions import interaction
+from utils.gestures import tap, scroll
+from utils.wait_utils import scroll_into_view
+from utils import healing
+from utils.adb_session import get_session
 
 @allure.epic("Login & Farmer Flow")
 @allure.feature("Authentication & Data Entry")
@@ -24,55 +24,32 @@ class TestLogin:
 
     # --- HELPER METHODS ---
 
-    def input_text_via_adb(self, text):
-        """Forces text input using Android ADB commands"""
+    def input_text_via_adb(self, driver, text):
+        """Forces text input using Android ADB commands (text + hide keyboard in one round trip)"""
         try:
             print(f"   -> Attempting ADB input for '{text}'...")
-            formatted_text = text.replace(" ", "%s")
-            subprocess.run(f"adb shell input text {formatted_text}", shell=True)
-            time.sleep(1)
-            subprocess.run("adb shell input keyevent 111", shell=True) # Hide Keyboard
-            return True
+            # The session's own device: with several attached, adb needs the serial
+            results = get_session((driver.capabilities or {}).get("udid")).input_text(text)
+            return all(r.ok for r in results)
         except Exception as e:
             print(f"ADB Input failed: {e}")
             return False
 
     def tap_at_coordinates(self, driver, x, y):
-        """Reliable tap using W3C Actions"""
+        """Reliable tap (mobile: clickGesture, W3C fallback)"""
         try:
             print(f"   -> Tapping coordinates: {x}, {y}")
-            actions = ActionBuilder(driver)
-            p = PointerInput(interaction.POINTER_TOUCH, "finger")
-            actions.pointer_action.move_to_location(x, y)
-            actions.pointer_action.pointer_down()
-            actions.pointer_action.pause(0.2)
-            actions.pointer_action.pointer_up()
-            actions.perform()
+            tap(driver, x, y)
             return True
         except Exception as e:
             print(f"Coordinate tap failed: {e}")
             return False
 
     def perform_scroll(self, driver):
-        """Performs a single swipe up (scroll down) gesture"""
+        """Performs a single scroll down; returns False once the content cannot scroll further"""
         try:
-            size = driver.get_window_size()
-            start_x = size['width'] // 2
-            start_y = int(size['height'] * 0.8) # Start near bottom
-            end_y = int(size['height'] * 0.3)   # End near top
-            
-            print("   -> Scrolling down (Swipe Up)...")
-            actions = ActionBuilder(driver)
-            p = PointerInput(interaction.POINTER_TOUCH, "finger")
-            
-            actions.pointer_action.move_to_location(start_x, start_y)
-            actions.pointer_action.pointer_down()
-            actions.pointer_action.pause(0.2)
-            actions.pointer_action.move_to_location(start_x, end_y, duration=600) 
-            actions.pointer_action.pointer_up()
-            actions.perform()
-            time.sleep(1) 
-            return True
+            print("   -> Scrolling down...")
+            return scroll(driver, "down")
         except Exception as e:
             print(f"Scroll gesture failed: {e}")
             return False
@@ -83,19 +60,38 @@ class TestLogin:
         """
         if not xpath: return None
 
+        healed = healing.healed(AppiumBy.XPATH, xpath)
+        if healed:
+            element = driver.find_elements(*healed)
+            if element:
+                return element[0]
+
+        # One device-side search when the XPath translates to a UiSelector
+        element = scroll_into_view(driver, xpath=xpath, max_swipes=max_scrolls)
+        if element is not None:
+            healing.record(driver, AppiumBy.XPATH, xpath, element)
+            return element
+
+        at_end = False
         for i in range(max_scrolls + 1):
             try:
                 element = WebDriverWait(driver, 1).until(
                     EC.visibility_of_element_located((AppiumBy.XPATH, xpath))
                 )
+                healing.record(driver, AppiumBy.XPATH, xpath, element)
                 return element # Found it!
             except:
-                if i < max_scrolls:
+                if i < max_scrolls and not at_end:
                     print(f"   -> Element not visible yet. Scrolling ({i+1}/{max_scrolls})...")
-                    self.perform_scroll(driver)
+                    at_end = not self.perform_scroll(driver)
                 else:
-                    pass 
-        return None
+                    break
+        # Not there under this XPath: look for the element it used to match before giving up
+        try:
+            return healing.heal(driver, AppiumBy.XPATH, xpath)
+        except Exception as e:
+            print(f"   -> Healing failed: {e}")
+            return None
 
     def smart_click(self, driver, xpath, coordinates, element_name, timeout=5):
         """Tries to click via XPath (with Auto-Scroll). If fails, taps specific coordinates."""
@@ -148,7 +144,7 @@ class TestLogin:
                 print(f"[{element_name}] Method 2: Tapping {x},{y} and using ADB...")
                 self.tap_at_coordinates(driver, x, y)
                 time.sleep(1)
-                self.input_text_via_adb(text)
+                self.input_text_via_adb(driver, text)
                 return True
             except Exception as e:
                 print(f"[{element_name}] Method 2 failed: {e}")
@@ -175,9 +171,10 @@ class TestLogin:
 
     # --- TEST FLOW ---
 
+    @pytest.mark.smoke
     @allure.story("Login and Create Farmer")
     @allure.title("Verify user can login and add a new farmer")
-    def test_login_and_add_farmer(self, driver):
+    def test_login_and_add_farmer(self, driver, permissions_granted):
         
         print(f"\n--- STARTING TEST WITH LOGIN_METHOD: {self.LOGIN_METHOD} ---\n")
         
@@ -212,9 +209,11 @@ class TestLogin:
                 key = "next_button_language_login"
                 self.smart_click(driver, login_xpaths.get(key), login_coords.get(key), key)
 
-            with allure.step("2. Allow Notifications"):
-                key = "allow_notifications_button"
-                self.smart_click(driver, login_xpaths.get(key), login_coords.get(key), key, timeout=3)
+            # Skipped when granted at install: the coordinate fallback would tap the screen behind a missing dialog
+            if not permissions_granted:
+                with allure.step("2. Allow Notifications"):
+                    key = "allow_notifications_button"
+                    self.smart_click(driver, login_xpaths.get(key), login_coords.get(key), key, timeout=3)
 
             login_performed = False
             if self.LOGIN_METHOD == "PHONE":
@@ -243,7 +242,7 @@ class TestLogin:
                 ("allow_location_button", "Allow Location"),
                 ("allow_audio_button", "Allow Audio")
             ]
-            for key, desc in permissions_to_handle:
+            for key, desc in ([] if permissions_granted else permissions_to_handle):
                 with allure.step(f"4. Post-Login Permission: {desc}"):
                     self.smart_click(driver, login_xpaths.get(key), login_coords.get(key), key, timeout=3)
 
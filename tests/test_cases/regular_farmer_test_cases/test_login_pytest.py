@@ -1,4 +1,3 @@
-import time
 import allure
 import pytest
 from appium.webdriver.common.appiumby import AppiumBy
@@ -10,15 +9,18 @@ import json
 import os
 from selenium.common.exceptions import WebDriverException
 from utils.wait_utils import find_and_click
+from utils.state_snapshot import save_driver_state
+from utils import flow_recorder
 
 
 @allure.epic("Login Flow")
 @allure.feature("Authentication")
 class TestLogin:
 
+    @pytest.mark.smoke
     @allure.story("Successful Login")
     @allure.title("Verify user can login with valid credentials")
-    def test_login_success(self, driver):
+    def test_login_success(self, driver, permissions_granted):
         # This list will store the details of each step in the test flow
         test_flow_steps = []
 
@@ -71,30 +73,33 @@ class TestLogin:
                 test_flow_steps.append({"step": "Click Next button on language selection", "status": "Success"})
 
             
-            with allure.step("2. Allow picture"):
-                if not find_and_click(driver, AppiumBy.XPATH, allow_picture_button_xpath, "While using the app"):
-                    pytest.fail("Could not find or click the 'Allow picture' button.")
-                test_flow_steps.append({"step": "Allow picture permission", "status": "Success"})
-            
-            with allure.step("3. Allow location"):
-                if not find_and_click(driver, AppiumBy.XPATH, allow_location_button_xpath, "While using"):
-                    pytest.fail("Could not find or click the 'Allow location' button.")
-                test_flow_steps.append({"step": "Allow location permission", "status": "Success"})
+            # Permission dialogs only show when they were not granted at install (see test_permissions_pytest.py)
+            if not permissions_granted:
+                with allure.step("2. Allow picture"):
+                    if not find_and_click(driver, AppiumBy.XPATH, allow_picture_button_xpath, "While using the app"):
+                        pytest.fail("Could not find or click the 'Allow picture' button.")
+                    test_flow_steps.append({"step": "Allow picture permission", "status": "Success"})
 
-            with allure.step("4. Allow audio"):
-                if not find_and_click(driver, AppiumBy.XPATH, allow_audio_button_xpath, "While using the app"):
-                    pytest.fail("Could not find or click the 'Allow audio' button.")
-                test_flow_steps.append({"step": "Allow audio permission", "status": "Success"})
-            
-            with allure.step("5. Allow notifications"):
-                if not find_and_click(driver, AppiumBy.XPATH, allow_notifications_button_xpath, "Allow"):
-                    pytest.fail("Could not find or click the 'Allow notifications' button.")
-                test_flow_steps.append({"step": "Allow notifications permission", "status": "Success"})
+                with allure.step("3. Allow location"):
+                    if not find_and_click(driver, AppiumBy.XPATH, allow_location_button_xpath, "While using"):
+                        pytest.fail("Could not find or click the 'Allow location' button.")
+                    test_flow_steps.append({"step": "Allow location permission", "status": "Success"})
+
+                with allure.step("4. Allow audio"):
+                    if not find_and_click(driver, AppiumBy.XPATH, allow_audio_button_xpath, "While using the app"):
+                        pytest.fail("Could not find or click the 'Allow audio' button.")
+                    test_flow_steps.append({"step": "Allow audio permission", "status": "Success"})
+
+                with allure.step("5. Allow notifications"):
+                    if not find_and_click(driver, AppiumBy.XPATH, allow_notifications_button_xpath, "Allow"):
+                        pytest.fail("Could not find or click the 'Allow notifications' button.")
+                    test_flow_steps.append({"step": "Allow notifications permission", "status": "Success"})
 
             with allure.step("6. Enter phone number"):
                 phone_input = WebDriverWait(driver, 10).until(
                     EC.presence_of_element_located((AppiumBy.XPATH, phone_number_input_xpath))
                 )
+                flow_recorder.record(driver, "input", AppiumBy.XPATH, phone_number_input_xpath, phone_input, "7660852538")
                 phone_input.clear()
                 phone_input.send_keys("7660852538")
                 test_flow_steps.append({"step": "Enter valid phone number", "status": "Success", "value": "7660852538"})
@@ -105,10 +110,21 @@ class TestLogin:
                 test_flow_steps.append({"step": "Click Next after entering phone number", "status": "Success"})
             
             with allure.step("8. Wait for OTP and verify"):
-                time.sleep(20)
+                flow_recorder.wait(20, "Wait for OTP")
                 if not find_and_click(driver, AppiumBy.XPATH, verify_button_login_xpath, "Verify"):
                     pytest.fail("Could not find or click the 'Verify' button.")
                 test_flow_steps.append({"step": "Click Verify OTP", "status": "Success"})
+
+            with allure.step("9. Save logged-in state for later modules"):
+                # Only snapshot once the dashboard is up, i.e. the session token has been stored
+                try:
+                    WebDriverWait(driver, 30).until(
+                        EC.presence_of_element_located((AppiumBy.XPATH, add_farm_button_xpath))
+                    )
+                    if save_driver_state(driver):
+                        test_flow_steps.append({"step": "Save logged-in state", "status": "Success"})
+                except Exception as e:
+                    print(f"⚠️ Logged-in state not saved: {e}")
             
                 
             # with allure.step("2. Allow picture"):
@@ -0,0 +1,72 @@
+import json
+import os
+import allure
+import pytest
+from appium.webdriver.common.appiumby import AppiumBy
+from utils.wait_utils import find_and_click
+from utils.apk_installer import local_apk_info, revoke_permissions, granted_permissions
+from utils.state_snapshot import device_serial, app_package
+
+
+@allure.epic("Login Flow")
+@allure.feature("Permissions")
+class TestPermissions:
+    """
+    Keeps coverage of the runtime permission dialogs, which the other modules skip
+    when the runner grants all permissions at install time.
+    """
+
+    # (locator key, fallback text, permission the dialog grants)
+    dialogs = [
+        ("allow_picture_button", "While using the app", "android.permission.CAMERA"),
+        ("allow_location_button", "While using", "android.permission.ACCESS_FINE_LOCATION"),
+        ("allow_audio_button", "While using the app", "android.permission.RECORD_AUDIO"),
+        ("allow_notifications_button", "Allow", "android.permission.POST_NOTIFICATIONS"),
+    ]
+
+    @pytest.mark.smoke
+    @allure.story("Permission dialogs")
+    @allure.title("Verify each runtime permission dialog appears and grants its permission")
+    def test_permission_dialogs(self, driver, request):
+        test_flow_steps = []
+
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        locators_path = os.path.join(project_root, "locators", "regular_farmer.json")
+        with open(locators_path, 'r') as f:
+            login_screen_xpaths = json.load(f).get("login_screen", {})
+
+        serial, package = device_serial(driver), app_package(driver)
+        if not serial:
+            pytest.skip("Appium did not report the device serial, which adb needs to revoke permissions")
+        requested = local_apk_info(request.config.getoption("--apk"))["permissions"]
+
+        try:
+            with allure.step("1. Revoke all runtime permissions and relaunch"):
+                driver.terminate_app(package)
+                revoke_permissions(serial, package, requested)
+                driver.activate_app(package)
+                test_flow_steps.append({"step": "Revoke permissions and relaunch", "status": "Success"})
+
+            with allure.step("2. Next button on language selection screen"):
+                if not find_and_click(driver, AppiumBy.XPATH, login_screen_xpaths.get("next_button_language_login"), "Next"):
+                    pytest.fail("Could not find or click the 'Next button on language selection' button.")
+                test_flow_steps.append({"step": "Click Next button on language selection", "status": "Success"})
+
+            for index, (key, fallback_text, permission) in enumerate(self.dialogs, start=3):
+                if permission not in requested:
+                    continue
+                with allure.step(f"{index}. Allow dialog: {key}"):
+                    if not find_and_click(driver, AppiumBy.XPATH, login_screen_xpaths.get(key), fallback_text):
+                        pytest.fail(f"Permission dialog for {permission} did not appear.")
+                    test_flow_steps.append({"step": f"Allow {permission}", "status": "Success"})
+
+            with allure.step(f"{len(self.dialogs) + 3}. Verify permissions were granted"):
+                granted = granted_permissions(serial, package)
+                missing = [p for _, _, p in self.dialogs if p in requested and p not in granted]
+                assert not missing, f"Dialogs were accepted but not granted: {', '.join(missing)}"
+                test_flow_steps.append({"step": "Verify granted permissions", "status": "Success"})
+
+        finally:
+            os.makedirs("test-flows", exist_ok=True)
+            with open("test-flows/permissions_flow.json", "w") as f:
+                json.dump(test_flow_steps, f, indent=4)
@@ -0,0 +1,42 @@
+import glob
+import json
+import os
+import allure
+import pytest
+from utils.flow_recorder import FLOW_DIR, TRACE_SUFFIX, at_start, load, replay
+
+# Traces recorded with --record-flows; nothing to replay until a passing run recorded one
+TRACES = sorted(glob.glob(os.path.join(FLOW_DIR, f"*{TRACE_SUFFIX}")))
+
+
+@allure.epic("Replay")
+@allure.feature("Recorded Flows")
+class TestReplay:
+
+    @pytest.mark.smoke
+    @allure.story("Replay a recorded flow")
+    @pytest.mark.parametrize(
+        "trace",
+        TRACES or [pytest.param(None, marks=pytest.mark.skip(reason="No recorded flows (run with --record-flows)"))],
+        ids=lambda path: os.path.basename(path).removesuffix(TRACE_SUFFIX) if path else "none",
+    )
+    def test_replay(self, driver, permissions_granted, request, trace):
+        setup, _ = load(trace)
+        fixtures = setup.get("fixtures", {})
+
+        # The recorded test's preconditions: without them the trace starts on another screen
+        with allure.step("Set up the recorded preconditions"):
+            if "permissions_granted" in fixtures and fixtures["permissions_granted"] != permissions_granted:
+                pytest.skip(f"Recorded with permissions_granted={fixtures['permissions_granted']}")
+            if fixtures.get("logged_in") and not request.getfixturevalue("logged_in"):
+                pytest.skip("Recorded from the logged-in state, which could not be restored")
+            if not at_start(driver, setup):
+                pytest.skip("The app is not on the screen the trace starts from")
+
+        with allure.step(f"Replay {os.path.basename(trace)}"):
+            result = replay(driver, trace)
+        allure.attach(json.dumps(result, indent=2), name="Replay Result", attachment_type=allure.attachment_type.JSON)
+        print(
+            f"🎬 {result['flow']}: {result['fast']}/{result['steps']} steps from the trace, "
+            f"{result['resolved']} resolved, {result['seconds']}s vs {result['recorded_seconds']}s recorded"
+        )
@@ -1,23 +1,70 @@
 import os
+import glob
+import json
 import shutil
+import asyncio
 # Disable auto-loading of 3rd-party pytest plugins (like browserstack)
 os.environ["PYTEST_DISABLE_PLUGIN_AUTOLOAD"] = "1"
 import sys
 import pytest
 import allure_pytest  # pip install allure-pytest
 import requests
-import subprocess
 from dotenv import load_dotenv
 from typing import Optional, List, Dict
 
 load_dotenv()
 
-BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
-CURRENT_PROC: Optional[subprocess.Popen] = None
+# Make `utils.*` importable the same way the test modules import it
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if TESTS_DIR not in sys.path:
+    sys.path.insert(0, TESTS_DIR)
+# ...and the backend's flat modules the way server.py imports them (allure_manager), also when run standalone
+BACKEND_DIR = os.path.join(os.path.dirname(TESTS_DIR), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from utils.apk_installer import preinstall_apk, list_devices
+from scheduler import (
+    collect_nodes, run_sharded_async, record_durations, load_durations,
+    load_lastfailed, order_modules, dependency_waves, prerequisites,
+)
+from impact_analysis import analyze_impact
+from utils.instrumentation import merge_profiles, format_hotspots
+from utils.command_trace import load_trace, summarize, format_summary
+from utils import healing
+from event_transport import select_transport
+from allure_manager import allure_command
+
+CURRENT_PROC: Optional[asyncio.subprocess.Process] = None
+RUNNING_PROCS: dict = {}  # All live pytest processes -> the event loop driving them (several when sharding)
+# Longest single line of pytest output read from the pipe; longer lines are skipped with a warning
+PIPE_LINE_LIMIT = 1024 * 1024
+# The backend's RunnerBus when the runner runs inside its process (see set_local_backend)
+LOCAL_BACKEND = None
+TRANSPORT = None  # chosen lazily by event_transport.select_transport
 STOP_FLAG = False  # New global flag to control execution flow
 
 RESULTS_DIR = "allure-results"
 REPORT_DIR = "allure-report"
+# Per-run timing profiles (hotspots.json + run.folded flamegraph input); empty PROFILE_DIR disables profiling
+PROFILE_DIR = os.getenv("PROFILE_DIR", "test-profiles")
+# WebDriver command traces (one JSONL per pytest process); empty TRACE_DIR disables tracing
+TRACE_DIR = os.getenv("TRACE_DIR", "command-traces")
+
+# UiAutomator2 needs a distinct systemPort per parallel session on one Appium server
+SYSTEM_PORT_BASE = 8200
+
+# Lease Appium servers from the backend's pool (one server per device); falls back to
+# the default server + SYSTEM_PORT_BASE when the backend cannot provide one
+USE_APPIUM_POOL = os.getenv("USE_APPIUM_POOL", "1") != "0"
+APPIUM_LEASE_TIMEOUT = 90
+
+# Abort the run once this many modules failed (0 = run everything)
+MAX_FAILURES = int(os.getenv("MAX_FAILURES", "0"))
+
+# Grant every runtime permission at install time so tests skip the permission dialogs
+# (test_permissions_pytest.py still covers the dialogs themselves)
+GRANT_PERMISSIONS = os.getenv("GRANT_PERMISSIONS", "1") != "0"
 
 # --- CONFIGURATION: Test Registry for Krishivaas Apps ---
 # Define the mapping of App Types -> Modules -> Script Paths here.
@@ -52,95 +99,75 @@ def _ensure_clean_allure_dirs(project_root: str) -> None:
     if os.path.isdir(report_path):
         shutil.rmtree(report_path, ignore_errors=True)
 
-def generate_report(project_root: Optional[str] = None) -> None:
+async def generate_report_async(project_root: Optional[str] = None) -> None:
     """
-    Generates and opens Allure HTML report.
-    Can be called manually or automatically.
+    Generates the Allure HTML report and asks the backend to serve it.
+    Safe to await on the backend's event loop: `allure generate` runs as an async subprocess.
     """
     if project_root is None:
         project_root = os.path.dirname(os.path.dirname(__file__))
 
-    # improved command resolution
-    allure_cmd = "allure"
-    # specific check for user's scoop path if regular allure isn't found
-    scoop_path = r"C:\Users\Pramo\scoop\shims\allure.cmd" 
-    if os.path.exists(scoop_path):
-        allure_cmd = scoop_path
-    elif shutil.which("allure.cmd"):
-        allure_cmd = "allure.cmd"
-    
     try:
         send_log("Generating Allure HTML report...", "INFO")
-        # 1. Generate
-        subprocess.run(
-            [allure_cmd, "generate", RESULTS_DIR, "-o", REPORT_DIR, "--clean"],
+        # No shell: shutil.which already resolves allure.cmd through PATHEXT on Windows
+        proc = await asyncio.create_subprocess_exec(
+            allure_command(), "generate", RESULTS_DIR, "-o", REPORT_DIR, "--clean",
             cwd=project_root,
-            check=True,
-            shell=True 
         )
+        if await proc.wait() != 0:
+            raise RuntimeError(f"allure generate exited with {proc.returncode}")
         send_log("Allure HTML report generated.", "SUCCESS")
-        
-        # 2. Open
-        send_log("Opening Allure report in browser...", "INFO")
-        subprocess.Popen(
-            [allure_cmd, "open", REPORT_DIR],
-            cwd=project_root,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            shell=True
-        )
+        # The backend serves it (static mount or its one shared `allure open`), see backend/allure_manager.py
+        notify_allure_open()
     except Exception as e:
-        send_log(f"Failed to generate/open report: {e}", "FAILED")
+        send_log(f"Failed to generate report: {e}", "FAILED")
         print(f"Report Generation Error: {e}")
-        
-def _generate_and_open_allure_report(project_root: str) -> None:
+
+def generate_report(project_root: Optional[str] = None) -> None:
     """
-    Generates and opens Allure HTML report.
+    Blocking generate_report_async, for the runner thread and manual calls.
     """
-    allure_cmd = r"C:\Users\Pramo\scoop\shims\allure"
+    asyncio.run(generate_report_async(project_root))
 
-    # Fallback to system 'allure' if the hardcoded path doesn't exist
-    if not os.path.exists(allure_cmd) and shutil.which("allure"):
-        allure_cmd = "allure" 
+def set_local_backend(bus) -> None:
+    """
+    Called by the backend when it imports the runner, with its RunnerBus (backend/runner_bus.py).
+    Log lines and module statuses then go straight into its broadcaster instead of over loopback HTTP.
+    Pass None to go back to the socket / HTTP transports.
+    """
+    global LOCAL_BACKEND, TRANSPORT
+    LOCAL_BACKEND = bus
+    TRANSPORT = None
 
-    try:
-        send_log("Generating Allure HTML report...", "INFO")
-        subprocess.run(
-            [allure_cmd, "generate", RESULTS_DIR, "-o", REPORT_DIR, "--clean"],
-            cwd=project_root,
-            check=True,
-            shell=True
-        )
-        send_log("Allure HTML report generated.", "SUCCESS")
-        send_log("Opening Allure report in browser...", "INFO")
-        subprocess.Popen(
-            [allure_cmd, "open", REPORT_DIR],
-            cwd=project_root,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            shell=True
-        )
-    except Exception as e:
-        send_log(f"Allure CLI not found or failed: {e}", "FAILED")
+def _transport():
+    global TRANSPORT
+    if TRANSPORT is None:
+        TRANSPORT = select_transport(LOCAL_BACKEND)
+    return TRANSPORT
+
+def _post(path: str, payload: dict, timeout: float, wait: bool = False) -> Optional[dict]:
+    """
+    Send `payload` to a backend endpoint over the cheapest transport (see event_transport.py).
+    Returns the response when `wait`; raises when the backend refused the request.
+    """
+    if wait:
+        return _transport().call(path, payload, timeout)
+    _transport().send(path, payload, timeout)
+    return None
 
 def notify_allure_open() -> None:
     """
-    Ask backend to start Allure server (allure open/serve) and broadcast RUN_COMPLETE.
-    Backend should implement POST /api/allure/start.
+    Ask the backend for the report URL (POST /api/allure/start); it broadcasts RUN_COMPLETE with it.
     """
     try:
-        requests.post(f"{BACKEND_URL}/api/allure/start", timeout=10)
+        _post("/api/allure/start", {}, timeout=10)
     except Exception:
         pass
 
 def send_log(message: str, status: str = "INFO") -> None:
     """Send one log line to the frontend via /api/log-step."""
     try:
-        requests.post(
-            f"{BACKEND_URL}/api/log-step",
-            json={"message": message, "status": status},
-            timeout=3,
-        )
+        _post("/api/log-step", {"message": message, "status": status}, timeout=3)
     except Exception:
         # Don't break tests if backend logging fails
         pass
@@ -148,66 +175,123 @@ def send_log(message: str, status: str = "INFO") -> None:
 def run_pytest_with_logs(pytest_args, module_name: str) -> bool:
   """
   Run pytest in a subprocess and stream all stdout lines
-  into the WebSocket log console.
+  into the WebSocket log console (same as run_pytest_streaming), on an event loop of its own.
   """
-  send_module_status(module_name, "running", f"Starting {module_name} tests")
-  send_log(f"==== Running {module_name} tests ====", "INFO")
-
-  # Build command: python -m pytest <args>
-  cmd = [os.sys.executable, "-m", "pytest"] + pytest_args
-
-  proc = subprocess.Popen(
-    cmd,
-    stdout=subprocess.PIPE,
-    stderr=subprocess.STDOUT,
-    text=True,
-    bufsize=1,
-    cwd=os.path.dirname(os.path.dirname(__file__)),  # project root
-  )
-
-  # Stream each line to frontend
-  assert proc.stdout is not None
-  for line in proc.stdout:
-    send_log(line.rstrip("\n"), "INFO")
-
-  proc.wait()
-  success = (proc.returncode == 0)
-
-  if success:
-    send_module_status(module_name, "completed", f"{module_name} tests passed")
-    send_log(f"{module_name} tests passed", "SUCCESS")
-  else:
-    send_module_status(module_name, "failed", f"{module_name} tests failed")
-    send_log(f"{module_name} tests failed", "FAILED")
-
-  return success
+  async def run():
+    writer = _LogWriter()
+    try:
+      return await run_pytest_streaming(pytest_args, module_name, writer)
+    finally:
+      await writer.close()
+  return asyncio.run(run())
+
+def lease_appium(udid: Optional[str] = None) -> Optional[dict]:
+    """Lease a pooled Appium server for `udid` (see backend/appium_pool.py). None when unavailable."""
+    if not USE_APPIUM_POOL:
+        return None
+    try:
+        return _post(
+            "/api/appium/lease",
+            {"udid": udid, "timeout": APPIUM_LEASE_TIMEOUT},
+            timeout=APPIUM_LEASE_TIMEOUT + 60,  # may include starting the server
+            wait=True,
+        )
+    except requests.ConnectionError:
+        pass  # no backend at all: the default server
+    except Exception as e:
+        send_log(f"No pooled Appium server for {udid or 'this run'}: {e}", "WARNING")
+    return None
+
+def release_appium(lease: Optional[dict]) -> None:
+    if not lease:
+        return
+    try:
+        _post("/api/appium/release", {"lease_id": lease["lease_id"]}, timeout=5)
+    except Exception:
+        pass
+
+def appium_args(lease: Optional[dict], system_port: Optional[int] = None) -> list[str]:
+    """pytest options pointing the driver fixture at a leased server (or the defaults without one)."""
+    if not lease:
+        return [f"--system-port={system_port}"] if system_port else []
+    return [
+        f"--appium-url={lease['url']}",
+        f"--system-port={lease['system_port']}",
+        f"--chromedriver-port={lease['chromedriver_port']}",
+    ]
 
 def send_module_status(module: str, status: str, message: str = ""):
     """Notify backend which module is running/completed."""
     try:
-        requests.post(
-            f"{BACKEND_URL}/api/module-status",
-            json={"module": module, "status": status, "message": message},
-            timeout=3,
-        )
+        _post("/api/module-status", {"module": module, "status": status, "message": message}, timeout=3)
     except Exception:
         # Do not break tests if backend is down
         pass
 
+class _LogWriter:
+    """
+    Publishes log lines and module statuses for the coroutines of a run. They only queue; ONE task
+    sends, in order, from a worker thread, since the HTTP and socket transports block on every event.
+    A pytest stream therefore never waits for the backend, and several shards never wait for each other.
+    """
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    def log(self, message: str, status: str = "INFO") -> None:
+        self.queue.put_nowait((send_log, (message, status)))
+
+    def module_status(self, module: str, status: str, message: str = "") -> None:
+        self.queue.put_nowait((send_module_status, (module, status, message)))
+
+    def skip_module(self, module_name: str, reason: str) -> None:
+        self.log(f"Skipping {module_name}: {reason}", "WARNING")
+        self.module_status(module_name, "skipped", reason)
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())  # whatever piled up meanwhile goes in one thread hop
+            await asyncio.to_thread(_publish, [item for item in batch if item is not None])
+            if batch[-1] is None:
+                return
+
+    async def close(self) -> None:
+        """Sends whatever is still queued; the writer is done afterwards."""
+        self.queue.put_nowait(None)
+        await self.task
+
+def _publish(batch) -> None:
+    for send, args in batch:
+        send(*args)  # send_log / send_module_status never raise
+
+async def _terminate(proc: asyncio.subprocess.Process, grace: float = 2) -> None:
+    if proc.returncode is not None:
+        return
+    try:
+        proc.terminate()
+        await asyncio.wait_for(proc.wait(), grace)
+    except asyncio.TimeoutError:
+        proc.kill()
+    except ProcessLookupError:
+        pass
+
 def stop_current_tests() -> bool:
     global CURRENT_PROC, STOP_FLAG
     STOP_FLAG = True  # Signal the runner loop to stop
 
-    if CURRENT_PROC is None:
+    procs = list(RUNNING_PROCS.items())
+    if not procs:
         return False
 
     try:
         send_log("Stopping tests on user request...", "FAILED")
-        CURRENT_PROC.terminate()
-        try:
-            CURRENT_PROC.wait(timeout=2)
-        except subprocess.TimeoutExpired:
-            CURRENT_PROC.kill()
+        # Each process belongs to the event loop of the runner thread that started it
+        futures = [asyncio.run_coroutine_threadsafe(_terminate(proc), loop) for proc, loop in procs]
+        for future in futures:
+            future.result(timeout=5)
         send_log("Test process terminated.", "FAILED")
     except Exception as e:
         send_log(f"Error while stopping tests: {e}", "FAILED")
@@ -216,21 +300,18 @@ def stop_current_tests() -> bool:
 
     return True
 
-def run_pytest_streaming(pytest_args: list[str], module_name: str, clean_allure: bool = False) -> bool:
+async def _run_pytest_process_async(
+    pytest_args: list[str], writer: _LogWriter, clean_allure: bool = False, log_prefix: str = ""
+) -> Optional[int]:
     """
-    Run pytest in a subprocess and stream ALL stdout lines to the frontend log console.
-    Also writes allure results to allure-results.
+    Runs one pytest subprocess, streaming every stdout line to the frontend log console through `writer`.
+    Returns the exit code, or None if the run was stopped by the user.
+    Any number of these can run concurrently on one event loop (see run_tests_sharded).
     """
-    global CURRENT_PROC, STOP_FLAG
-
-    if STOP_FLAG:
-        return False
+    global CURRENT_PROC
 
     project_root = os.path.dirname(os.path.dirname(__file__))
 
-    send_module_status(module_name, "running", f"Starting {module_name} tests")
-    send_log(f"==== Running {module_name} tests ====", "INFO")
-
     cmd = [
         sys.executable,
         "-m",
@@ -250,52 +331,290 @@ def run_pytest_streaming(pytest_args: list[str], module_name: str, clean_allure:
     env["PYTHONUTF8"] = "1"
     env["PYTHONUNBUFFERED"] = "1" # Force unbuffered output for real-time logs
 
-    CURRENT_PROC = subprocess.Popen(
-        cmd,
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
         cwd=project_root,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
         env=env,
+        limit=PIPE_LINE_LIMIT,
     )
+    CURRENT_PROC = proc
+    RUNNING_PROCS[proc] = asyncio.get_running_loop()
 
-    proc = CURRENT_PROC
-    assert proc.stdout is not None
-    for line in proc.stdout:
+    try:
+        assert proc.stdout is not None
+        while not STOP_FLAG: # Stop reading logs immediately
+            try:
+                line = await proc.stdout.readline()
+            except ValueError:  # asyncio drops a line longer than PIPE_LINE_LIMIT
+                writer.log(f"{log_prefix}<output line longer than {PIPE_LINE_LIMIT} bytes skipped>", "WARNING")
+                continue
+            if not line:
+                break
+            writer.log(log_prefix + line.decode("utf-8", errors="replace").rstrip("\r\n"), "INFO")
+
+        # If stopped, ensure we don't hang on wait()
         if STOP_FLAG:
-            break # Stop reading logs immediately
-        send_log(line.rstrip("\n"), "INFO")
-
-    # If stopped, ensure we don't hang on wait()
+            if proc.returncode is None:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+            return None
+
+        return await proc.wait()
+    finally:
+        RUNNING_PROCS.pop(proc, None)
+        if CURRENT_PROC is proc:
+            CURRENT_PROC = None
+
+async def run_pytest_streaming(
+    pytest_args: list[str],
+    module_name: str,
+    writer: _LogWriter,
+    clean_allure: bool = False,
+    allow_no_tests: bool = False,
+) -> bool:
+    """
+    Run pytest in a subprocess and stream ALL stdout lines to the frontend log console.
+    Also writes allure results to allure-results.
+    allow_no_tests: treat "no tests collected" (exit code 5, e.g. a module without smoke tests) as a pass.
+    """
     if STOP_FLAG:
-        if proc.poll() is None:
-             try:
-                 proc.kill()
-             except:
-                 pass
-             
+        return False
+
+    writer.module_status(module_name, "running", f"Starting {module_name} tests")
+    writer.log(f"==== Running {module_name} tests ====", "INFO")
+
+    returncode = await _run_pytest_process_async(pytest_args, writer, clean_allure=clean_allure)
+
+    if returncode is None:
         # FIX: Notify frontend that this specific module failed/stopped
-        send_module_status(module_name, "failed", "Stopped by user")
+        writer.module_status(module_name, "failed", "Stopped by user")
         return False
-    
-    proc.wait()
-    ok = proc.returncode == 0
-    CURRENT_PROC = None
 
     if STOP_FLAG: # Double check in case flag was set during wait
-        send_log("Test execution interrupted.", "FAILED")
+        writer.log("Test execution interrupted.", "FAILED")
         return False
 
+    ok = returncode == 0 or (allow_no_tests and returncode == 5)
     if ok:
-        send_module_status(module_name, "completed", f"{module_name} tests passed")
-        send_log(f"{module_name} tests passed", "SUCCESS")
+        writer.module_status(module_name, "completed", f"{module_name} tests passed")
+        writer.log(f"{module_name} tests passed", "SUCCESS")
     else:
-        send_module_status(module_name, "failed", f"{module_name} tests failed")
-        send_log(f"{module_name} tests failed", "FAILED")
+        writer.module_status(module_name, "failed", f"{module_name} tests failed")
+        writer.log(f"{module_name} tests failed", "FAILED")
 
     return ok
 
+async def run_tests_sharded(
+    apk_path: str,
+    test_list: List[Dict[str, str]],
+    devices: List[str],
+    writer: _LogWriter,
+    smoke_modules: Optional[set] = None,
+    max_failures: int = 0,
+    extra_args: Optional[List[str]] = None,
+) -> bool:
+    """
+    Runs the selected modules on several devices at once.
+    Work is split per test node (not per file) by recorded duration, and devices that
+    finish early steal pending tests from the busiest one (see scheduler.py).
+    Modules run in dependency waves: a wave only starts once its prerequisites finished,
+    and dependents of a failed module are skipped. Last run's failures go first on each device.
+    Modules in `smoke_modules` only contribute their @pytest.mark.smoke tests.
+    """
+    project_root = os.path.dirname(os.path.dirname(__file__))
+    smoke_modules = smoke_modules or set()
+    lastfailed = load_lastfailed()
+
+    failed_modules = set()  # ran and failed: only these spend the max-failures budget
+    skipped_modules = set()  # never ran (prerequisite failed or budget spent)
+
+    def budget_exhausted():
+        return bool(max_failures) and len(failed_modules) >= max_failures
+
+    # Start every shard from an empty allure-results (batches must not clean each other's results)
+    shutil.rmtree(os.path.join(project_root, RESULTS_DIR), ignore_errors=True)
+    os.makedirs(os.path.join(project_root, RESULTS_DIR), exist_ok=True)
+
+    for wave in dependency_waves(test_list):
+        if STOP_FLAG:
+            break
+
+        runnable = []
+        for test_config in wave:
+            name = test_config["name"]
+            blocked = [p for p in prerequisites(test_config, test_list) if p in failed_modules | skipped_modules]
+            if blocked:
+                skipped_modules.add(name)
+                writer.skip_module(name, f"prerequisite {', '.join(blocked)} failed")
+            elif budget_exhausted():
+                skipped_modules.add(name)
+                writer.skip_module(name, f"max failures ({max_failures}) reached")
+            else:
+                runnable.append(test_config)
+
+        # Node id -> module name, so the UI still gets per-module status
+        module_of = {}
+        for test_config in runnable:
+            extra = ["-m", "smoke"] if test_config.get("name") in smoke_modules else []
+            for nodeid in await asyncio.to_thread(collect_nodes, [test_config["path"], *extra]):
+                module_of[nodeid] = test_config["name"]
+        if not module_of:
+            continue
+
+        pending = {}
+        for nodeid, module in module_of.items():
+            pending.setdefault(module, set()).add(nodeid)
+
+        writer.log(f"Sharding {len(module_of)} tests across {len(devices)} devices: {', '.join(devices)}", "INFO")
+        for module in pending:
+            writer.module_status(module, "running", f"Starting {module} tests")
+
+        async def run_batch(device, index, nodeids):
+            durations_path = os.path.join(project_root, RESULTS_DIR, f".durations-{device}.json".replace(":", "_"))
+            writer.log(f"[{device}] Running {len(nodeids)} test(s): {', '.join(n.split('::')[-1] for n in nodeids)}", "INFO")
+            lease = await asyncio.to_thread(lease_appium, device)
+            try:
+                returncode = await _run_pytest_process_async(
+                    [
+                        *nodeids,
+                        f"--rootdir={project_root}",
+                        f"--apk={apk_path}",
+                        f"--udid={device}",
+                        *appium_args(lease, SYSTEM_PORT_BASE + index),
+                        f"--durations-file={durations_path}",
+                        *(extra_args or []),
+                    ],
+                    writer,
+                    log_prefix=f"[{device}] ",
+                )
+            finally:
+                await asyncio.to_thread(release_appium, lease)
+            if os.path.exists(durations_path):
+                record_durations(load_durations(durations_path))
+                os.remove(durations_path)
+
+            ok = returncode == 0
+            for nodeid in nodeids:
+                module = module_of[nodeid]
+                if not ok:
+                    failed_modules.add(module)
+                pending[module].discard(nodeid)
+                if not pending[module] and returncode is not None:
+                    if module in failed_modules:
+                        writer.module_status(module, "failed", f"{module} tests failed")
+                    else:
+                        writer.module_status(module, "completed", f"{module} tests passed")
+            return ok
+
+        await run_sharded_async(
+            list(module_of),
+            devices,
+            run_batch,
+            should_stop=lambda: STOP_FLAG or budget_exhausted(),
+            first=lastfailed,
+        )
+
+        # Modules whose nodes never started because the budget ran out
+        for module, nodes in pending.items():
+            if nodes and not STOP_FLAG:
+                skipped_modules.add(module)
+                writer.skip_module(module, f"max failures ({max_failures}) reached")
+
+    if budget_exhausted():
+        writer.log(f"Run aborted early: {len(failed_modules)} module(s) failed (max failures = {max_failures}).", "FAILED")
+    return not failed_modules and not skipped_modules
+
+async def run_tests_sequential(
+    apk_path: str,
+    test_list: List[Dict[str, str]],
+    device: Optional[str],
+    writer: _LogWriter,
+    smoke_modules: Optional[set] = None,
+    max_failures: int = 0,
+    extra_args: Optional[List[str]] = None,
+) -> tuple[bool, bool]:
+    """
+    Runs the selected modules one after the other, on `device` (or whichever one Appium picks).
+    Dependents of a failed or skipped module are skipped. Returns (all passed, anything ran).
+    """
+    project_root = os.path.dirname(os.path.dirname(__file__))
+    smoke_modules = smoke_modules or set()
+    overall_ok = True
+    tests_executed = False # Track if any test actually ran
+
+    failed_modules = set()  # ran and failed: only these spend the max-failures budget
+    skipped_modules = set()  # never ran; like failed ones, their dependents are skipped
+    lease = await asyncio.to_thread(lease_appium, device)
+    extra_args = list(extra_args or []) + appium_args(lease)
+    try:
+        for index, test_config in enumerate(test_list):
+            if STOP_FLAG:
+                writer.log("Sequence stopped by user.", "WARNING")
+                break
+            module_name = test_config.get("name", f"Module {index + 1}")
+            script_path = test_config.get("path")
+
+            blocked = [p for p in prerequisites(test_config, test_list) if p in failed_modules | skipped_modules]
+            if blocked:
+                skipped_modules.add(module_name)
+                overall_ok = False
+                writer.skip_module(module_name, f"prerequisite {', '.join(blocked)} failed")
+                continue
+            if max_failures and len(failed_modules) >= max_failures:
+                skipped_modules.add(module_name)
+                overall_ok = False
+                writer.skip_module(module_name, f"max failures ({max_failures}) reached")
+                continue
+
+            # Verify script exists before running
+            full_script_path = os.path.join(project_root, script_path) if script_path else ""
+            if not script_path or not os.path.exists(full_script_path):
+                writer.log(f"Skipping {module_name}: Script not found at {script_path}", "WARNING")
+                continue
+
+            # Only clean allure results on the FIRST module
+            should_clean = (index == 0)
+
+            # Record per-test durations so later multi-device runs can balance their shards
+            durations_path = os.path.join(project_root, RESULTS_DIR, ".durations.json")
+            pytest_args = [
+                script_path, f"--apk={apk_path}", "-v", f"--rootdir={project_root}", f"--durations-file={durations_path}",
+                *extra_args,
+            ]
+            is_smoke = module_name in smoke_modules
+            if is_smoke:
+                writer.log(f"{module_name} is not affected by this build: smoke tests only", "INFO")
+                pytest_args += ["-m", "smoke"]
+            module_ok = await run_pytest_streaming(
+                pytest_args,
+                module_name,
+                writer,
+                clean_allure=should_clean,
+                allow_no_tests=is_smoke,
+            )
+            if os.path.exists(durations_path):
+                record_durations(load_durations(durations_path))
+                os.remove(durations_path)
+            tests_executed = True # Mark that we actually ran something
+            overall_ok = overall_ok and module_ok
+            if not module_ok:
+                failed_modules.add(module_name)
+
+            # Stop sequence if user requested stop
+            if STOP_FLAG:
+                break
+    finally:
+        await asyncio.to_thread(release_appium, lease)
+
+    if max_failures and len(failed_modules) >= max_failures and not STOP_FLAG:
+        writer.log(f"Run aborted early: {len(failed_modules)} module(s) failed (max failures = {max_failures}).", "FAILED")
+    return overall_ok, tests_executed
+
 # def resolve_test_modules(app_type: str, module_names: Optional[List[str]] = None) -> List[Dict[str, str]]:
 #     """
 #     Helper to resolve a list of runnable test configs based on the app type and selected modules.
@@ -323,24 +642,99 @@ def run_pytest_streaming(pytest_args: list[str], module_name: str, clean_allure:
             
 #     return resolved_tests
 
+async def _run_modules_async(
+    apk_path: str,
+    test_list: List[Dict[str, str]],
+    devices: List[str],
+    smoke_modules: set,
+    max_failures: int,
+    extra_args: List[str],
+    profile_dir: Optional[str],
+    trace_dir: Optional[str],
+) -> None:
+    """
+    Steps 3 and 4 of run_tests_and_get_suggestions: ONE event loop drives every pytest process,
+    every log stream and the report, whether the modules run sharded or one after the other.
+    """
+    project_root = os.path.dirname(os.path.dirname(__file__))
+    runnable = [
+        t for t in test_list
+        if t.get("path") and os.path.exists(os.path.join(project_root, t["path"]))
+    ]
+    writer = _LogWriter()
+    try:
+        if len(devices) > 1 and runnable:
+            overall_ok = await run_tests_sharded(apk_path, runnable, devices, writer, smoke_modules, max_failures, extra_args)
+            tests_executed = True
+        else:
+            overall_ok, tests_executed = await run_tests_sequential(
+                apk_path, test_list, devices[0] if len(devices) == 1 else None, writer,
+                smoke_modules, max_failures, extra_args,
+            )
+    finally:
+        await writer.close()  # everything below is logged after the last pytest line
+    # Every pytest process saved its own healing records; no process is left to race the merge
+    healing.merge_records()
+
+    if not tests_executed:
+        send_log("No tests were executed (all skipped or missing). Skipping report generation.", "WARNING")
+        return
+    
+    # Don't generate report if stopped mid-way by user
+    if STOP_FLAG:
+        send_log("Tests stopped by user. Partial report available on request.", "WARNING")
+        return
+
+    if overall_ok:
+        send_log("All selected modules passed", "SUCCESS")
+    else:
+        send_log("Some modules failed", "FAILED")
+
+    if profile_dir and os.path.isdir(profile_dir):
+        for line in format_hotspots(merge_profiles(profile_dir)):
+            send_log(line, "INFO")
+    if trace_dir and os.path.isdir(trace_dir):
+        summary = summarize(load_trace(glob.glob(os.path.join(trace_dir, "trace-*.jsonl"))))
+        with open(os.path.join(trace_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        for line in format_summary(summary):
+            send_log(line, "INFO")
+
+    # 4. Generate and Open Report
+    await generate_report_async(project_root)  # also notifies the backend
+
 def run_tests_and_get_suggestions(
     apk_path: str, 
     tests_to_run: Optional[List[Dict[str, str]]] = None,
     app_type: Optional[str] = None,
-    module_names: Optional[List[str]] = None
+    module_names: Optional[List[str]] = None,
+    preinstall: bool = True,
+    warm_up: bool = False,
+    parallel: Optional[bool] = None,
+    selection: str = "all",
+    max_failures: Optional[int] = None,
+    grant_permissions: Optional[bool] = None,
 ) -> None:
     """
     Entry point called from FastAPI or CLI.
-    Runs tests -> generates Allure report -> asks backend to open Allure server.
+    Pre-installs APK -> runs tests -> generates Allure report -> asks backend to open Allure server.
     
     :param apk_path: Path to the APK file.
     :param tests_to_run: Direct list of modules (overrides app_type logic if provided).
     :param app_type: If provided, resolves tests from TEST_REGISTRY.
     :param module_names: Specific modules to run for the app_type.
+    :param preinstall: Install the APK on all connected devices in parallel before the first session.
+    :param warm_up: Also dexopt + cold start the app once per device (for timing-sensitive tests).
+    :param parallel: Shard tests across all connected devices. None = automatically when more than one is connected.
+    :param selection: "all" runs every module. "impacted" diffs the APK against the previous build and runs
+                      impacted modules first, then a smoke-only pass of the rest. "impacted-only" skips the rest.
+    :param max_failures: Abort once this many modules failed (defaults to MAX_FAILURES, 0 = never).
+    :param grant_permissions: Pre-grant all runtime permissions (defaults to GRANT_PERMISSIONS).
     """
 
-    global STOP_FLAG
+    global STOP_FLAG, TRANSPORT
     STOP_FLAG = False  # Reset flag at start of new run
+    TRANSPORT = None  # the backend may have come up (or gone) since the last run
 
     project_root = os.path.dirname(os.path.dirname(__file__))
 
@@ -371,54 +765,65 @@ def run_tests_and_get_suggestions(
         send_log("No valid test modules found to run. Aborting.", "FAILED")
         return
 
-    # 2. Run the tests
-    overall_ok = True
-    tests_executed = False # Track if any test actually ran
-    for index, test_config in enumerate(final_test_list):
-        if STOP_FLAG:
-            send_log("Sequence stopped by user.", "WARNING")
-            break
-        module_name = test_config.get("name", f"Module {index + 1}")
-        script_path = test_config.get("path")
-        
-        # Verify script exists before running
-        full_script_path = os.path.join(project_root, script_path) if script_path else ""
-        if not script_path or not os.path.exists(full_script_path):
-            send_log(f"Skipping {module_name}: Script not found at {script_path}", "WARNING")
-            continue
-
-        # Only clean allure results on the FIRST module
-        should_clean = (index == 0)
-
-        module_ok = run_pytest_streaming(
-            [script_path, f"--apk={apk_path}", "-v"],
-            module_name=module_name,
-            clean_allure=should_clean,
-        )
-        tests_executed = True # Mark that we actually ran something
-        overall_ok = overall_ok and module_ok
-
-        # Stop sequence if user requested stop
-        if STOP_FLAG:
-            break
+    # 1b. Impact analysis: which modules can the changes in this build affect?
+    smoke_modules = set()
+    if selection in ("impacted", "impacted-only"):
+        impact = analyze_impact(apk_path, final_test_list)
+        if impact["diff"] is None:
+            send_log("No previous build of this app to compare with: running all modules.", "INFO")
+        else:
+            diff = impact["diff"]
+            send_log(
+                f"APK diff: {len(diff['strings_added']) + len(diff['strings_removed'])} UI strings/ids, "
+                f"{len(diff['layouts_changed'])} layouts, "
+                f"{len(diff['activities_added']) + len(diff['activities_removed'])} activities changed",
+                "INFO",
+            )
+            for name, why in impact["reasons"].items():
+                send_log(f"Impacted: {name} ({'; '.join(why[:3])})", "INFO")
+            if selection == "impacted-only":
+                for test_config in impact["unchanged"]:
+                    send_log(f"Skipping {test_config.get('name')}: not affected by this build", "INFO")
+                final_test_list = impact["impacted"]
+            else:
+                final_test_list = impact["impacted"] + impact["unchanged"]
+                smoke_modules = {t.get("name") for t in impact["unchanged"]}
+
+        if not final_test_list:
+            send_log("No module is affected by this build. Nothing to run.", "SUCCESS")
+            return
+
+    # 1c. Prerequisites first, and among the rest whatever failed last time
+    final_test_list = order_modules(final_test_list)
+    max_failures = MAX_FAILURES if max_failures is None else max_failures
+    grant_permissions = GRANT_PERMISSIONS if grant_permissions is None else grant_permissions
+    extra_args = ["--grant-permissions"] if grant_permissions else []
+    profile_dir = os.path.join(project_root, PROFILE_DIR) if PROFILE_DIR else None
+    if profile_dir:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        extra_args.append(f"--profile-dir={profile_dir}")
+    trace_dir = os.path.join(project_root, TRACE_DIR) if TRACE_DIR else None
+    if trace_dir:
+        shutil.rmtree(trace_dir, ignore_errors=True)
+        extra_args.append(f"--trace-dir={trace_dir}")
+
+    # 2. Install on every device up-front (Appium then finds the same version already installed)
+    if preinstall:
+        try:
+            preinstall_apk(apk_path, warm=warm_up, grant=grant_permissions, log=send_log)
+        except Exception as e:
+            send_log(f"APK pre-install failed, Appium will install it instead: {e}", "WARNING")
 
-    if not tests_executed:
-        send_log("No tests were executed (all skipped or missing). Skipping report generation.", "WARNING")
-        return
-    
-    # Don't generate report if stopped mid-way by user
     if STOP_FLAG:
-        send_log("Tests stopped by user. Partial report available on request.", "WARNING")
+        send_log("Sequence stopped by user.", "WARNING")
         return
 
-    if overall_ok:
-        send_log("All selected modules passed", "SUCCESS")
-    else:
-        send_log("Some modules failed", "FAILED")
+    # 3. Run the tests, 4. report (see _run_modules_async)
+    devices = list_devices() if parallel is not False else []
+    asyncio.run(_run_modules_async(
+        apk_path, final_test_list, devices, smoke_modules, max_failures, extra_args, profile_dir, trace_dir,
+    ))
 
-    # 3. Generate and Open Report
-    generate_report(project_root)
-    # notify_allure_open()
 
 if __name__ == "__main__":
     # CLI Usage: 
@@ -0,0 +1,161 @@
+import uuid
+import queue
+import shlex
+import atexit
+import threading
+import subprocess
+from dataclasses import dataclass
+
+# Seconds to wait for one batch to finish before the shell is considered hung
+DEFAULT_TIMEOUT = 30
+
+
+@dataclass
+class AdbResult:
+    command: str
+    returncode: int
+    output: str
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+class AdbSession:
+    """
+    One persistent `adb shell` per device. Commands are written to the shell's stdin
+    back to back, each followed by an `echo <sentinel><index>:$?` marker, so a whole batch
+    costs a single round trip and still reports one exit status per command.
+    Thread-safe: batches from several threads are serialised.
+    """
+
+    def __init__(self, serial: str | None = None, timeout: float = DEFAULT_TIMEOUT):
+        self.serial = serial
+        self.timeout = timeout
+        self.proc = None
+        self.lines = None
+        self.lock = threading.Lock()
+        self.sentinel = f"__ADB_RC_{uuid.uuid4().hex[:8]}_"
+
+    def _start(self):
+        cmd = ["adb"] + (["-s", self.serial] if self.serial else []) + ["shell", "sh"]
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        self.lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self.proc, self.lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(proc, lines):
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)  # shell exited
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def run_batch(self, commands: list[str], timeout: float | None = None) -> list[AdbResult]:
+        """
+        Runs `commands` in order in the device shell and returns one AdbResult per command.
+        A failing command does not stop the ones after it.
+        """
+        if not commands:
+            return []
+        with self.lock:
+            if not self.alive():
+                self._start()
+
+            script = "".join(
+                f"{{ {command} ; }} 2>&1; __rc=$?; echo \"\"; echo {self.sentinel}{index}:$__rc\n"
+                for index, command in enumerate(commands)
+            )
+            try:
+                self.proc.stdin.write(script)
+                self.proc.stdin.flush()
+            except (BrokenPipeError, OSError):
+                # The shell died between batches (device reconnected): start over once
+                self._start()
+                self.proc.stdin.write(script)
+                self.proc.stdin.flush()
+
+            results, output = [], []
+            while len(results) < len(commands):
+                try:
+                    line = self.lines.get(timeout=timeout or self.timeout)
+                except queue.Empty:
+                    self.close()
+                    raise TimeoutError(f"adb shell did not answer within {timeout or self.timeout}s: {commands[len(results)]}")
+                if line is None:
+                    self.proc = None
+                    raise ConnectionError(f"adb shell exited ({self.serial or 'default device'})")
+
+                if line.startswith(self.sentinel):
+                    # Output ends with the blank line echoed before the marker
+                    if output and output[-1] == "\n":
+                        output.pop()
+                    returncode = int(line[len(self.sentinel):].split(":", 1)[1])
+                    results.append(AdbResult(commands[len(results)], returncode, "".join(output).rstrip("\n")))
+                    output = []
+                else:
+                    output.append(line)
+            return results
+
+    def run(self, command: str, timeout: float | None = None) -> AdbResult:
+        return self.run_batch([command], timeout)[0]
+
+    # --- Input helpers (build command strings, so they can be batched) ---
+
+    @staticmethod
+    def text_command(text: str) -> str:
+        # `input text` needs %s for spaces; everything else is shell-quoted
+        return f"input text {shlex.quote(text.replace(' ', '%s'))}"
+
+    @staticmethod
+    def keyevent_command(*keycodes) -> str:
+        return "input keyevent " + " ".join(str(k) for k in keycodes)
+
+    @staticmethod
+    def tap_command(x: int, y: int) -> str:
+        return f"input tap {int(x)} {int(y)}"
+
+    def input_text(self, text: str, hide_keyboard: bool = True) -> list[AdbResult]:
+        """Types `text` into the focused field (and presses ESCAPE to hide the keyboard) in one round trip."""
+        commands = [self.text_command(text)]
+        if hide_keyboard:
+            commands.append(self.keyevent_command(111))
+        return self.run_batch(commands)
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.terminate()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+            self.proc = None
+
+
+_sessions: dict[str | None, AdbSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(serial: str | None = None) -> AdbSession:
+    """Returns the shared session for `serial` (None = adb's default device / $ANDROID_SERIAL)."""
+    with _sessions_lock:
+        if serial not in _sessions:
+            _sessions[serial] = AdbSession(serial)
+        return _sessions[serial]
+
+
+@atexit.register
+def close_all():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
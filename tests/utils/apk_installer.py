@@ -0,0 +1,216 @@
+import os
+import re
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Config: install timeout per device (big APKs over USB 2.0 can take a while)
+INSTALL_TIMEOUT = 300
+ADB_TIMEOUT = 30
+
+
+def _adb(serial, *args, timeout=ADB_TIMEOUT):
+    """Runs `adb -s <serial> <args>` and returns the CompletedProcess (never raises on exit code)."""
+    return subprocess.run(
+        ["adb", "-s", serial, *args],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+
+
+def list_devices() -> list[str]:
+    """Returns the serials of all connected devices in the `device` state."""
+    try:
+        result = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=5)
+    except Exception:
+        return []
+    serials = []
+    for line in result.stdout.strip().splitlines()[1:]:  # skip header
+        parts = line.split("\t")
+        if len(parts) == 2 and parts[1].strip() == "device":
+            serials.append(parts[0].strip())
+    return serials
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def local_apk_info(apk_path: str) -> dict:
+    """
+    Returns { "package": str, "version_code": str, "sha256": str, "permissions": [str] } for the APK on disk.
+    """
+    # androguard is only needed here, so import lazily (keeps plain test runs light)
+    from androguard.core.apk import APK
+
+    app = APK(apk_path)
+    return {
+        "package": app.get_package(),
+        "version_code": str(app.get_androidversion_code()),
+        "sha256": file_sha256(apk_path),
+        "permissions": sorted(app.get_permissions()),
+    }
+
+
+def installed_info(serial: str, package: str) -> dict | None:
+    """
+    Returns { "version_code": str, "sha256": str | None } of the package installed on `serial`,
+    or None if it is not installed.
+    """
+    path_result = _adb(serial, "shell", "pm", "path", package)
+    paths = [line[len("package:"):].strip() for line in path_result.stdout.splitlines() if line.startswith("package:")]
+    if not paths:
+        return None
+
+    dump = _adb(serial, "shell", "dumpsys", "package", package).stdout
+    match = re.search(r"versionCode=(\d+)", dump)
+    version_code = match.group(1) if match else None
+
+    # base.apk is the file `adb install` pushed; sha256sum exists on Android 8+ (toybox)
+    base = next((p for p in paths if p.endswith("base.apk")), paths[0])
+    hash_result = _adb(serial, "shell", "sha256sum", base)
+    sha256 = hash_result.stdout.split()[0] if hash_result.returncode == 0 and hash_result.stdout else None
+
+    return {"version_code": version_code, "sha256": sha256}
+
+
+def install_on_device(serial: str, apk_path: str, info: dict) -> dict:
+    """
+    Installs the APK on one device unless the same version code AND file hash are already there.
+    Prefers incremental install (needs a `<apk>.idsig` v4 signature next to the APK),
+    then streamed install, then the classic push + install.
+    Returns: { "serial", "status": "skipped" | "installed" | "failed", "method", "message" }
+    """
+    current = installed_info(serial, info["package"])
+    if current and current["version_code"] == info["version_code"] and current["sha256"] == info["sha256"]:
+        return {"serial": serial, "status": "skipped", "method": None, "message": "Same version and hash already installed"}
+
+    methods = []
+    if os.path.exists(apk_path + ".idsig"):
+        methods.append(("incremental", ["--incremental"]))
+    methods.append(("streaming", ["--streaming"]))
+    methods.append(("push", ["--no-streaming"]))
+
+    message = ""
+    for name, flags in methods:
+        # -r: replace existing, -d: allow version downgrade, -t: allow test-only builds
+        result = _adb(serial, "install", "-r", "-d", "-t", *flags, apk_path, timeout=INSTALL_TIMEOUT)
+        output = (result.stdout + result.stderr).strip()
+        if result.returncode == 0 and "Success" in output:
+            return {"serial": serial, "status": "installed", "method": name, "message": output.splitlines()[-1]}
+        message = output.splitlines()[-1] if output else f"adb exited with {result.returncode}"
+
+    return {"serial": serial, "status": "failed", "method": None, "message": message}
+
+
+def grant_permissions(serial: str, package: str, permissions: list[str]) -> list[str]:
+    """
+    Grants the requested permissions in a single `adb shell` round trip.
+    Install-time (normal/signature) permissions cannot be granted and are silently skipped.
+    Returns the permissions that were granted.
+    """
+    if not permissions:
+        return []
+    script = "; ".join(
+        f"pm grant {package} {permission} >/dev/null 2>&1 && echo GRANTED:{permission}" for permission in permissions
+    )
+    result = _adb(serial, "shell", script, timeout=60)
+    return [line[len("GRANTED:"):].strip() for line in result.stdout.splitlines() if line.startswith("GRANTED:")]
+
+
+def revoke_permissions(serial: str, package: str, permissions: list[str]) -> None:
+    """Revokes runtime permissions in one round trip (the app process is killed by the system)."""
+    if permissions:
+        _adb(serial, "shell", "; ".join(f"pm revoke {package} {p} >/dev/null 2>&1" for p in permissions), timeout=60)
+
+
+def granted_permissions(serial: str, package: str) -> set[str]:
+    """Runtime permissions currently granted to the package, according to dumpsys."""
+    dump = _adb(serial, "shell", "dumpsys", "package", package).stdout
+    return set(re.findall(r"([\w.]+): granted=true", dump))
+
+
+def warm_up_app(serial: str, package: str) -> dict:
+    """
+    Prepares the app for timing-sensitive tests:
+    1. Compiles it ahead of time (dexopt, `speed` profile) so the first launch does not JIT.
+    2. Performs one cold start and returns its launch time as reported by `am start -W`.
+    3. Stops it again so the tests start from a clean process.
+    """
+    _adb(serial, "shell", "cmd", "package", "compile", "-m", "speed", "-f", package, timeout=INSTALL_TIMEOUT)
+
+    component = _adb(serial, "shell", "cmd", "package", "resolve-activity", "--brief", package).stdout.strip().splitlines()
+    launch_ms = None
+    if component and "/" in component[-1]:
+        _adb(serial, "shell", "am", "force-stop", package)
+        start = _adb(serial, "shell", "am", "start", "-W", "-n", component[-1].strip(), timeout=60).stdout
+        match = re.search(r"TotalTime:\s*(\d+)", start)
+        launch_ms = int(match.group(1)) if match else None
+    _adb(serial, "shell", "am", "force-stop", package)
+
+    return {"serial": serial, "cold_start_ms": launch_ms}
+
+
+def preinstall_apk(
+    apk_path: str,
+    serials: list[str] | None = None,
+    warm: bool = False,
+    grant: bool = False,
+    log=print,
+) -> dict:
+    """
+    Installs (and optionally warms up) the APK on all target devices in parallel,
+    before any Appium session is opened.
+
+    Args:
+        apk_path: The APK to install.
+        serials: Devices to target. Defaults to every connected device.
+        warm: Also dexopt + cold start the app once on every device.
+        grant: Grant every runtime permission from the manifest right after install.
+        log: Callable(message, status) used to report per-device results.
+
+    Returns:
+        Dict of serial -> result dict (see install_on_device), with "cold_start_ms" when warmed
+        and "granted" (list of permissions) when granting.
+    """
+    serials = serials if serials is not None else list_devices()
+    if not serials:
+        log("No devices connected: skipping APK pre-install.", "WARNING")
+        return {}
+
+    info = local_apk_info(apk_path)
+    log(f"Pre-installing {info['package']} (versionCode {info['version_code']}) on {len(serials)} device(s)...", "INFO")
+
+    def _prepare(serial):
+        try:
+            result = install_on_device(serial, apk_path, info)
+            if grant and result["status"] != "failed":
+                result["granted"] = grant_permissions(serial, info["package"], info["permissions"])
+            if warm and result["status"] != "failed":
+                result.update(warm_up_app(serial, info["package"]))
+            return result
+        except Exception as e:
+            return {"serial": serial, "status": "failed", "method": None, "message": str(e)}
+
+    with ThreadPoolExecutor(max_workers=len(serials)) as pool:
+        results = {r["serial"]: r for r in pool.map(_prepare, serials)}
+
+    for serial, result in results.items():
+        status = "FAILED" if result["status"] == "failed" else "SUCCESS"
+        text = f"[{serial}] {result['status']}"
+        if result.get("method"):
+            text += f" via {result['method']}"
+        if "granted" in result:
+            text += f", {len(result['granted'])} permission(s) granted"
+        if result.get("cold_start_ms") is not None:
+            text += f", cold start {result['cold_start_ms']} ms"
+        if result["status"] == "failed":
+            text += f": {result['message']}"
+        log(text, status)
+
+    return results
@@ -0,0 +1,213 @@
+import os
+import re
+import sys
+import json
+import time
+import glob
+import threading
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+try:
+    from appium.webdriver.appium_connection import AppiumConnection
+except ImportError:  # summary / replay only need the standard library
+    AppiumConnection = object
+
+# /session/<id>/... -> /session/:sessionId/... so traces from different sessions line up
+_SESSION_RE = re.compile(r"/session/[^/]+")
+_ELEMENT_RE = re.compile(r"/element/[^/]+")
+# W3C element reference key in findElement responses
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+
+
+def _template(path: str) -> str:
+    return _ELEMENT_RE.sub("/element/:id", _SESSION_RE.sub("/session/:sessionId", path))
+
+
+class TracingConnection(AppiumConnection):
+    """
+    Command executor for webdriver.Remote that appends one JSON line per WebDriver command:
+    {"t", "test", "cmd", "method", "path", "params", "req_bytes", "resp_bytes", "ms", "ok", "error"}
+    Bodies of requests are kept (they are small) so the trace can be replayed; responses are not.
+    """
+
+    def __init__(self, *args, trace_path: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.trace_path = trace_path
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+        self.file = open(trace_path, "a", buffering=1)
+        server = args[0] if args else kwargs.get("remote_server_addr", "")
+        self._url_prefix = urllib.parse.urlparse(server).path.rstrip("/")  # e.g. /wd/hub
+
+    def _request(self, method, url, body=None, *args, **kwargs):
+        path = urllib.parse.urlparse(url).path
+        if self._url_prefix and path.startswith(self._url_prefix):
+            path = path[len(self._url_prefix):]
+        self.local.http = {"method": method, "path": _template(path), "req_bytes": len(body or "")}
+        return super()._request(method, url, body, *args, **kwargs)
+
+    def execute(self, command, params):
+        self.local.http = {}
+        start = time.perf_counter()
+        error = None
+        response = None
+        try:
+            response = super().execute(command, params)
+            value = response.get("value") if isinstance(response, dict) else None
+            if isinstance(value, dict) and "error" in value:
+                error = value["error"]
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            http = self.local.http
+            record = {
+                "t": round(start - self.started, 4),
+                "test": (os.environ.get("PYTEST_CURRENT_TEST") or "").rsplit(" ", 1)[0],
+                "cmd": command,
+                "method": http.get("method"),
+                "path": http.get("path"),
+                "params": {k: v for k, v in (params or {}).items() if k != "sessionId"},
+                "req_bytes": http.get("req_bytes", 0),
+                "resp_bytes": len(json.dumps(response.get("value"))) if isinstance(response, dict) else 0,
+                "ms": round(elapsed * 1000, 2),
+                "ok": error is None,
+                "error": error,
+            }
+            value = response.get("value") if isinstance(response, dict) else None
+            if isinstance(value, dict) and ELEMENT_KEY in value:
+                record["element"] = value[ELEMENT_KEY]  # lets replay map element ids
+            with self.lock:
+                self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        super().close()  # driver.quit() relies on it to close the urllib3 pool
+
+
+def load_trace(paths) -> list[dict]:
+    records = []
+    for path in paths:
+        with open(path, "r") as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+
+def summarize(records: list[dict]) -> dict:
+    """Commands per test and latency percentiles per command type."""
+    by_command = defaultdict(list)
+    errors = defaultdict(int)
+    per_test = defaultdict(int)
+    for record in records:
+        by_command[record["cmd"]].append(record["ms"])
+        if not record["ok"]:
+            errors[record["cmd"]] += 1
+        per_test[record["test"] or "(outside tests)"] += 1
+
+    tests = [t for t in per_test if t != "(outside tests)"]
+    return {
+        "commands": len(records),
+        "total_ms": round(sum(r["ms"] for r in records), 1),
+        "commands_per_test": round(sum(per_test[t] for t in tests) / len(tests), 1) if tests else 0.0,
+        "per_test": dict(per_test),
+        "by_command": {
+            cmd: {
+                "count": len(latencies),
+                "p50": _percentile(latencies, 0.5),
+                "p95": _percentile(latencies, 0.95),
+                "max": max(latencies),
+                "total_ms": round(sum(latencies), 1),
+                "errors": errors[cmd],
+            }
+            for cmd, latencies in sorted(by_command.items(), key=lambda kv: -sum(kv[1]))
+        },
+    }
+
+
+def format_summary(summary: dict, top: int = 5) -> list[str]:
+    if not summary["commands"]:
+        return []
+    lines = [
+        f"{summary['commands']} WebDriver commands, {summary['total_ms'] / 1000:.1f}s on the wire, "
+        f"{summary['commands_per_test']} per test"
+    ]
+    for cmd, stats in list(summary["by_command"].items())[:top]:
+        lines.append(f"  {cmd}: {stats['count']}x, p50 {stats['p50']:.0f} ms, p95 {stats['p95']:.0f} ms, {stats['errors']} errors")
+    return lines
+
+
+def _http(method, url, body=None, timeout=60):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def replay(records: list[dict], server_url: str) -> dict:
+    """
+    Sends the recorded requests in order to `server_url` (e.g. the mock server in benchmarks/)
+    and returns {"recorded": summary, "replayed": summary} for a latency comparison.
+    Recorded element ids are mapped to the ids the server returns for the same findElement.
+    """
+    server_url = server_url.rstrip("/")
+    session_id = None
+    element_ids = {}
+    replayed = []
+    for record in records:
+        if not record.get("path"):
+            continue
+        path = record["path"]
+        params = dict(record.get("params") or {})
+        if "/session/:sessionId" in path and session_id is None:
+            continue  # trace started mid-session
+        path = path.replace(":sessionId", session_id or "")
+        if ":id" in path:
+            recorded_id = params.pop("id", None)
+            path = path.replace(":id", element_ids.get(recorded_id, recorded_id or "0"))
+
+        start = time.perf_counter()
+        status, body = _http(record["method"], server_url + path, params if record["method"] == "POST" else None)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        value = body.get("value") if isinstance(body, dict) else None
+        if record["cmd"] == "newSession" and isinstance(value, dict):
+            session_id = value.get("sessionId") or body.get("sessionId")
+        if record.get("element") and isinstance(value, dict) and ELEMENT_KEY in value:
+            element_ids[record["element"]] = value[ELEMENT_KEY]
+        replayed.append({**record, "ms": round(elapsed, 2), "ok": status < 400, "error": None if status < 400 else status})
+
+    return {"recorded": summarize(records), "replayed": summarize(replayed)}
+
+
+if __name__ == "__main__":
+    # python tests/utils/command_trace.py summary command-traces/*.jsonl
+    # python tests/utils/command_trace.py replay command-traces/trace-123.jsonl http://127.0.0.1:4799
+    if len(sys.argv) < 3 or sys.argv[1] not in ("summary", "replay"):
+        print("Usage: command_trace.py summary <trace.jsonl>... | replay <trace.jsonl> <server_url>")
+        sys.exit(1)
+    if sys.argv[1] == "summary":
+        paths = [p for pattern in sys.argv[2:] for p in glob.glob(pattern)]
+        print("\n".join(format_summary(summarize(load_trace(paths)), top=20)))
+    else:
+        result = replay(load_trace([sys.argv[2]]), sys.argv[3])
+        for cmd, stats in result["recorded"]["by_command"].items():
+            new = result["replayed"]["by_command"].get(cmd, {})
+            print(f"{cmd}: recorded p95 {stats['p95']:.0f} ms -> replayed p95 {new.get('p95', 0):.0f} ms")
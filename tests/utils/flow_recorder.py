@@ -0,0 +1,288 @@
+# flow_recorder.py
+# Record-and-replay of executed flows in the test-flows format (a JSON list of {"step", "status"}).
+# Recording (pytest --record-flows) adds to every click / input step what a replay needs to act
+# without looking anything up: the element's bounds and identifying attributes, the input text,
+# the time since the previous step and a fingerprint of the screen (structure hash, screen name and
+# a few of its texts). The first entry holds the preconditions: the state fixtures the test ran with
+# (logged_in, permissions_granted) and the screen it started on. Waits that belong to the flow (the
+# OTP arriving) are recorded with wait() and kept on replay; everything else is polled, not slept.
+#
+# replay() then drives the app from the trace: one page source per step confirms the screen (same
+# structure, or the recorded element at its recorded bounds) and the step is a coordinate tap.
+# Only when the app diverges from the recording does a step fall back to full locator resolution
+# (find_and_click, healing included). Traces from another screen resolution always resolve.
+import os
+import re
+import json
+import time
+import xml.etree.ElementTree as ET
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from impact_analysis import flatten_locators, load_locator_file
+from utils import healing
+from utils import wait_utils
+from utils.gestures import tap, window_size
+from utils.screen_index import ScreenIndex, structure_hash
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FLOW_DIR = os.path.join(PROJECT_ROOT, "test-flows")
+# Recorded traces are test-flows/<test name>_replay.json, next to the step logs the tests write
+TRACE_SUFFIX = "_replay.json"
+
+# How long a replayed step waits for its screen: twice the time the recording needed, within bounds
+MIN_STEP_WAIT = 2.0
+MAX_STEP_WAIT = 15.0
+POLL_INTERVAL = 0.2
+# Timeout of find_and_click when a step falls back to locator resolution
+RESOLVE_TIMEOUT = 10
+IDENTIFYING_ATTRIBUTES = ("class", "resource-id", "content-desc", "text")
+# Visible texts kept per step, and the share of them a screen with another structure must show
+SCREEN_TEXTS = 8
+MIN_TEXT_SHARE = 0.6
+
+# Fixtures that put the app into a state the trace depends on
+STATE_FIXTURES = ("logged_in", "permissions_granted")
+
+_active: "FlowRecorder | None" = None
+_indexes: dict[str, ScreenIndex | None] = {}
+_step_names: dict[str, str] = {}
+
+
+def _screen_index(app: str | None) -> ScreenIndex | None:
+    if app not in _indexes:
+        try:
+            _indexes[app] = ScreenIndex.for_app(app) if app else None
+        except OSError:
+            _indexes[app] = None  # no locator file for this suite
+    return _indexes[app]
+
+
+class FlowRecorder:
+    """Steps of one executed test, in the order they ran."""
+
+    def __init__(self, name: str, app: str | None = None, driver=None, fixtures: dict | None = None):
+        self.name = name
+        self.index = _screen_index(app)
+        self.setup = {"step": "Preconditions", "status": "Success", "action": "setup", "fixtures": fixtures or {}}
+        if driver is not None:
+            try:
+                root = ET.fromstring(driver.page_source.encode("utf-8"))
+                self.setup["start"] = {"hash": structure_hash(root)[:16], "texts": _texts(root)[:SCREEN_TEXTS]}
+            except Exception as e:
+                print(f"[flow] Start screen not recorded: {e}")
+        self.steps: list[dict] = []
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.window: str | None = None
+        self._step_names = _locator_names()
+
+    def add(self, driver, action: str, by: str, value: str, element, text: str | None = None):
+        """Records `element` (found by (by, value)) right before it is clicked or typed into."""
+        now = time.perf_counter()
+        step = {
+            "step": self._step_names.get(value, value),
+            "status": "Success",
+            "action": action,
+            "by": by,
+            "value": value,
+            "at": round(now - self.started, 3),
+            "ms": round((now - self.last) * 1000),
+        }
+        if text is not None:
+            step["text"] = text
+        try:
+            rect = element.rect
+            page_source = driver.page_source
+            root = ET.fromstring(page_source.encode("utf-8"))
+            parents = {child: parent for parent in root.iter() for child in parent}
+            node = healing.node_for_rect(root, parents, rect, None)
+            step["bounds"] = [rect["x"], rect["y"], rect["width"], rect["height"]]
+            if node is not None:
+                step["node"] = {attr: node.get(attr) for attr in IDENTIFYING_ATTRIBUTES if node.get(attr)}
+            step["hash"] = structure_hash(root)[:16]
+            step["texts"] = _texts(root)[:SCREEN_TEXTS]
+            if self.index is not None:
+                step["screen"] = self.index.identify(page_source)["screen"]
+            if self.window is None:
+                size = window_size(driver)
+                self.window = f"{size['width']}x{size['height']}"
+                step["window"] = self.window
+        except Exception as e:
+            print(f"[flow] Step '{step['step']}' recorded without bounds: {e}")
+        self.steps.append(step)
+        self.last = time.perf_counter()  # recording cost is not part of the flow's timing
+
+    def add_wait(self, seconds: float, step: str):
+        now = time.perf_counter()
+        self.steps.append({"step": step, "status": "Success", "action": "wait", "seconds": seconds,
+                           "at": round(now - self.started, 3)})
+        self.last = now
+
+    def save(self, flow_dir: str = FLOW_DIR) -> str | None:
+        if not self.steps:
+            return None
+        os.makedirs(flow_dir, exist_ok=True)
+        path = os.path.join(flow_dir, re.sub(r"[^\w.-]+", "_", self.name) + TRACE_SUFFIX)
+        with open(path, "w") as f:
+            json.dump([self.setup] + self.steps, f, indent=4)
+        return path
+
+
+def _locator_names() -> dict[str, str]:
+    """XPath -> "screen.element" from tests/locators, so recorded steps read like the locator files."""
+    if not _step_names:
+        for file in sorted(os.listdir(healing.LOCATOR_DIR)):
+            if file.endswith(".json"):
+                data = load_locator_file(os.path.join(healing.LOCATOR_DIR, file))
+                _step_names.update({xpath: key for key, xpath in flatten_locators(data).items()})
+    return _step_names
+
+
+def start(name: str, app: str | None = None, driver=None, fixtures: dict | None = None) -> FlowRecorder:
+    """Starts recording; `driver` records the start screen, `fixtures` the STATE_FIXTURES values."""
+    global _active
+    _active = FlowRecorder(name, app, driver, fixtures)
+    return _active
+
+
+def stop(save: bool = False) -> str | None:
+    """Ends the recording; `save` writes it (only passed tests make usable traces)."""
+    global _active
+    recorder, _active = _active, None
+    return recorder.save() if recorder is not None and save else None
+
+
+def record(driver, action: str, by: str, value: str, element, text: str | None = None):
+    """No-op unless a recording is running."""
+    if _active is not None:
+        _active.add(driver, action, by, value, element, text)
+
+
+def wait(seconds: float, step: str = "Wait"):
+    """time.sleep for waits that are part of the flow (an OTP arriving): replay() keeps them."""
+    time.sleep(seconds)
+    if _active is not None:
+        _active.add_wait(seconds, step)
+
+
+def load(path: str) -> tuple[dict, list[dict]]:
+    """(preconditions, replayable steps) of a trace; traces without preconditions get an empty one."""
+    with open(path, "r") as f:
+        entries = json.load(f)
+    setup = next((e for e in entries if e.get("action") == "setup"), {"fixtures": {}})
+    return setup, [e for e in entries if e.get("action") and e.get("action") != "setup"]
+
+
+def at_start(driver, setup: dict, timeout: float = MIN_STEP_WAIT) -> bool:
+    """Is the app on the screen the trace started from (same structure or most of its texts)?"""
+    start = setup.get("start")
+    if not start:
+        return True
+    deadline = time.time() + timeout
+    while True:
+        root = ET.fromstring(driver.page_source.encode("utf-8"))
+        texts = start.get("texts") or []
+        if structure_hash(root)[:16] == start["hash"] or (
+                texts and len(set(texts) & set(_texts(root))) >= MIN_TEXT_SHARE * len(texts)):
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+
+
+def _texts(root) -> list[str]:
+    return sorted({node.get("text") for node in root.iter() if node.get("text")})
+
+
+def _on_screen(root, step: dict, previous_hash: str | None) -> bool:
+    """
+    Is the page the one `step` was recorded on: same structure, or (dynamic content changed it) its
+    element at its bounds on a page showing most of the recorded texts. A "Next" button at the same
+    place on the following screen is not enough.
+    """
+    fingerprint = structure_hash(root)[:16]
+    if fingerprint == step.get("hash"):
+        return True
+    if previous_hash and step.get("hash") != previous_hash and fingerprint == previous_hash:
+        return False  # still on the previous step's screen
+    texts = step.get("texts")
+    if texts and len(set(texts) & set(_texts(root))) < MIN_TEXT_SHARE * len(texts):
+        return False
+    x, y, w, h = step["bounds"]
+    bounds = f"[{x},{y}][{x + w},{y + h}]"
+    expected = step.get("node") or {}
+    return any(
+        node.get("bounds") == bounds and all(node.get(k) == v for k, v in expected.items())
+        for node in root.iter()
+    )
+
+
+def _wait_for_screen(driver, step: dict, previous_hash: str | None, stats: dict) -> bool:
+    timeout = min(MAX_STEP_WAIT, max(MIN_STEP_WAIT, 2 * step.get("ms", 0) / 1000))
+    deadline = time.time() + timeout
+    while True:
+        stats["page_sources"] += 1
+        if _on_screen(ET.fromstring(driver.page_source.encode("utf-8")), step, previous_hash):
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+
+
+def _resolve(driver, step: dict):
+    """Full locator resolution (wait, healing, fallback text) for a step the fast path could not take."""
+    if step["action"] == "click":
+        if not wait_utils.find_and_click(driver, step["by"], step["value"], step.get("node", {}).get("text"),
+                                         timeout=RESOLVE_TIMEOUT):
+            raise AssertionError(f"Replay diverged at '{step['step']}': element not found")
+        return
+    element = WebDriverWait(driver, RESOLVE_TIMEOUT).until(EC.presence_of_element_located((step["by"], step["value"])))
+    element.clear()
+    element.send_keys(step["text"])
+
+
+def replay(driver, path: str) -> dict:
+    """
+    Replays a recorded trace from its start screen (preconditions are the caller's: see load() and
+    at_start()). Returns {"flow", "steps", "fast", "resolved", "waited", "page_sources", "seconds",
+    "recorded_seconds", "speedup"}; raises AssertionError where even locator resolution fails.
+    """
+    _, steps = load(path)
+    size = window_size(driver)
+    recorded_window = next((s["window"] for s in steps if s.get("window")), None)
+    same_device = recorded_window == f"{size['width']}x{size['height']}"
+    if not same_device:
+        print(f"[flow] Recorded on {recorded_window}, replaying on {size['width']}x{size['height']}: resolving every step")
+
+    stats = {"fast": 0, "resolved": 0, "waited": 0.0, "page_sources": 0}
+    started = time.perf_counter()
+    previous_hash = None
+    for step in steps:
+        if step["action"] == "wait":
+            time.sleep(step["seconds"])
+            stats["waited"] += step["seconds"]
+            continue
+        if same_device and step.get("bounds") and _wait_for_screen(driver, step, previous_hash, stats):
+            x, y, w, h = step["bounds"]
+            tap(driver, x + w / 2, y + h / 2)
+            if step["action"] == "input":
+                field = driver.switch_to.active_element
+                field.clear()
+                field.send_keys(step["text"])
+            stats["fast"] += 1
+        else:
+            print(f"[flow] '{step['step']}' diverged from the recording, resolving its locator")
+            _resolve(driver, step)
+            stats["resolved"] += 1
+        previous_hash = step.get("hash")
+
+    seconds = time.perf_counter() - started
+    recorded = steps[-1]["at"] if steps else 0.0
+    return {
+        "flow": os.path.basename(path),
+        "steps": len(steps),
+        **stats,
+        "seconds": round(seconds, 2),
+        "recorded_seconds": recorded,
+        "speedup": round(recorded / seconds, 1) if seconds else None,
+    }
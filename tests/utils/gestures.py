@@ -0,0 +1,111 @@
+from selenium.webdriver.common.actions import interaction
+from selenium.webdriver.common.actions.action_builder import ActionBuilder
+from selenium.webdriver.common.actions.pointer_input import PointerInput
+
+# Window size per Appium session: it does not change during a test, so one round trip is enough
+_window_sizes: dict[str, dict] = {}
+
+
+def window_size(driver) -> dict:
+    """driver.get_window_size(), cached per session id."""
+    size = _window_sizes.get(driver.session_id)
+    if size is None:
+        size = _window_sizes[driver.session_id] = driver.get_window_size()
+    return size
+
+
+class Gesture:
+    """
+    Composes taps, swipes and pauses into ONE W3C actions payload (a single HTTP call to Appium).
+
+        Gesture(driver).tap(100, 200).pause(0.3).swipe_up().tap(150, 900).perform()
+
+    Coordinates are absolute pixels; swipe_up / swipe_down use fractions of the cached window size.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.steps = []
+
+    def tap(self, x, y, hold=0.1):
+        self.steps.append(("tap", int(x), int(y), hold))
+        return self
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0.4):
+        self.steps.append(("swipe", int(start_x), int(start_y), int(end_x), int(end_y), duration))
+        return self
+
+    def pause(self, seconds):
+        self.steps.append(("pause", seconds))
+        return self
+
+    def swipe_up(self, start=0.8, end=0.2, duration=0.4):
+        """Finger moves up = content scrolls down."""
+        size = window_size(self.driver)
+        x = size["width"] / 2
+        return self.swipe(x, size["height"] * start, x, size["height"] * end, duration)
+
+    def swipe_down(self, start=0.2, end=0.8, duration=0.4):
+        return self.swipe_up(start, end, duration)
+
+    def perform(self) -> None:
+        if not self.steps:
+            return
+        finger = PointerInput(interaction.POINTER_TOUCH, "finger")
+        actions = ActionBuilder(self.driver, mouse=finger)
+        for step in self.steps:
+            kind = step[0]
+            if kind == "tap":
+                _, x, y, hold = step
+                finger.create_pointer_move(duration=0, x=x, y=y, origin="viewport")
+                finger.create_pointer_down(button=0)
+                finger.create_pause(hold)
+                finger.create_pointer_up(button=0)
+            elif kind == "swipe":
+                _, x1, y1, x2, y2, duration = step
+                finger.create_pointer_move(duration=0, x=x1, y=y1, origin="viewport")
+                finger.create_pointer_down(button=0)
+                finger.create_pointer_move(duration=int(duration * 1000), x=x2, y=y2, origin="viewport")
+                finger.create_pointer_up(button=0)
+            else:
+                finger.create_pause(step[1])
+        actions.perform()
+        self.steps = []
+
+
+def tap(driver, x, y, native=True) -> None:
+    """
+    Single tap. Uses UiAutomator2's `mobile: clickGesture` (no W3C action encoding on the server)
+    and falls back to a W3C tap on drivers that do not support it.
+    """
+    if native:
+        try:
+            driver.execute_script("mobile: clickGesture", {"x": int(x), "y": int(y)})
+            return
+        except Exception:
+            pass
+    Gesture(driver).tap(x, y).perform()
+
+
+def scroll(driver, direction="down", percent=0.75, area=None) -> bool:
+    """
+    Scrolls the screen (or `area` = {left, top, width, height}) with `mobile: scrollGesture`,
+    which returns once the content settled, so no sleep is needed afterwards.
+    Returns True if the content can scroll further (always True for the W3C fallback).
+    """
+    if area is None:
+        size = window_size(driver)
+        # Leave the status / navigation bars out of the gesture area
+        area = {
+            "left": 0,
+            "top": int(size["height"] * 0.15),
+            "width": size["width"],
+            "height": int(size["height"] * 0.7),
+        }
+    try:
+        return bool(driver.execute_script("mobile: scrollGesture", {**area, "direction": direction, "percent": percent}))
+    except Exception:
+        gesture = Gesture(driver)
+        (gesture.swipe_up() if direction == "down" else gesture.swipe_down()).perform()
+        return True
+
@@ -0,0 +1,351 @@
+# healing.py
+# Self-healing locators. Every element found by a locator is recorded once per run with its full
+# attribute set (resource-id, content-desc, text, class, bounds, parent chain), taken from the page
+# source. When the locator later misses (typically after an app update), every node of ONE fresh page
+# source is scored against that record and the best match above HEAL_MIN_SCORE is used instead.
+# Only locators with a record heal (from an earlier run, or found earlier by this pytest process),
+# and only to nodes that share the recorded resource-id or content-desc, or whose text is nearly the
+# same ("Login" never heals to "Logout"). Healed locators are cached for the rest of the run, and at
+# the end of the session written out as a suggested patch to tests/locators/*.json (see
+# write_suggestions). Every pytest process saves its new records to its own records-<pid>-<ns>.json, so
+# parallel shards never overwrite each other; merge_records() folds them into records.json.
+import os
+import re
+import glob
+import json
+import difflib
+import time
+import threading
+import xml.etree.ElementTree as ET
+import allure
+from utils.screen_index import xpath_anchors
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LOCATOR_DIR = os.path.join(PROJECT_ROOT, "tests", "locators")
+# Records (kept across runs: they are what a broken locator is healed from) and suggested patches
+HEAL_DIR = os.getenv("HEAL_DIR", os.path.join(PROJECT_ROOT, "healed-locators"))
+HEALING_ENABLED = os.getenv("HEALING", "1") != "0"
+
+# Score (0..1) a candidate needs, and its lead over the runner-up, to be used
+HEAL_MIN_SCORE = 0.6
+HEAL_MIN_MARGIN = 0.1
+# Attribute weights; attributes the record does not have are left out of the score
+WEIGHTS = {"resource-id": 3.0, "content-desc": 2.5, "text": 2.0, "class": 1.0, "bounds": 1.0, "parents": 1.0}
+PARENT_DEPTH = 4
+# Text similarity a candidate needs when neither resource-id nor content-desc matches exactly
+HEAL_MIN_TEXT_SIMILARITY = 0.85
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+_lock = threading.Lock()
+_records: dict[str, dict] | None = None  # "by=value" -> attribute record
+_recorded_this_run: set[str] = set()
+_new_records: set[str] = set()  # keys this process (re)recorded, saved by write_suggestions
+_healed: dict[str, dict] = {}  # "by=value" -> {"by", "value", "score", ...}
+
+
+def _key(by: str, value: str) -> str:
+    return f"{by}={value}"
+
+
+def _records_path() -> str:
+    return os.path.join(HEAL_DIR, "records.json")
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _worker_files(out_dir: str) -> list[str]:
+    """records-<pid>-<ns>.json files not merged yet, oldest first (newer records win)."""
+    return sorted(glob.glob(os.path.join(out_dir, "records-*.json")), key=os.path.getmtime)
+
+
+def _load_records() -> dict:
+    global _records
+    if _records is None:
+        _records = _read_json(_records_path())
+        for path in _worker_files(HEAL_DIR):  # a run that ended before merge_records()
+            _records.update(_read_json(path))
+    return _records
+
+
+def merge_records(out_dir: str = HEAL_DIR) -> int:
+    """
+    Folds the records-<pid>-<ns>.json of finished pytest processes into records.json. Call it once no
+    pytest process of the run is alive (test_runner does). Returns the number of files merged.
+    """
+    files = _worker_files(out_dir)
+    if not files:
+        return 0
+    path = os.path.join(out_dir, "records.json")
+    merged = _read_json(path)
+    for worker_file in files:
+        merged.update(_read_json(worker_file))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2)
+    os.replace(tmp, path)
+    for worker_file in files:
+        os.remove(worker_file)
+    return len(files)
+
+
+def parse_bounds(bounds: str | None) -> tuple[int, int, int, int] | None:
+    match = _BOUNDS_RE.match(bounds or "")
+    return tuple(int(v) for v in match.groups()) if match else None
+
+
+def _parents(parents: dict, node) -> list[str]:
+    chain = []
+    while node in parents and len(chain) < PARENT_DEPTH:
+        node = parents[node]
+        chain.append(f"{node.get('class') or node.tag}#{node.get('resource-id') or ''}")
+    return chain
+
+
+def node_record(node, parents: dict) -> dict:
+    record = {attr: node.get(attr) for attr in ("resource-id", "content-desc", "text", "class", "bounds") if node.get(attr)}
+    record["parents"] = _parents(parents, node)
+    return record
+
+
+def _similar(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a.lower(), b.lower()).ratio()
+
+
+def _bounds_similarity(a: str, b: str, screen: tuple[int, int]) -> float:
+    """1 for the same box, falling off with the distance of the centres relative to the screen size."""
+    a, b = parse_bounds(a), parse_bounds(b)
+    if not a or not b:
+        return 0.0
+    dx = ((a[0] + a[2]) - (b[0] + b[2])) / 2 / max(screen[0], 1)
+    dy = ((a[1] + a[3]) - (b[1] + b[3])) / 2 / max(screen[1], 1)
+    return max(0.0, 1.0 - 4 * (dx * dx + dy * dy) ** 0.5)
+
+
+def score(record: dict, node, parents: dict, screen: tuple[int, int]) -> float:
+    """How much `node` looks like the recorded element, 0..1."""
+    total = matched = 0.0
+    for attr in ("resource-id", "content-desc", "text", "class"):
+        if record.get(attr):
+            total += WEIGHTS[attr]
+            value = node.get(attr) or ""
+            # ids and classes are identifiers: equal or not; labels may have been reworded
+            matched += WEIGHTS[attr] * (value == record[attr] if attr in ("resource-id", "class") else _similar(value, record[attr]))
+    if record.get("bounds"):
+        total += WEIGHTS["bounds"]
+        matched += WEIGHTS["bounds"] * _bounds_similarity(record["bounds"], node.get("bounds"), screen)
+    if record.get("parents"):
+        total += WEIGHTS["parents"]
+        chain = _parents(parents, node)
+        matched += WEIGHTS["parents"] * sum(a == b for a, b in zip(record["parents"], chain)) / len(record["parents"])
+    return matched / total if total else 0.0
+
+
+def identifies(record: dict, node) -> bool:
+    """Can `node` be the recorded element at all: same resource-id or content-desc, or nearly the same text."""
+    for attr in ("resource-id", "content-desc"):
+        if record.get(attr) and node.get(attr) == record[attr]:
+            return True
+    return bool(record.get("text") and node.get("text")) and _similar(node.get("text"), record["text"]) >= HEAL_MIN_TEXT_SIMILARITY
+
+
+def _record_from_locator(by: str, value: str) -> dict | None:
+    """What the locator itself says about its element: picks the right node among those sharing its bounds."""
+    if by in ("id", "accessibility id"):
+        return {"resource-id" if by == "id" else "content-desc": value}
+    record = {attr: literal for _, attr, literal in xpath_anchors(value)}
+    tag = re.match(r"//([\w.]+)\[", value)
+    if tag:
+        record["class"] = tag.group(1)
+    return record if any(k != "class" for k in record) else None
+
+
+def _absolute_xpath(node, parents: dict) -> str:
+    steps = []
+    while node in parents:
+        parent = parents[node]
+        same = [c for c in parent if c.tag == node.tag]
+        steps.append(node.tag + (f"[{same.index(node) + 1}]" if len(same) > 1 else ""))
+        node = parent
+    return "/hierarchy/" + "/".join(reversed(steps))
+
+
+def locator_for(node, root, parents: dict) -> tuple[str, str]:
+    """The most stable locator that matches only `node`: unique id > content-desc > text > index path."""
+    for attr, by in (("resource-id", "id"), ("content-desc", "accessibility id")):
+        value = node.get(attr)
+        if value and sum(n.get(attr) == value for n in root.iter()) == 1:
+            return by, value
+    text = node.get("text")
+    if text and "'" not in text and sum(n.get("text") == text for n in root.iter()) == 1:
+        return "xpath", f"//{node.get('class') or '*'}[@text='{text}']"
+    return "xpath", _absolute_xpath(node, parents)
+
+
+def node_for_rect(root, parents: dict, rect: dict, record_hint: dict | None):
+    """The page-source node of a found element: same bounds, preferring one the locator's literals match."""
+    bounds = f"[{rect['x']},{rect['y']}][{rect['x'] + rect['width']},{rect['y'] + rect['height']}]"
+    candidates = [n for n in root.iter() if n.get("bounds") == bounds]
+    if not candidates:
+        return None
+    if record_hint:
+        for node in reversed(candidates):  # deepest first
+            if all(node.get(k) == v for k, v in record_hint.items() if k != "class"):
+                return node
+    return candidates[-1]
+
+
+def _screen_size(root) -> tuple[int, int]:
+    width = int(root.get("width") or 0)
+    height = int(root.get("height") or 0)
+    if not width or not height:
+        for node in root.iter():
+            box = parse_bounds(node.get("bounds"))
+            if box:
+                width, height = max(width, box[2]), max(height, box[3])
+    return width, height
+
+
+def record(driver, by: str, value: str, element) -> None:
+    """
+    Remembers the attribute set of `element`, found by (by, value). Costs one rect and one page source,
+    once per locator and run.
+    """
+    key = _key(by, value)
+    if not HEALING_ENABLED or key in _recorded_this_run:
+        return
+    _recorded_this_run.add(key)
+    try:
+        root = ET.fromstring(driver.page_source.encode("utf-8"))
+        parents = {child: parent for parent in root.iter() for child in parent}
+        node = node_for_rect(root, parents, element.rect, _record_from_locator(by, value))
+    except Exception as e:
+        print(f"[heal] Could not record {key}: {e}")
+        return
+    if node is not None:
+        with _lock:
+            _load_records()[key] = node_record(node, parents)
+            _new_records.add(key)
+
+
+def healed(by: str, value: str) -> tuple[str, str] | None:
+    """The locator that replaced (by, value) earlier in this run, if any."""
+    entry = _healed.get(_key(by, value))
+    return (entry["by"], entry["value"]) if entry else None
+
+
+def heal(driver, by: str, value: str):
+    """
+    Finds the element (by, value) used to match, from one page source. Returns the WebElement of the
+    best candidate (and caches its new locator), or None when the locator was never recorded or nothing
+    identifies as its element with a high enough score.
+    """
+    if not HEALING_ENABLED:
+        return None
+    key = _key(by, value)
+    with _lock:
+        target = _load_records().get(key)
+    if not target:
+        return None
+
+    root = ET.fromstring(driver.page_source.encode("utf-8"))
+    parents = {child: parent for parent in root.iter() for child in parent}
+    screen = _screen_size(root)
+    ranked = sorted(
+        ((score(target, node, parents, screen), index, node)
+         for index, node in enumerate(root.iter()) if node.get("bounds") and identifies(target, node)),
+        key=lambda s: (-s[0], s[1]),
+    )
+    if not ranked:
+        print(f"[heal] No candidate for {key} shares its id, description or text")
+        return None
+    best_score, _, best = ranked[0]
+    runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+    if best_score < HEAL_MIN_SCORE or best_score - runner_up < HEAL_MIN_MARGIN:
+        print(f"[heal] No confident match for {key} (best {best_score:.2f}, runner-up {runner_up:.2f})")
+        return None
+
+    new_by, new_value = locator_for(best, root, parents)
+    elements = driver.find_elements(new_by, new_value)
+    if not elements:
+        return None
+    entry = {"by": new_by, "value": new_value, "score": round(best_score, 3), "was": {"by": by, "value": value},
+             "matched": node_record(best, parents)}
+    with _lock:
+        _healed[key] = entry
+        _load_records()[_key(new_by, new_value)] = entry["matched"]
+        _new_records.add(_key(new_by, new_value))
+    print(f"[heal] {key} -> {new_by}={new_value} (score {best_score:.2f})")
+    try:
+        allure.attach(json.dumps(entry, indent=2), name=f"Healed locator: {value[:60]}",
+                      attachment_type=allure.attachment_type.JSON)
+    except Exception:
+        pass  # outside a test (no allure lifecycle)
+    return elements[0]
+
+
+def _as_xpath(by: str, value: str) -> str:
+    """Locator files hold XPaths only."""
+    if by == "id":
+        return f"//*[@resource-id='{value}']"
+    if by == "accessibility id":
+        return f"//*[@content-desc='{value}']"
+    return value
+
+
+def write_suggestions(locator_dir: str = LOCATOR_DIR, out_dir: str = HEAL_DIR) -> str | None:
+    """
+    Saves this process's new records to records-<pid>-<ns>.json and, when something was healed,
+    healed-<pid>.json plus a unified diff against the locator files that contain the broken XPaths.
+    Returns the patch path (None if nothing healed).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with _lock:
+        new = {key: _records[key] for key in _new_records if _records and key in _records}
+        healed_now = dict(_healed)
+    if new:
+        # One file per process: no other process writes it, so nothing needs a cross-process lock
+        path = os.path.join(out_dir, f"records-{os.getpid()}-{time.time_ns()}.json")  # pids get reused
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(new, f, indent=2)
+        os.replace(path + ".tmp", path)
+    if not healed_now:
+        return None
+
+    with open(os.path.join(out_dir, f"healed-{os.getpid()}.json"), "w", encoding="utf-8") as f:
+        json.dump(healed_now, f, indent=2)
+
+    diff = []
+    for name in sorted(os.listdir(locator_dir)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(locator_dir, name)
+        with open(path, "r", encoding="utf-8") as f:
+            before = f.read()
+        after = before
+        for entry in healed_now.values():
+            old = entry["was"]["value"]
+            if entry["was"]["by"] != "xpath":
+                continue
+            # The XPath as it is written inside a JSON string
+            after = after.replace(json.dumps(old)[1:-1], json.dumps(_as_xpath(entry["by"], entry["value"]))[1:-1])
+        if after != before:
+            relative = os.path.relpath(path, PROJECT_ROOT).replace(os.sep, "/")
+            diff += difflib.unified_diff(
+                before.splitlines(keepends=True), after.splitlines(keepends=True),
+                fromfile=f"a/{relative}", tofile=f"b/{relative}",
+            )
+    if not diff:
+        return None
+    patch_path = os.path.join(out_dir, f"suggested-{os.getpid()}.patch")
+    with open(patch_path, "w", encoding="utf-8") as f:
+        f.writelines(diff)
+    return patch_path
@@ -0,0 +1,259 @@
+import os
+import glob
+import json
+import time
+import threading
+from functools import wraps
+from collections import defaultdict
+
+# Where wall time goes, per test and per run. Spans nest (test > step > wait > appium command),
+# so every span also knows its *self* time (its duration minus its children).
+#   test   - one pytest item (setup + call + teardown)
+#   step   - allure.step blocks and TestLogger.log_step functions
+#   wait   - WebDriverWait.until / until_not (polling sleeps included)
+#   sleep  - time.sleep outside of waits
+#   ocr    - OCR helpers (utils/ocr_utils.py)
+#   appium - one WebDriver command, i.e. one HTTP round trip to the Appium server
+CATEGORIES = ["appium", "wait", "sleep", "ocr", "step", "test"]
+
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+
+_folded = defaultdict(float)                  # "test;step:X;wait:Y" -> self seconds
+_totals = defaultdict(lambda: [0, 0.0, 0.0])  # (category, name) -> [count, total seconds, self seconds]
+_per_test = defaultdict(lambda: defaultdict(float))  # nodeid -> category -> self seconds
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+class span:
+    """Context manager timing one unit of work. No-op until install() was called."""
+
+    def __init__(self, category, name):
+        self.category = category
+        self.name = str(name).replace(";", ",")  # ";" separates frames in the folded export
+        self.frame = None
+
+    def __enter__(self):
+        if _enabled:
+            # [category, name, start, time spent in children]
+            self.frame = [self.category, self.name, time.perf_counter(), 0.0]
+            _stack().append(self.frame)
+        return self
+
+    def __exit__(self, *exc):
+        if self.frame is None:
+            return False
+        stack = _stack()
+        elapsed = time.perf_counter() - self.frame[2]
+        self_time = max(0.0, elapsed - self.frame[3])
+        path = ";".join(f"{f[0]}:{f[1]}" if f[0] != "test" else f[1] for f in stack)
+        test = next((f[1] for f in stack if f[0] == "test"), "(outside tests)")
+        stack.pop()
+        if stack:
+            stack[-1][3] += elapsed
+        with _lock:
+            _folded[path] += self_time
+            entry = _totals[(self.category, self.name)]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += self_time
+            _per_test[test][self.category] += self_time
+        self.frame = None
+        return False
+
+
+def timed(category, name=None):
+    """Decorator version of span (name defaults to the function name)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(category, name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_category():
+    stack = _stack()
+    return stack[-1][0] if stack else None
+
+
+class _TimedStep:
+    """Wraps allure's StepContext: same behaviour as a context manager and as a decorator, plus timing."""
+
+    def __init__(self, title, context):
+        self.title = title
+        self.context = context
+        self.span = None
+
+    def __enter__(self):
+        self.span = span("step", self.title).__enter__()
+        return self.context.__enter__()
+
+    def __exit__(self, *exc):
+        try:
+            return self.context.__exit__(*exc)
+        finally:
+            self.span.__exit__(*exc)
+
+    def __call__(self, func):
+        decorated = self.context(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span("step", self.title):
+                return decorated(*args, **kwargs)
+        return wrapper
+
+
+def install():
+    """Hooks allure.step, WebDriverWait and time.sleep (once per process) and starts recording."""
+    global _enabled
+    if _enabled:
+        return
+    import allure
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    original_step = allure.step
+
+    def step(title):
+        if callable(title):  # bare @allure.step
+            return original_step(title)
+        return _TimedStep(title, original_step(title))
+    allure.step = step
+
+    for method in ("until", "until_not"):
+        original = getattr(WebDriverWait, method)
+
+        def timed_wait(self, wait_method, message="", _original=original, _name=method):
+            label = getattr(wait_method, "__qualname__", _name).split(".")[0]
+            with span("wait", label):
+                return _original(self, wait_method, message)
+        setattr(WebDriverWait, method, timed_wait)
+
+    original_sleep = time.sleep
+
+    def sleep(seconds):
+        # Polling sleeps of a wait belong to the wait; other threads (adb pumps, ...) are not test time
+        if current_category() == "wait" or threading.current_thread() is not threading.main_thread():
+            return original_sleep(seconds)
+        with span("sleep", f"{seconds}s"):
+            return original_sleep(seconds)
+    time.sleep = sleep
+
+    _enabled = True
+
+
+def instrument_driver(driver):
+    """Times every WebDriver command sent through the driver's command executor."""
+    executor = driver.command_executor
+    if getattr(executor, "_instrumented", False):
+        return driver
+    execute = executor.execute
+
+    def timed_execute(command, params):
+        with span("appium", command):
+            return execute(command, params)
+    executor.execute = timed_execute
+    executor._instrumented = True
+    return driver
+
+
+def breakdown_for(nodeid):
+    """Self seconds per category for one test so far."""
+    with _lock:
+        return dict(_per_test.get(nodeid, {}))
+
+
+def snapshot():
+    """Everything recorded by this process, JSON-serialisable."""
+    with _lock:
+        return {
+            "folded": dict(_folded),
+            "totals": [
+                {"category": c, "name": n, "count": v[0], "total": round(v[1], 4), "self": round(v[2], 4)}
+                for (c, n), v in _totals.items()
+            ],
+            "tests": {t: dict(cats) for t, cats in _per_test.items()},
+        }
+
+
+def dump(profile_dir):
+    """Writes this process' profile to <profile_dir>/profile-<pid>.json."""
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f"profile-{os.getpid()}.json")
+    with open(path, "w") as f:
+        json.dump(snapshot(), f)
+    return path
+
+
+def merge_profiles(profile_dir):
+    """
+    Combines every profile-*.json of a run (one per pytest process) into a hot-spot report.
+    Also writes run.folded (flamegraph.pl / speedscope input, values in milliseconds)
+    and hotspots.json next to them.
+    """
+    folded = defaultdict(float)
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    tests = defaultdict(lambda: defaultdict(float))
+    for path in sorted(glob.glob(os.path.join(profile_dir, "profile-*.json"))):
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for stack, seconds in data["folded"].items():
+            folded[stack] += seconds
+        for entry in data["totals"]:
+            total = totals[(entry["category"], entry["name"])]
+            total[0] += entry["count"]
+            total[1] += entry["total"]
+            total[2] += entry["self"]
+        for test, cats in data["tests"].items():
+            for category, seconds in cats.items():
+                tests[test][category] += seconds
+
+    by_category = defaultdict(float)
+    for (category, _), (_, _, self_time) in totals.items():
+        by_category[category] += self_time
+    wall = sum(by_category.values())
+
+    report = {
+        "wall_seconds": round(wall, 3),
+        "by_category": {
+            c: {"seconds": round(s, 3), "percent": round(100 * s / wall, 1) if wall else 0.0}
+            for c, s in sorted(by_category.items(), key=lambda kv: -kv[1])
+        },
+        "hotspots": [
+            {"category": c, "name": n, "count": v[0], "self": round(v[2], 3), "total": round(v[1], 3)}
+            for (c, n), v in sorted(totals.items(), key=lambda kv: -kv[1][2])[:25]
+        ],
+        "tests": {t: {c: round(s, 3) for c, s in cats.items()} for t, cats in tests.items()},
+    }
+
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(os.path.join(profile_dir, "run.folded"), "w") as f:
+        for stack, seconds in sorted(folded.items()):
+            ms = int(round(seconds * 1000))
+            if ms:
+                f.write(f"{stack.replace(' ', '_')} {ms}\n")
+    with open(os.path.join(profile_dir, "hotspots.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def format_hotspots(report, top=5):
+    """A few human-readable lines: time per category, then the biggest single hot spots."""
+    if not report["wall_seconds"]:
+        return []
+    split = ", ".join(f"{c} {v['seconds']:.1f}s ({v['percent']}%)" for c, v in report["by_category"].items())
+    lines = [f"Time split over {report['wall_seconds']:.1f}s: {split}"]
+    for spot in report["hotspots"][:top]:
+        lines.append(f"  {spot['self']:.1f}s in {spot['category']} '{spot['name']}' ({spot['count']}x)")
+    return lines
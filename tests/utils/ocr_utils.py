@@ -4,7 +4,9 @@ import cv2
 import numpy as np
 import time
 import os
+from utils.instrumentation import timed
 
+@timed("ocr")
 def extract_text_with_coordinates(image_path):
     img = cv2.imread(image_path)
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -19,6 +21,7 @@ def extract_text_with_coordinates(image_path):
                 texts.append({"text": text, "coords": (x + w//2, y + h//2)})
     return texts
 
+@timed("ocr")
 def click_element_by_ocr_text(driver, target_text, screenshot_path):
     matches = extract_text_with_coordinates(screenshot_path)
     print(f"[OCR] Looking for '{target_text}' in screenshot: {screenshot_path}")
@@ -33,6 +36,7 @@ def click_element_by_ocr_text(driver, target_text, screenshot_path):
     print(f"[OCR] No match found for '{target_text}'")
     return False
 
+@timed("ocr")
 def extract_text_from_image(image_path):
     img = Image.open(image_path)
     return pytesseract.image_to_string(img)
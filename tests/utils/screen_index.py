@@ -0,0 +1,202 @@
+# screen_index.py
+# "Which screen am I on" from ONE page-source fetch instead of serial waits on per-screen XPaths.
+# Every screen of a locator file (tests/locators/<app>.json) is fingerprinted by its anchors:
+#   - attribute anchors: the text / content-desc / resource-id literals its XPaths match on
+#     (set lookups against the page source, weighted down when several screens share them)
+#   - structure anchors: XPaths without literals (recorded index paths), evaluated on the parsed tree
+# Screens are ranked by the weight of their anchors present on the page. A locator group may span
+# several real screens (login_screen: language, phone, OTP, permission dialogs), so one unique anchor
+# is enough; "score" is the share of the group's anchors found. Once a screen was recognised with
+# confidence, the hash of the page's stable structure (classes + resource-ids, no text or bounds)
+# maps straight to it, so revisiting a screen skips scoring. Different screens can share a skeleton
+# (two permission dialogs differ only in text), so a learned hash still needs one of the screen's
+# anchors on the page; otherwise the page is scored like an unknown one.
+import os
+import re
+import time
+import hashlib
+import xml.etree.ElementTree as ET
+from impact_analysis import load_locator_file
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LOCATOR_DIR = os.path.join(PROJECT_ROOT, "tests", "locators")
+
+ANCHOR_ATTRIBUTES = ("text", "content-desc", "resource-id")
+# Framework ids present on every screen (android:id/content roots most recorded XPaths)
+GENERIC_ID_PREFIXES = ("android:id/",)
+# Anchor weight needed for a match (1.0 = one anchor no other screen has), and for remembering the
+# page structure, which also needs twice the weight of the runner-up
+MIN_WEIGHT = 1.0
+LEARN_WEIGHT = 2.0
+# Weight of a structure anchor: a recorded index path that still resolves is as telling as a literal
+STRUCTURE_WEIGHT = 1.0
+POLL_INTERVAL = 0.25
+
+_EXACT_RE = re.compile(r"@(text|content-desc|resource-id)\s*=\s*(['\"])(.*?)\2")
+_CONTAINS_RE = re.compile(r"contains\(\s*@(text|content-desc|resource-id)\s*,\s*(['\"])(.*?)\2\s*\)")
+
+
+def xpath_anchors(xpath: str) -> list[tuple[str, str, str]]:
+    """("exact" | "contains", attribute, value) literals of an XPath, generic framework ids left out."""
+    anchors = [("exact", m.group(1), m.group(3)) for m in _EXACT_RE.finditer(xpath)]
+    anchors += [("contains", m.group(1), m.group(3)) for m in _CONTAINS_RE.finditer(xpath)]
+    return [a for a in anchors if not (a[1] == "resource-id" and a[2].startswith(GENERIC_ID_PREFIXES))]
+
+
+def _element_path(xpath: str) -> str | None:
+    """The XPath as an ElementTree path (relative to <hierarchy>), or None if ElementTree cannot run it."""
+    if xpath.startswith("/hierarchy/"):
+        path = "./" + xpath[len("/hierarchy/"):]
+    elif xpath.startswith("//"):
+        path = "." + xpath
+    else:
+        return None
+    try:
+        ET.Element("hierarchy").find(path)
+    except SyntaxError:
+        return None
+    return path
+
+
+def structure_hash(root) -> str:
+    """Hash of the page's stable skeleton: depth, class and resource-id of every node."""
+    digest = hashlib.sha1()
+
+    def walk(node, depth):
+        digest.update(f"{depth}:{node.tag}:{node.get('resource-id', '')};".encode())
+        for child in node:
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return digest.hexdigest()
+
+
+class ScreenIndex:
+    """
+    Known screens of one app and their anchors. identify() / current() classify a page source;
+    wait_for() polls until one of the expected screens shows up (or anything known, with no names).
+    """
+
+    def __init__(self, screens: dict[str, dict[str, str]]):
+        self.anchors: dict[str, list[tuple[str, str, str]]] = {}
+        self.paths: dict[str, list[str]] = {}
+        for name, locators in screens.items():
+            anchors, paths = set(), set()
+            for xpath in locators.values():
+                found = xpath_anchors(xpath)
+                if found:
+                    anchors.update(found)
+                elif _element_path(xpath):
+                    paths.add(_element_path(xpath))
+            if anchors or paths:
+                self.anchors[name] = sorted(anchors)
+                self.paths[name] = sorted(paths)
+
+        # An anchor shared by n screens is worth 1/n: "Submit" says little, "My Active Farms" a lot
+        shared = {}
+        for anchors in self.anchors.values():
+            for anchor in anchors:
+                shared[anchor] = shared.get(anchor, 0) + 1
+        self.weights = {anchor: 1.0 / count for anchor, count in shared.items()}
+        self.learned: dict[str, str] = {}  # structure hash -> screen
+        self.learned_texts: dict[str, set[str]] = {}  # structure hash -> texts, for screens without anchors
+
+    @classmethod
+    def for_app(cls, app: str, locator_dir: str = LOCATOR_DIR) -> "ScreenIndex":
+        """Index of tests/locators/<app>.json (e.g. "regular_farmer")."""
+        data = load_locator_file(os.path.join(locator_dir, f"{app}.json"))
+        return cls({name: {k: v for k, v in value.items() if isinstance(v, str)}
+                    for name, value in data.items() if isinstance(value, dict)})
+
+    @property
+    def screens(self) -> list[str]:
+        return sorted(self.anchors)
+
+    def learn(self, name: str, page_source: str):
+        """Remembers the structure of `page_source` as screen `name` (also for screens without locators)."""
+        root = ET.fromstring(page_source.encode("utf-8"))
+        fingerprint = structure_hash(root)
+        self.learned[fingerprint] = name
+        if name not in self.anchors:
+            self.learned_texts[fingerprint] = {node.get("text") for node in root.iter() if node.get("text")}
+
+    def _match(self, name, exact, values, root) -> tuple[float, float]:
+        """(weight of the screen's anchors on the page, share of its total weight)."""
+        total = matched = 0.0
+        for anchor in self.anchors[name]:
+            mode, attribute, value = anchor
+            weight = self.weights[anchor]
+            total += weight
+            if (attribute, value) in exact if mode == "exact" else any(value in v for v in values[attribute]):
+                matched += weight
+        for path in self.paths[name]:
+            total += STRUCTURE_WEIGHT
+            if root.find(path) is not None:
+                matched += STRUCTURE_WEIGHT
+        return matched, (matched / total if total else 0.0)
+
+    def _confirms(self, name, fingerprint, exact, values, root) -> bool:
+        """
+        Does the page show one of `name`'s anchors? learn()ed screens without any have only their texts
+        to go by, and look-alike dialogs share most of those ("Don't allow"), so all of them must be there.
+        """
+        if name in self.anchors:
+            return self._match(name, exact, values, root)[0] > 0
+        return self.learned_texts.get(fingerprint, set()) <= values["text"]
+
+    def identify(self, page_source: str) -> dict:
+        """
+        Classifies one page source. Returns {"screen": best match or None, "score", "via": "structure" |
+        "anchors", "candidates": [(screen, score), ...] best first, "ms"}.
+        """
+        started = time.perf_counter()
+        root = ET.fromstring(page_source.encode("utf-8"))
+        fingerprint = structure_hash(root)
+        values = {attribute: set() for attribute in ANCHOR_ATTRIBUTES}
+        for node in root.iter():
+            for attribute in ANCHOR_ATTRIBUTES:
+                value = node.get(attribute)
+                if value:
+                    values[attribute].add(value)
+        exact = {(attribute, value) for attribute, found in values.items() for value in found}
+
+        name = self.learned.get(fingerprint)
+        if name is not None and self._confirms(name, fingerprint, exact, values, root):
+            return {"screen": name, "score": 1.0, "via": "structure", "candidates": [],
+                    "ms": round((time.perf_counter() - started) * 1000, 2)}
+
+        scored = []
+        for name in self.anchors:
+            weight, share = self._match(name, exact, values, root)
+            if weight:
+                scored.append((name, weight, round(share, 3)))
+        scored.sort(key=lambda s: (-s[1], -s[2]))
+        best = scored[0] if scored and scored[0][1] >= MIN_WEIGHT else None
+        runner_up = scored[1][1] if len(scored) > 1 else 0.0
+        if best and best[1] >= LEARN_WEIGHT and best[1] >= 2 * runner_up:
+            self.learned[fingerprint] = best[0]
+        return {
+            "screen": best[0] if best else None,
+            "score": best[2] if best else 0.0,
+            "via": "anchors",
+            "candidates": [(name, share) for name, _, share in scored],
+            "ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def current(self, driver) -> dict:
+        return self.identify(driver.page_source)
+
+    def wait_for(self, driver, names=None, timeout: float = 15) -> dict:
+        """
+        Polls the page source until one of `names` (any known screen when None) is on display.
+        One round trip per poll covers every candidate screen, so branching between several
+        possible next screens costs no more than waiting for one. Raises TimeoutError.
+        """
+        deadline = time.time() + timeout
+        while True:
+            result = self.current(driver)
+            if result["screen"] and (names is None or result["screen"] in names):
+                return result
+            if time.time() >= deadline:
+                raise TimeoutError(f"None of {names or self.screens} appeared within {timeout}s (last: {result})")
+            time.sleep(POLL_INTERVAL)
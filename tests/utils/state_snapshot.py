@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import subprocess
+
+# Snapshots live on the host, so one login can be restored on every device (and by later modules)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SNAPSHOT_DIR = os.path.join(PROJECT_ROOT, "state_snapshots")
+
+# App-private folders that hold the session (tokens in shared_prefs, cached user in databases/files)
+STATE_DIRS = ["shared_prefs", "databases", "files"]
+ADB_TIMEOUT = 120
+# Inside the app's data folder: the snapshot is unpacked here first, so a failed restore loses nothing
+STAGING_DIR = ".restore-staging"
+
+
+def _snapshot_paths(package: str, name: str) -> tuple[str, str]:
+    base = os.path.join(SNAPSHOT_DIR, package, name)
+    return base + ".tar", base + ".json"
+
+
+def device_serial(driver) -> str | None:
+    """The udid the Appium session runs on (None when Appium did not report it)."""
+    caps = driver.capabilities or {}
+    # Not deviceName: that is a label ("AndroidDevice"), not an adb serial
+    return caps.get("udid") or caps.get("deviceUDID")
+
+
+def app_package(driver) -> str:
+    caps = driver.capabilities or {}
+    return caps.get("appPackage") or driver.current_package
+
+
+def app_version_code(serial: str, package: str) -> str | None:
+    dump = subprocess.run(
+        ["adb", "-s", serial, "shell", "dumpsys", "package", package],
+        capture_output=True, text=True, timeout=30,
+    ).stdout
+    for token in dump.split():
+        if token.startswith("versionCode="):
+            return token.split("=", 1)[1]
+    return None
+
+
+def has_snapshot(package: str, name: str = "logged_in") -> bool:
+    tar_path, _ = _snapshot_paths(package, name)
+    return os.path.exists(tar_path) and os.path.getsize(tar_path) > 0
+
+
+def snapshot_info(package: str, name: str = "logged_in") -> dict | None:
+    _, meta_path = _snapshot_paths(package, name)
+    try:
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def capture_state(serial: str, package: str, name: str = "logged_in") -> str | None:
+    """
+    Copies the app's data folders into state_snapshots/<package>/<name>.tar.
+    Uses `run-as` (debuggable builds only) streamed through `adb exec-out`, so nothing is written
+    to the device. Stop the app first so SQLite / SharedPreferences are flushed.
+    Returns the tar path, or None if the app is not debuggable or nothing could be read.
+    """
+    tar_path, meta_path = _snapshot_paths(package, name)
+    os.makedirs(os.path.dirname(tar_path), exist_ok=True)
+
+    # Only archive the folders that exist (tar aborts on missing ones on some toybox versions)
+    listing = subprocess.run(
+        ["adb", "-s", serial, "shell", "run-as", package, "ls"],
+        capture_output=True, text=True, timeout=30,
+    )
+    if listing.returncode != 0:
+        print(f"⚠️ Cannot snapshot {package}: run-as failed ({listing.stderr.strip() or listing.stdout.strip()})")
+        return None
+    present = [d for d in STATE_DIRS if d in listing.stdout.split()]
+    if not present:
+        print(f"⚠️ Cannot snapshot {package}: no app data found")
+        return None
+
+    tmp_path = tar_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        result = subprocess.run(
+            ["adb", "-s", serial, "exec-out", "run-as", package, "tar", "-cf", "-", *present],
+            stdout=f, stderr=subprocess.PIPE, timeout=ADB_TIMEOUT,
+        )
+    if result.returncode != 0 or os.path.getsize(tmp_path) == 0:
+        print(f"⚠️ Snapshot of {package} failed: {result.stderr.decode(errors='replace').strip()}")
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, tar_path)
+
+    with open(meta_path, "w") as f:
+        json.dump({
+            "package": package,
+            "version_code": app_version_code(serial, package),
+            "dirs": present,
+            "source_device": serial,
+            "captured_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }, f, indent=2)
+    print(f"📸 Saved '{name}' state of {package} ({os.path.getsize(tar_path) // 1024} KB)")
+    return tar_path
+
+
+def restore_state(serial: str, package: str, name: str = "logged_in") -> bool:
+    """
+    Replaces the app's data folders with a captured snapshot. The app must not be running.
+    Snapshots of another build (version code) are not restored. The snapshot is unpacked into
+    STAGING_DIR first; the current data is only replaced once that succeeded.
+    Returns True on success.
+    """
+    tar_path, _ = _snapshot_paths(package, name)
+    if not has_snapshot(package, name):
+        return False
+    info = snapshot_info(package, name) or {}
+    installed = app_version_code(serial, package)
+    if installed != info.get("version_code"):
+        print(f"⚠️ Not restoring '{name}' state of {package}: captured from version {info.get('version_code')}, "
+              f"installed is {installed}")
+        return False
+
+    dirs = info.get("dirs", STATE_DIRS)
+    subprocess.run(
+        ["adb", "-s", serial, "shell", f"run-as {package} sh -c 'rm -rf {STAGING_DIR} && mkdir {STAGING_DIR}'"],
+        capture_output=True, timeout=30,
+    )
+    with open(tar_path, "rb") as f:
+        result = subprocess.run(
+            ["adb", "-s", serial, "exec-in", "run-as", package, "tar", "-xf", "-", "-C", STAGING_DIR],
+            stdin=f, capture_output=True, timeout=ADB_TIMEOUT,
+        )
+    if result.returncode == 0:
+        swap = " && ".join(f"rm -rf {d} && mv {STAGING_DIR}/{d} {d}" for d in dirs)
+        result = subprocess.run(
+            ["adb", "-s", serial, "shell", f"run-as {package} sh -c '{swap} && rm -rf {STAGING_DIR}'"],
+            capture_output=True, timeout=30,
+        )
+    if result.returncode != 0:
+        subprocess.run(
+            ["adb", "-s", serial, "shell", "run-as", package, "rm", "-rf", STAGING_DIR],
+            capture_output=True, timeout=30,
+        )
+        print(f"⚠️ Restoring '{name}' state of {package} failed: {result.stderr.decode(errors='replace').strip()}")
+        return False
+    print(f"♻️ Restored '{name}' state of {package} (captured {info.get('captured_at', '?')})")
+    return True
+
+
+def save_driver_state(driver, name: str = "logged_in") -> str | None:
+    """Stops the app under `driver`, snapshots its data and brings it back to the foreground."""
+    serial, package = device_serial(driver), app_package(driver)
+    if not serial:
+        return None
+    driver.terminate_app(package)
+    try:
+        return capture_state(serial, package, name)
+    finally:
+        driver.activate_app(package)
+
+
+def restore_driver_state(driver, name: str = "logged_in") -> bool:
+    """Restores a snapshot into the app under `driver` and relaunches it. False if there is none."""
+    serial, package = device_serial(driver), app_package(driver)
+    if not serial or not has_snapshot(package, name):
+        return False
+    driver.terminate_app(package)
+    restored = restore_state(serial, package, name)
+    driver.activate_app(package)
+    return restored
@@ -2,6 +2,7 @@ import logging
 import allure
 import time
 from functools import wraps
+from utils.instrumentation import span
 
 class TestLogger:
     def __init__(self, name=__name__):
@@ -24,7 +25,8 @@ class TestLogger:
                 start_time = time.time()
                 
                 try:
-                    result = func(*args, **kwargs)
+                    with span("step", step_name):
+                        result = func(*args, **kwargs)
                     duration = time.time() - start_time
                     self.logger.info(f"END STEP: {step_name} (Duration: {duration:.2f}s)")
                     return result
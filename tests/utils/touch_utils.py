@@ -1,12 +1,10 @@
 import allure
-# --- NEW IMPORTS for the modern W3C Actions API ---
-from selenium.webdriver.common.actions.action_builder import ActionBuilder
+from utils.gestures import tap
 
 def tap_at_coordinates(driver, x, y):
     """
     Performs a tap action at the specified x and y coordinates on the screen.
-    This function uses the W3C Actions API, which is compatible with the latest
-    Appium Python Client (v3+).
+    Uses `mobile: clickGesture`, falling back to a single W3C tap action (see gestures.py).
 
     Args:
         driver: The Appium driver instance.
@@ -15,25 +13,7 @@ def tap_at_coordinates(driver, x, y):
     """
     try:
         print(f"Attempting to tap at coordinates: (x={x}, y={y})")
-        
-        # 1. Create an ActionBuilder object, which is the entry point for all actions.
-        actions = ActionBuilder(driver)
-        
-        # 2. Get a reference to the 'pointer' (i.e., your finger on the screen).
-        finger = actions.pointer_action
-        
-        # 3. Define the sequence of actions for a tap:
-        #    - Move the pointer to the target coordinates.
-        #    - Press the pointer down (touch the screen).
-        #    - Pause briefly to ensure the tap registers reliably.
-        #    - Lift the pointer up (release the touch).
-        finger.move_to_location(x, y)
-        finger.pointer_down()
-        finger.pause(0.1)
-        finger.pointer_up()
-        
-        # 4. Execute the entire sequence of actions.
-        actions.perform()
+        tap(driver, x, y)
         
         print(f"Successfully tapped at (x={x}, y={y}).")
         allure.attach(f"Tapped at coordinates (x={x}, y={y})", name="Coordinate Tap", attachment_type=allure.attachment_type.TEXT)
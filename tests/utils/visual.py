@@ -0,0 +1,196 @@
+# visual.py
+# Visual checkpoints: the first capture of a screen (per device resolution and name) becomes its
+# baseline, later captures are compared with it. Cheap enough to call at every step:
+# 1. masks blank out dynamic regions (status bar, clocks, OTP timers, carousels) in both images
+# 2. dHash of the whole screen: far apart means another screen altogether, no further work
+# 3. one vectorised absdiff, reduced per TILE x TILE tile: tiles under the noise floor are unchanged
+# 4. SSIM only on the changed tiles, all of them in one batch
+# Mismatches attach baseline | actual | diff to the Allure report (and so to allure-results).
+import os
+import re
+import json
+import time
+import cv2
+import numpy as np
+import allure
+from utils.instrumentation import timed
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASELINE_DIR = os.getenv("VISUAL_BASELINE_DIR", os.path.join(PROJECT_ROOT, "visual_baselines"))
+# Overwrite baselines with the current captures instead of comparing (after an intended UI change)
+UPDATE_BASELINES = os.getenv("VISUAL_UPDATE", "0") == "1"
+
+TILE = 32
+# Gray-level difference a pixel may have without its tile counting as changed (anti-aliasing, scaling)
+NOISE = 16
+# A changed tile fails below this SSIM
+SSIM_THRESHOLD = 0.95
+# dHash bits (of 64) apart from which the capture is a different screen, not a changed one
+SCREEN_DISTANCE = 24
+# Top of the screen masked by default: the Android status bar (clock, battery, notifications)
+STATUS_BAR_FRACTION = 0.04
+
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def decode_png(png: bytes) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def dhash(gray: np.ndarray) -> int:
+    """64-bit difference hash: is each pixel of a 9x8 thumbnail brighter than its right neighbour."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _rect(mask) -> tuple[int, int, int, int]:
+    """(x, y, w, h) of a mask: a tuple, a {"x", "y", "width", "height"} dict or a WebElement."""
+    if hasattr(mask, "rect"):
+        mask = mask.rect
+    if isinstance(mask, dict):
+        return int(mask["x"]), int(mask["y"]), int(mask["width"]), int(mask["height"])
+    x, y, w, h = mask
+    return int(x), int(y), int(w), int(h)
+
+
+def mask_rects(shape, masks=(), status_bar: bool = True) -> list[tuple[int, int, int, int]]:
+    """
+    (x, y, w, h) of every mask clamped to the image, empty ones dropped: an element partly off-screen
+    has a negative x / y, which as a slice start would count from the far edge.
+    """
+    height, width = shape[:2]
+    rects = []
+    for x, y, w, h in map(_rect, masks):
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, width), min(y + h, height)
+        if x1 > x0 and y1 > y0:
+            rects.append((x0, y0, x1 - x0, y1 - y0))
+    if status_bar:
+        rects.append((0, 0, width, int(height * STATUS_BAR_FRACTION)))
+    return rects
+
+
+def _tiles(gray: np.ndarray, tile: int) -> np.ndarray:
+    """(rows, cols, tile, tile) view of a gray image, zero-padded to whole tiles."""
+    h, w = gray.shape
+    padded = np.pad(gray, ((0, -h % tile), (0, -w % tile)))
+    rows, cols = padded.shape[0] // tile, padded.shape[1] // tile
+    return padded.reshape(rows, tile, cols, tile).swapaxes(1, 2)
+
+
+def tile_ssim(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """SSIM of each pair of tiles in two (n, tile, tile) stacks, computed for all n at once."""
+    a = a.astype(np.float64).reshape(len(a), -1)
+    b = b.astype(np.float64).reshape(len(b), -1)
+    mu_a, mu_b = a.mean(axis=1), b.mean(axis=1)
+    var_a, var_b = a.var(axis=1), b.var(axis=1)
+    cov = ((a - mu_a[:, None]) * (b - mu_b[:, None])).mean(axis=1)
+    return ((2 * mu_a * mu_b + _C1) * (2 * cov + _C2)) / ((mu_a ** 2 + mu_b ** 2 + _C1) * (var_a + var_b + _C2))
+
+
+def compare(
+    baseline: np.ndarray,
+    actual: np.ndarray,
+    masks=(),
+    threshold: float = SSIM_THRESHOLD,
+    tile: int = TILE,
+    status_bar: bool = True,
+) -> dict:
+    """
+    Compares two BGR screenshots of the same size. Returns the verdict ("passed" / "failed"),
+    why it failed, the dHash distance, tile counts, the lowest SSIM and the failed tiles as
+    [x, y, w, h] boxes.
+    """
+    if baseline.shape != actual.shape:
+        return {
+            "status": "failed",
+            "reason": f"size {actual.shape[1]}x{actual.shape[0]} != baseline {baseline.shape[1]}x{baseline.shape[0]}",
+            "boxes": [],
+        }
+    expected = cv2.cvtColor(baseline, cv2.COLOR_BGR2GRAY)
+    gray = cv2.cvtColor(actual, cv2.COLOR_BGR2GRAY)
+    for x, y, w, h in mask_rects(gray.shape, masks, status_bar):
+        expected[y:y + h, x:x + w] = 0
+        gray[y:y + h, x:x + w] = 0
+
+    distance = bin(dhash(expected) ^ dhash(gray)).count("1")
+    result = {"status": "passed", "reason": None, "distance": distance, "boxes": []}
+    if distance > SCREEN_DISTANCE:
+        height, width = gray.shape
+        return {**result, "status": "failed", "reason": f"different screen (dHash distance {distance}/64)",
+                "boxes": [[0, 0, width, height]]}
+
+    tiles_expected, tiles_actual = _tiles(expected, tile), _tiles(gray, tile)
+    changed = np.argwhere(_tiles(cv2.absdiff(expected, gray), tile).max(axis=(2, 3)) > NOISE)
+    result.update(tiles=int(tiles_actual.shape[0] * tiles_actual.shape[1]), changed_tiles=len(changed))
+    if not len(changed):
+        return {**result, "min_ssim": 1.0, "failed_tiles": 0}
+
+    rows, cols = changed[:, 0], changed[:, 1]
+    scores = tile_ssim(tiles_expected[rows, cols], tiles_actual[rows, cols])
+    failed = changed[scores < threshold]
+    result.update(
+        min_ssim=round(float(scores.min()), 4),
+        failed_tiles=len(failed),
+        boxes=[[int(c) * tile, int(r) * tile, tile, tile] for r, c in failed],
+    )
+    if len(failed):
+        result.update(status="failed", reason=f"{len(failed)} tile(s) below SSIM {threshold}")
+    return result
+
+
+def diff_image(baseline: np.ndarray, actual: np.ndarray, result: dict) -> bytes:
+    """PNG of baseline | actual | actual with the failed regions outlined over the pixel difference."""
+    if baseline.shape != actual.shape:
+        height = max(baseline.shape[0], actual.shape[0])
+        pad = lambda img: cv2.copyMakeBorder(img, 0, height - img.shape[0], 0, 0, cv2.BORDER_CONSTANT)
+        return cv2.imencode(".png", np.hstack([pad(baseline), pad(actual)]))[1].tobytes()
+    heat = cv2.applyColorMap(cv2.cvtColor(cv2.absdiff(baseline, actual), cv2.COLOR_BGR2GRAY), cv2.COLORMAP_JET)
+    overlay = cv2.addWeighted(actual, 0.6, heat, 0.4, 0)
+    for x, y, w, h in result["boxes"]:
+        cv2.rectangle(overlay, (x, y), (x + w - 1, y + h - 1), (0, 0, 255), 2)
+    return cv2.imencode(".png", np.hstack([baseline, actual, overlay]))[1].tobytes()
+
+
+def baseline_path(name: str, shape) -> str:
+    """visual_baselines/<width>x<height>/<name>.png: every device resolution has its own baselines."""
+    safe = re.sub(r"[^\w.-]+", "_", name)
+    return os.path.join(BASELINE_DIR, f"{shape[1]}x{shape[0]}", f"{safe}.png")
+
+
+@timed("visual")
+def checkpoint(
+    driver,
+    name: str,
+    masks=(),
+    threshold: float = SSIM_THRESHOLD,
+    fail: bool = True,
+    update: bool = UPDATE_BASELINES,
+) -> dict:
+    """
+    Compares the current screen with the baseline `name` for this resolution (recording it the first
+    time, or always with `update`). `masks` are regions to ignore: (x, y, w, h) tuples, element rects
+    or WebElements. Raises AssertionError on a mismatch unless `fail` is False.
+    """
+    started = time.perf_counter()
+    actual = decode_png(driver.get_screenshot_as_png())
+    path = baseline_path(name, actual.shape)
+
+    if update or not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cv2.imwrite(path, actual)
+        allure.attach.file(path, name=f"Visual baseline: {name}", attachment_type=allure.attachment_type.PNG)
+        return {"name": name, "status": "new", "baseline": path}
+
+    baseline = cv2.imread(path, cv2.IMREAD_COLOR)
+    result = compare(baseline, actual, masks, threshold)
+    result.update(name=name, baseline=path, ms=round((time.perf_counter() - started) * 1000, 1))
+    if result["status"] == "failed":
+        allure.attach(diff_image(baseline, actual, result), name=f"Visual diff: {name}",
+                      attachment_type=allure.attachment_type.PNG)
+        allure.attach(json.dumps(result, indent=2), name=f"Visual result: {name}",
+                      attachment_type=allure.attachment_type.JSON)
+        if fail:
+            raise AssertionError(f"Visual checkpoint '{name}' differs from its baseline: {result['reason']}")
+    return result
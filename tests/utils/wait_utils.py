@@ -5,14 +5,30 @@ from appium.webdriver.common.appiumby import AppiumBy
 from utils.ocr_utils import click_element_by_ocr_text
 from selenium.common.exceptions import NoSuchElementException
 from appium.webdriver.common.appiumby import AppiumBy
+import re
 import allure
-# --- NEW IMPORTS for the modern W3C Actions API ---
-from selenium.webdriver.common.actions.action_builder import ActionBuilder
+from utils.gestures import tap, scroll
+from utils import healing
+from utils import flow_recorder
+
+# Device-side scroll searches vs. Python swipe loops (see scroll_into_view / scroll_stats)
+SCROLL_STATS = {
+    "native_found": 0,      # found by one UiScrollable call
+    "native_round_trips": 0,
+    "fallbacks": 0,         # Python find -> swipe loops that had to run
+    "fallback_round_trips": 0,
+}
+# Round trips of a Python search that needed one swipe (find miss + swipe + find), used until a fallback was measured
+_LOOP_COST_GUESS = 3
+
+_XPATH_ATTR_RE = re.compile(
+    r"""(?:contains\(\s*@(text|content-desc|resource-id)\s*,|@(text|content-desc|resource-id)\s*=)\s*(["'])(.*?)\3"""
+)
 
 def find_and_click(driver, by, value, fallback_text=None, timeout=20):
     """
     Tries to find and click an element by its primary locator.
-    If that fails and a fallback_text is provided, it tries to click by text.
+    If that fails, it tries to heal the locator (see healing.py), then to click by fallback_text.
 
     Args:
         driver: The Appium driver instance.
@@ -24,19 +40,39 @@ def find_and_click(driver, by, value, fallback_text=None, timeout=20):
     Returns:
         True if the element was clicked successfully, False otherwise.
     """
+    # A locator healed earlier in this run is used straight away instead of timing out again
+    original = (by, value)
+    by, value = healing.healed(by, value) or original
     try:
         # 1. Try to click using the primary locator (e.g., XPath)
         print(f"Attempting to click element with locator: {by}='{value}'")
         element = WebDriverWait(driver, timeout).until(
             EC.element_to_be_clickable((by, value))
         )
+        healing.record(driver, by, value, element)
+        flow_recorder.record(driver, "click", by, value, element)
         element.click()
         print("Click successful using primary locator.")
         return True
     except TimeoutException:
+        # 2. Look for the element the locator used to match, from its recorded attributes
+        try:
+            element = healing.heal(driver, *original)
+        except Exception as e:
+            print(f"Healing failed: {e}")
+            element = None
+        if element is not None:
+            try:
+                flow_recorder.record(driver, "click", *original, element)
+                element.click()
+                print("Click successful using healed locator.")
+                return True
+            except Exception as e:
+                # Stale or intercepted: the healed element is no better than none
+                print(f"Click on healed element failed: {e}")
         print(f"Primary locator failed. Trying fallback text: '{fallback_text}'")
         
-        # 2. If primary locator fails, try the fallback text
+        # 3. If nothing could be healed, try the fallback text
         if fallback_text:
             try:
                 # Construct a generic XPath to find any element containing the text
@@ -46,6 +82,7 @@ def find_and_click(driver, by, value, fallback_text=None, timeout=20):
                 element = WebDriverWait(driver, 5).until(
                     EC.element_to_be_clickable((AppiumBy.XPATH, fallback_xpath))
                 )
+                flow_recorder.record(driver, "click", AppiumBy.XPATH, fallback_xpath, element)
                 element.click()
                 print("Click successful using fallback text.")
                 return True
@@ -84,12 +121,112 @@ def smart_find_element(driver, name, xpath, fallback_text=None, screenshot_path=
 
         return None, False
     
+def _java_string(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def uiselector_from_xpath(xpath):
+    """
+    Translates simple XPaths (one @text / @content-desc / @resource-id condition, exact or contains())
+    into a UiSelector. Returns None for anything else (index paths, several conditions, ...).
+    """
+    matches = _XPATH_ATTR_RE.findall(xpath or "")
+    if len(matches) != 1:
+        return None
+    contains_attr, equals_attr, _, value = matches[0]
+    attr = contains_attr or equals_attr
+    method = {
+        "text": "textContains" if contains_attr else "text",
+        "content-desc": "descriptionContains" if contains_attr else "description",
+        "resource-id": "resourceIdMatches" if contains_attr else "resourceId",
+    }[attr]
+    if method == "resourceIdMatches":
+        value = f".*{re.escape(value)}.*"
+    return f"new UiSelector().{method}({_java_string(value)})"
+
+def scroll_into_view(driver, text=None, xpath=None, selector=None, max_swipes=5):
+    """
+    Finds an element inside the first scrollable container with ONE device-side call
+    (UiScrollable.scrollIntoView): UiAutomator swipes and searches on the device itself.
+
+    Args:
+        text: Visible text or content-desc to look for (substring match).
+        xpath: A simple XPath, translated with uiselector_from_xpath.
+        selector: A ready UiSelector expression.
+        max_swipes: Upper bound of swipes the device performs.
+
+    Returns:
+        The element, or None when it is not there, there is nothing scrollable,
+        or the locator cannot be expressed as a UiSelector (callers then fall back to their loop).
+        scrollIntoView starts from the beginning of the list and a miss leaves it at the end, so a
+        miss scrolls back to the beginning: the next selector and the callers' forward-only swipe
+        loops search the whole list again.
+    """
+    if selector is None and text is not None:
+        # UiSelector has no OR: text first, then content-desc
+        return (scroll_into_view(driver, selector=f"new UiSelector().textContains({_java_string(text)})", max_swipes=max_swipes)
+                or scroll_into_view(driver, selector=f"new UiSelector().descriptionContains({_java_string(text)})", max_swipes=max_swipes))
+    if selector is None:
+        selector = uiselector_from_xpath(xpath)
+    if selector is None:
+        return None
+
+    SCROLL_STATS["native_round_trips"] += 1
+    try:
+        element = driver.find_element(
+            AppiumBy.ANDROID_UIAUTOMATOR,
+            "new UiScrollable(new UiSelector().scrollable(true).instance(0))"
+            f".setMaxSearchSwipes({int(max_swipes)}).scrollIntoView({selector})",
+        )
+    except Exception:
+        scroll_to_beginning(driver, max_swipes)
+        return None
+    SCROLL_STATS["native_found"] += 1
+    return element
+
+def scroll_to_beginning(driver, max_swipes=5):
+    """
+    Flings the first scrollable container back to its start, on the device. UiScrollable returns
+    a boolean here, not an element, so the find itself always "fails" once the fling is done.
+    """
+    SCROLL_STATS["native_round_trips"] += 1
+    try:
+        driver.find_element(
+            AppiumBy.ANDROID_UIAUTOMATOR,
+            f"new UiScrollable(new UiSelector().scrollable(true).instance(0)).flingToBeginning({int(max_swipes)})",
+        )
+    except Exception:
+        pass
+
+def count_fallback(round_trips):
+    """Records one successful Python search loop and the round trips it took (misses would skew the average)."""
+    SCROLL_STATS["fallbacks"] += 1
+    SCROLL_STATS["fallback_round_trips"] += round_trips
+
+def scroll_stats():
+    """
+    SCROLL_STATS plus `round_trips_saved`: every native hit is priced at the average
+    cost of the measured Python loops (or _LOOP_COST_GUESS before any ran).
+    """
+    stats = dict(SCROLL_STATS)
+    loop_cost = stats["fallback_round_trips"] / stats["fallbacks"] if stats["fallbacks"] else _LOOP_COST_GUESS
+    stats["round_trips_saved"] = max(0, round(stats["native_found"] * loop_cost - stats["native_round_trips"]))
+    return stats
+
 def scroll_and_click_by_text_robust(driver, text_to_find, max_swipes=5):
     """
     Scrolls down to find an element with specific text, then attempts to click it.
     If the element itself isn't clickable, it tries to click its clickable parent.
+    Searches on the device first (scroll_into_view); the swipe loop is the fallback.
     """
+    element = scroll_into_view(driver, text=text_to_find, max_swipes=max_swipes)
+    if element is not None and element.get_attribute('clickable') == 'true':
+        element.click()
+        return True
+
+    at_end = False
+    round_trips = 0
     for _ in range(max_swipes):
+        round_trips += 1
         try:
             # First, find the element by its text
             element_xpath = f"//*[contains(@text, '{text_to_find}')]"
@@ -100,6 +237,7 @@ def scroll_and_click_by_text_robust(driver, text_to_find, max_swipes=5):
             if text_element.get_attribute('clickable') == 'true':
                 print(f"Text element '{text_to_find}' is directly clickable. Clicking it.")
                 text_element.click()
+                count_fallback(round_trips)
                 return True
             else:
                 print(f"Element with text '{text_to_find}' is not clickable. Searching for a clickable parent...")
@@ -109,16 +247,16 @@ def scroll_and_click_by_text_robust(driver, text_to_find, max_swipes=5):
                 
                 print("Found a clickable parent. Clicking it.")
                 clickable_parent.click()
+                count_fallback(round_trips)
                 return True
 
         except NoSuchElementException:
             # If the element isn't on screen, scroll down
+            if at_end:
+                break  # Searched the last page of the list already
             print(f"'{text_to_find}' not found, scrolling...")
-            size = driver.get_window_size()
-            start_x = size['width'] / 2
-            start_y = size['height'] * 0.8
-            end_y = size['height'] * 0.2
-            driver.swipe(start_x, start_y, start_x, end_y, 400)
+            at_end = not scroll(driver, "down")
+            round_trips += 1
 
     print(f"Failed to find or click '{text_to_find}' after {max_swipes} swipes.")
     return False
@@ -127,7 +265,7 @@ def scroll_and_tap_by_text(driver, text_to_find, max_swipes=5):
     """
     Scrolls down to find an element by its text and performs a coordinate-based tap
     on its center. This version uses the W3C Actions API, making it compatible with
-    the latest Appium Python Client and robust for parallel testing.
+    the latest Appium Python Client and robust for parallel testing (see gestures.py).
 
     Args:
         driver: The Appium driver instance.
@@ -137,11 +275,17 @@ def scroll_and_tap_by_text(driver, text_to_find, max_swipes=5):
     Returns:
         True if the element was found and tapped, False otherwise.
     """
+    at_end = False
+    round_trips = 0
     for i in range(max_swipes):
         try:
-            # 1. Use the universal XPath to find the element (this part is correct)
-            universal_xpath = f"//*[contains(@text, '{text_to_find}') or contains(@content-desc, '{text_to_find}')]"
-            element = driver.find_element(AppiumBy.XPATH, universal_xpath)
+            # 1. One device-side scroll search first; the swipe loop below is the fallback
+            element = scroll_into_view(driver, text=text_to_find, max_swipes=max_swipes) if i == 0 else None
+            if element is None:
+                universal_xpath = f"//*[contains(@text, '{text_to_find}') or contains(@content-desc, '{text_to_find}')]"
+                round_trips += 1
+                element = driver.find_element(AppiumBy.XPATH, universal_xpath)
+                count_fallback(round_trips)
             
             # 2. Dynamically get the element's location (this part is correct)
             location = element.location
@@ -153,38 +297,21 @@ def scroll_and_tap_by_text(driver, text_to_find, max_swipes=5):
             allure.attach(f"Tapping '{text_to_find}' on {driver.capabilities.get('deviceName')} at ({center_x}, {center_y})", 
                           name="Dynamic Coordinate Tap", attachment_type=allure.attachment_type.TEXT)
             
-            # --- REPLACEMENT for TouchAction ---
-            # 3. Perform the raw tap action using W3C Actions
-            actions = ActionBuilder(driver)
-            finger = actions.pointer_action
-            finger.move_to_location(center_x, center_y)
-            finger.pointer_down()
-            finger.pause(0.1) # A brief pause improves tap reliability
-            finger.pointer_up()
-            actions.perform()
-            # --- END REPLACEMENT ---
+            # 3. Tap its center
+            tap(driver, center_x, center_y)
             
             return True
             
         except NoSuchElementException:
             # 4. If not found, scroll down and try again
+            if at_end:
+                print(f"Reached the end of the list without finding '{text_to_find}'.")
+                return False
             if i < max_swipes - 1:
                 print(f"'{text_to_find}' not found, scrolling down...")
-                screen_size = driver.get_window_size()
-                start_x = screen_size['width'] / 2
-                start_y = screen_size['height'] * 0.8
-                end_y = screen_size['height'] * 0.2
-                
-                # --- REPLACEMENT for driver.swipe() ---
-                # 5. Perform the swipe using W3C Actions
-                actions = ActionBuilder(driver)
-                finger = actions.pointer_action
-                finger.move_to_location(start_x, start_y)
-                finger.pointer_down()
-                finger.move_to_location(start_x, end_y)
-                finger.pointer_up()
-                actions.perform()
-                # --- END REPLACEMENT ---
+                # 5. One scroll gesture; it returns once the list settled
+                at_end = not scroll(driver, "down")
+                round_trips += 1
                 
             else:
                 # This is the last swipe attempt, and it still wasn't found.